@@ -0,0 +1,230 @@
+"""
+API JSON du catalogue (/api/...) pour le rendu côté client : seule la grille
+est rechargée au changement de page ou de genre, sans la sidebar.
+
+Les données viennent des mêmes caches que les pages HTML (scraper, sections).
+Les listes sont paginées par curseur opaque (`cursor` / `next_cursor`) et
+chaque réponse porte un ETag (304 si le client a déjà cette version).
+
+Variables d'environnement :
+  API_PAGE_SIZE   produits par réponse par défaut (48, max API_MAX_PAGE_SIZE)
+  API_MAX_AGE     cache navigateur des réponses en secondes (60)
+"""
+import os
+import json
+import base64
+import hashlib
+import logging
+
+from flask import Blueprint, Response, request, url_for
+
+import image_proxy
+import prefetch
+import scraper
+import stale_cache
+from models import Product
+
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "48"))
+API_MAX_PAGE_SIZE = 120
+API_MAX_AGE = int(os.getenv("API_MAX_AGE", "60"))
+SEARCH_MAX_PAGES = 2
+
+bp = Blueprint("api", __name__, url_prefix="/api")
+log = logging.getLogger(__name__)
+
+
+class BadRequest(ValueError):
+    """Paramètre invalide (réponse 400)"""
+
+
+# ----------------- CURSEURS -----------------
+def encode_cursor(page=1, offset=0):
+    """Curseur opaque : page amont + position dans cette page"""
+    raw = json.dumps([page, offset], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 1, 0
+    try:
+        page, offset = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        page, offset = int(page), int(offset)
+    except (ValueError, TypeError):
+        raise BadRequest("cursor invalide")
+    if page < 1 or offset < 0:
+        raise BadRequest("cursor invalide")
+    return page, offset
+
+
+def _limit():
+    try:
+        limit = int(request.args.get("limit", API_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("limit invalide")
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+
+# ----------------- SÉRIALISATION -----------------
+def _image(url):
+    """Image proxifiée (vignette) comme dans les templates"""
+    if url and image_proxy.is_proxyable(url):
+        return url_for("shop.proxied_image", u=url, v="card")
+    return url
+
+
+def product_item(product):
+    """Produit compact : champs vides omis"""
+    item = {
+        "name": product.name,
+        "path": product.path,
+        "image": _image(product.image),
+        "price": product.new_price,
+        "price_cents": product.price_cents,
+        "old_price": product.old_price,
+        "economy": product.economy,
+    }
+    return {key: value for key, value in item.items() if value}
+
+
+def _jsonable(value):
+    if isinstance(value, Product):
+        return product_item(value)
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def _json_response(data, status=200):
+    """JSON compact avec ETag ; 304 si If-None-Match correspond"""
+    body = json.dumps(_jsonable(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    response = Response(body, status=status, mimetype="application/json")
+    if status != 200:
+        return response
+    response.set_etag(hashlib.sha1(body).hexdigest())
+    if stale_cache.data_freshness() == "fresh":
+        response.cache_control.public = True
+        response.cache_control.max_age = API_MAX_AGE
+    else:
+        # Données de secours : le client revalide à chaque fois
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _error(message, status):
+    return _json_response({"error": message}, status)
+
+
+# ----------------- ENDPOINTS -----------------
+@bp.errorhandler(BadRequest)
+def _bad_request(e):
+    return _error(str(e), 400)
+
+
+@bp.route("/category")
+def category():
+    """Produits d'une catégorie, à partir du curseur"""
+    path = request.args.get("path", "").strip()
+    if not path:
+        raise BadRequest("path manquant")
+    page, offset = decode_cursor(request.args.get("cursor"))
+    limit = _limit()
+
+    products, paging = scraper.get_category_products(path, page)
+    prefetch.next_listing_page(path, paging)
+    items = products[offset:offset + limit]
+    end = offset + len(items)
+    if end < len(products):
+        next_cursor = encode_cursor(page, end)
+    elif paging.get("has_next"):
+        next_cursor = encode_cursor(page + 1, 0)
+    else:
+        next_cursor = None
+    if offset:
+        prev_cursor = encode_cursor(page, max(0, offset - limit))
+    elif page > 1:
+        prev_cursor = encode_cursor(page - 1, 0)
+    else:
+        prev_cursor = None
+
+    return _json_response({
+        "path": path,
+        "items": items,
+        "page": {"current": page, "total": paging.get("total") or page},
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    })
+
+
+@bp.route("/product")
+def product():
+    path = request.args.get("path", "").strip()
+    if not path:
+        raise BadRequest("path manquant")
+    details = scraper.get_product_details(path)
+    if not details:
+        return _error("produit indisponible", 404)
+    prefetch.related_products(details.get("related"))
+    details = dict(details)
+    details.pop("url", None)
+    if details.get("main_img"):
+        details["main_img"] = _image(details["main_img"])
+    return _json_response(details)
+
+
+def _search(query):
+    """Résultats d'une recherche sur les listings par genre (mêmes règles que /search)"""
+    query_lower = query.lower()
+    terms = [term for term in query_lower.split() if len(term) > 2]
+    seen, results = set(), []
+    pages = sorted(scraper.iter_listing_pages(scraper.GENDER_PATHS.values(), max_pages=SEARCH_MAX_PAGES),
+                   key=lambda entry: (entry[1], list(scraper.GENDER_PATHS.values()).index(entry[0])))
+    # Ordre stable (indépendant de l'ordre d'arrivée) : les curseurs restent valables
+    for _path, _page, products, _paging in pages:
+        for product in products:
+            name = (product.get("name") or "").lower()
+            if (query_lower in name or any(term in name for term in terms)) and product.name not in seen:
+                seen.add(product.name)
+                results.append(product)
+    return results
+
+
+@bp.route("/search")
+def search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        raise BadRequest("q manquant")
+    _page, offset = decode_cursor(request.args.get("cursor"))
+    limit = _limit()
+    results = _search(query)
+    items = results[offset:offset + limit]
+    end = offset + len(items)
+    return _json_response({
+        "query": query,
+        "count": len(results),
+        "items": items,
+        "next_cursor": encode_cursor(1, end) if end < len(results) else None,
+        "prev_cursor": encode_cursor(1, max(0, offset - limit)) if offset else None,
+    })
+
+
+@bp.route("/sections")
+def sections():
+    """Produits mis en avant par genre (?gender=homme pour un seul)"""
+    from app_supabase import get_gender_sections
+
+    all_sections = get_gender_sections()
+    gender = request.args.get("gender", "all")
+    if gender != "all":
+        if gender not in all_sections:
+            raise BadRequest("gender inconnu")
+        all_sections = {gender: all_sections[gender]}
+    return _json_response({"sections": all_sections})
+
+
+def init_app(app):
+    app.register_blueprint(bp)
+    # Curseur de la page N d'une catégorie, pour les liens de pagination des templates
+    app.add_template_global(encode_cursor, "api_cursor")
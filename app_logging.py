@@ -0,0 +1,253 @@
+"""
+Journalisation structurée : niveaux, file d'attente non bloquante,
+identifiant de requête et échantillonnage des messages répétitifs.
+
+Les modules écrivent via `logging.getLogger(__name__)` ; l'écriture réelle sur
+stdout se fait dans un thread dédié (QueueListener), jamais dans la requête.
+
+Variables d'environnement :
+  LOG_LEVEL          niveau minimal (INFO)
+  LOG_FORMAT         json (défaut) ou text
+  LOG_QUEUE_SIZE     taille de la file ; au-delà les messages sont perdus (10000)
+  LOG_SAMPLE_LIMIT   occurrences d'un même message WARNING ou moins par fenêtre (20)
+  LOG_SAMPLE_WINDOW  durée de la fenêtre d'échantillonnage en secondes (60)
+  LOG_ACCESS         1 : une ligne "access" par requête, via la file (défaut) ; 0 : aucune
+"""
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+import logging.handlers
+from threading import Lock
+from urllib.parse import urlencode
+
+import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_LIMIT = int(os.getenv("LOG_SAMPLE_LIMIT", "20"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+LOG_ACCESS = os.getenv("LOG_ACCESS", "1") != "0"
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Paramètres d'URL jamais écrits en clair (jetons d'administration, session Stripe, ...)
+SENSITIVE_PARAMS = frozenset({"token", "access_token", "refresh_token", "password", "key", "session_id"})
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributs standard d'un LogRecord : tout le reste vient de `extra=` et part dans le JSON
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "sample"}
+
+_state = {"pid": None, "listener": None, "handler": None}
+_state_lock = Lock()
+access_log = logging.getLogger("access")
+
+
+def get_request_id():
+    """Identifiant de la requête en cours (None hors requête)"""
+    return _request_id.get()
+
+
+def loggable_path(request):
+    """Chemin et paramètres de la requête, valeurs sensibles masquées"""
+    if not request.args:
+        return request.path
+    query = [(name, "***" if name.lower() in SENSITIVE_PARAMS else value)
+             for name, value in request.args.items(multi=True)]
+    return f"{request.path}?{urlencode(query, safe='*')}"
+
+
+class RequestIdFilter(logging.Filter):
+    """Ajoute request_id à chaque enregistrement (exécuté dans le thread appelant)"""
+
+    def filter(self, record):
+        # Fourni par l'appelant hors contexte de requête (fin d'une page en flux)
+        if getattr(record, "request_id", None) is None:
+            record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Limite un même message (logger + gabarit) à `limit` occurrences par fenêtre.
+
+    Les erreurs et les messages émis avec `extra={"sample": False}` passent
+    toujours ; le nombre de messages supprimés est reporté
+    sur la première occurrence de la fenêtre suivante.
+    """
+
+    def __init__(self, limit=LOG_SAMPLE_LIMIT, window=LOG_SAMPLE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._seen = {}
+        self._lock = Lock()
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.ERROR or not getattr(record, "sample", True):
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else repr(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started, count, dropped = self._seen.get(key, (now, 0, 0))
+            if now - started > self.window:
+                if dropped:
+                    record.sampled_out = dropped
+                started, count, dropped = now, 0, 0
+            count += 1
+            if count > self.limit:
+                self._seen[key] = (started, count, dropped + 1)
+                metrics.inc("log_messages_dropped_total", reason="sampled")
+                return False
+            self._seen[key] = (started, count, dropped)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par message"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Format lisible pour le développement local"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui ne bloque jamais : file pleine = message perdu et compté"""
+
+    def prepare(self, record):
+        # Message et traceback résolus ici (les arguments peuvent changer après
+        # coup) ; la mise en forme JSON / texte reste dans le thread d'écriture.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_messages_dropped_total", reason="queue_full")
+
+
+def _formatter():
+    return TextFormatter() if LOG_FORMAT == "text" else JsonFormatter()
+
+
+def _stop():
+    listener = _state["listener"]
+    if listener is not None and _state["pid"] == os.getpid():
+        try:
+            listener.stop()
+        except Exception:
+            pass
+
+
+def configure_logging():
+    """Installe (ou réinstalle après un fork) la file de journalisation du processus.
+
+    Idempotent dans un même processus ; après un fork gunicorn, le thread
+    d'écriture du maître n'existe pas dans le worker et est relancé.
+    """
+    with _state_lock:
+        if _state["pid"] == os.getpid():
+            return
+        root = logging.getLogger()
+        if _state["handler"] is not None:
+            root.removeHandler(_state["handler"])
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(_formatter())
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = _QueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(SamplingFilter())
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        listener.start()
+
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        _state.update(pid=os.getpid(), listener=listener, handler=handler)
+
+
+atexit.register(_stop)
+metrics.describe("log_messages_dropped_total", "Messages de log non écrits (échantillonnage, file pleine)")
+
+
+def init_app(app):
+    """Identifiant de requête : repris du header X-Request-ID ou généré, renvoyé dans la réponse"""
+    from flask import request, g
+
+    configure_logging()
+
+    @app.before_request
+    def _bind_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, "")
+        request_id = incoming[:64] if incoming.isprintable() and incoming else uuid.uuid4().hex[:16]
+        g._request_id_token = _request_id.set(request_id)
+        g._log_started = time.perf_counter()
+        g.request_id = request_id
+
+    @app.after_request
+    def _send_request_id(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        started = g.pop("_log_started", None)
+        if LOG_ACCESS and started is not None:
+            method, path, status = request.method, loggable_path(request), response.status_code
+
+            def write():
+                # Un seul gabarit pour toutes les requêtes : exclu de l'échantillonnage
+                access_log.info("%s %s %s", method, path, status,
+                                extra={"status": status, "request_id": request_id,
+                                       "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                                       "sample": False})
+
+            if response.is_streamed:
+                # Page en flux : durée comptée jusqu'à la fin de l'envoi
+                response.call_on_close(write)
+            else:
+                write()
+        return response
+
+    @app.teardown_request
+    def _unbind_request_id(exc):
+        token = g.pop("_request_id_token", None)
+        if token is not None:
+            _request_id.reset(token)
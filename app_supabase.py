@@ -4,25 +4,28 @@ Version corrigée - toutes les fonctionnalités préservées
 """
 import os
 import json
-import stripe
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from threading import Thread
+import time
+import uuid
+import logging
+from threading import Thread, Lock
 from datetime import datetime
 from urllib.parse import quote_plus, unquote_plus
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
 from dotenv import load_dotenv
 
-# Configuration
+# Configuration : .env chargé une seule fois, avant les modules qui lisent l'environnement
 load_dotenv()
-app = Flask(__name__)
-app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key")
+
+from flask import Flask, Blueprint, Response, render_template, stream_template, request, redirect, url_for, session, jsonify, flash, has_request_context, send_file
+from markupsafe import Markup
+from jinja2 import FileSystemBytecodeCache
+
+bp = Blueprint("shop", __name__)
+log = logging.getLogger(__name__)
 
 # Constantes globales
 CONFIG = {
-    'STRIPE_SECRET_KEY': os.getenv("STRIPE_SECRET_KEY"),
+    # Clé secrète et API Stripe : voir stripe_gateway.py
     'STRIPE_WEBHOOK_SECRET': os.getenv("STRIPE_WEBHOOK_SECRET"),
     'APP_BASE_URL': os.getenv("BASE_URL", "http://127.0.0.1:5000"),
     'SMTP_SERVER': os.getenv("SMTP_SERVER", "smtp.gmail.com"),
@@ -30,35 +33,77 @@ CONFIG = {
     'SMTP_USER': os.getenv("SMTP_USER"),
     'SMTP_PASS': os.getenv("SMTP_PASS"),
     'SUPPLIER_EMAIL': os.getenv("SUPPLIER_EMAIL"),
-    'COMMISSION_RATE': float(os.getenv("COMMISSION_RATE", 0.15)),
-    'PRICE_MULTIPLIER': float(os.getenv("PRICE_MULTIPLIER", "2.0"))
 }
 
-stripe.api_key = CONFIG['STRIPE_SECRET_KEY']
-
-# Import CORRECT du scraper et Supabase
-from supabase_client import supabase, register_user, login_user, get_user_client, verify_token
-from scraper import get_categories, get_category_products, get_product_details, reload_overrides, safe_get
-import scraper as scraper_module
-
-print(f"🔧 Configuration chargée - Multiplicateur: {CONFIG['PRICE_MULTIPLIER']}x")
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jinja"))
 
-# ----------------- CACHE & OPTIMISATIONS -----------------
-_cache = {'categories': None, 'last_update': 0, 'gender_sections': None}
-CACHE_DURATION = 300
+import pricing
+# Valeurs d'affichage ; les calculs de prix passent par pricing (centimes)
+CONFIG['COMMISSION_RATE'] = float(pricing.COMMISSION_RATE)
+CONFIG['PRICE_MULTIPLIER'] = float(pricing.PRICE_MULTIPLIER)
 
-def get_cached_data(key, fetch_func, force_refresh=False):
-    """Système de cache générique"""
-    current_time = datetime.now().timestamp()
-    
-    if force_refresh or _cache.get(key) is None or (current_time - _cache.get('last_update', 0) > CACHE_DURATION):
-        _cache[key] = fetch_func()
-        _cache['last_update'] = current_time
-        # Rafraîchissement async pour la prochaine fois
-        if not force_refresh:
-            Thread(target=lambda: get_cached_data(key, fetch_func, True), daemon=True).start()
-    
-    return _cache[key]
+# Import CORRECT du scraper et Supabase (clients créés au premier usage)
+from supabase_client import get_supabase, register_user, login_user, verify_token
+from scraper import get_categories, get_category_products, get_product_details, reload_overrides
+import scraper as scraper_module
+import image_proxy
+import assets
+import metrics
+import profiler
+import reporting
+import app_logging
+import stale_cache
+import stripe_gateway
+import upstream_limiter
+import api
+import compression
+import prefetch
+from response_cache import cached_page
+from models import Product
+
+# ----------------- APPLICATION -----------------
+def create_app():
+    """Construit l'application Flask (aucun client externe n'est créé ici)"""
+    app = Flask(__name__)
+    app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key")
+    # Compression en premier : son after_request passe après tous les autres
+    compression.init_app(app)
+    # Templates compilés une fois : bytecode partagé entre workers et redémarrages
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    # Journalisation en premier : l'identifiant de requête est connu de tous les hooks
+    app_logging.init_app(app)
+    app.register_blueprint(bp)
+    api.init_app(app)
+    assets.init_app(app)
+    # Profileur avant les métriques : son after_request passe après et voit Server-Timing
+    profiler.init_app(app)
+    metrics.init_app(app)
+    reporting.init_app(app)
+    app.before_request(stale_cache.begin_request)
+    app.after_request(_mark_freshness)
+    log.info("Configuration chargée - Multiplicateur: %sx", CONFIG['PRICE_MULTIPLIER'])
+    return app
+
+def _mark_freshness(response):
+    """Signale les pages construites avec des données de secours (amont en échec)"""
+    freshness = stale_cache.data_freshness()
+    if freshness != "fresh":
+        response.headers["X-Data-Freshness"] = freshness
+    return response
+
+_app = None
+_app_lock = Lock()
+
+def __getattr__(name):
+    """Compatibilité `app_supabase:app` : application créée au premier accès"""
+    global _app
+    if name != "app":
+        raise AttributeError(name)
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
 
 # ----------------- HELPERS OPTIMISÉES -----------------
 def get_verified_user():
@@ -74,137 +119,221 @@ def get_verified_user():
         session.clear()
     return None
 
-def get_cart_data(user_id):
-    """Récupère le panier avec seulement les colonnes nécessaires"""
+# ----------------- CACHE PANIER -----------------
+# Le cookie de session ne porte qu'une révision + le nombre d'articles (et leur
+# date) ; les lignes du panier restent dans le cache du processus, indexé par
+# user_id. Un changement de révision (écriture, réconciliation) invalide les
+# copies des autres workers sans requête supplémentaire. Les écritures faites
+# hors de cette session (webhook, autre appareil) sont rattrapées à
+# l'expiration : passé CART_CACHE_TTL, la session est réconciliée avec la base.
+CART_COLUMNS = ("id", "product_name", "price", "qty", "size", "product_image")
+CART_CACHE_TTL = 600
+CART_CACHE_MAX_USERS = 2048
+_cart_cache = {}
+_cart_lock = Lock()
+
+def _cart_row(row):
+    """Ligne de panier normalisée, prix en centimes calculé une fois à la lecture"""
+    item = {k: row.get(k) for k in CART_COLUMNS}
+    item["price_cents"] = pricing.to_cents(item.get("price") or 0)
+    return item
+
+def _fetch_cart(user_id):
+    """Lit le panier directement dans Supabase"""
+    with metrics.track("supabase", "carts.select"):
+        res = get_supabase().table("carts").select(",".join(CART_COLUMNS)).eq("user_id", user_id).execute()
+    return [_cart_row(row) for row in res.data or []]
+
+def _remember_cart(user_id, items, new_revision=True):
+    """Enregistre le panier dans le cache et synchronise la session"""
+    revision = session.get("cart_rev")
+    if new_revision or not revision:
+        revision = uuid.uuid4().hex[:12]
+    now = time.time()
+    with _cart_lock:
+        _cart_cache.pop(user_id, None)
+        if len(_cart_cache) >= CART_CACHE_MAX_USERS:
+            _cart_cache.pop(next(iter(_cart_cache)))
+        _cart_cache[user_id] = (revision, now, items)
+    session["cart_rev"] = revision
+    session["cart_count"] = len(items)
+    session["cart_at"] = int(now)
+    return items
+
+def forget_cart(user_id):
+    """Invalide le panier en cache (la prochaine lecture repasse par Supabase)"""
+    with _cart_lock:
+        _cart_cache.pop(user_id, None)
+    if has_request_context():
+        session.pop("cart_rev", None)
+        session.pop("cart_count", None)
+        session.pop("cart_at", None)
+
+def _session_cart_fresh():
+    """True si le panier de la session a été relu il y a moins de CART_CACHE_TTL"""
+    return bool(session.get("cart_rev")) and time.time() - session.get("cart_at", 0) < CART_CACHE_TTL
+
+def get_cart_data(user_id, refresh=False):
+    """Récupère le panier depuis le cache, Supabase seulement si nécessaire.
+
+    refresh=True force la réconciliation avec la base (login, checkout).
+    """
+    if not has_request_context():
+        try:
+            return _fetch_cart(user_id)
+        except Exception as e:
+            log.warning("Erreur panier: %s", e)
+            return []
+
+    entry = _cart_cache.get(user_id)
+    revision = session.get("cart_rev")
+    # Session expirée : le panier a pu changer ailleurs, on réconcilie
+    refresh = refresh or not _session_cart_fresh()
+    hit = (not refresh and entry is not None and revision == entry[0]
+           and time.time() - entry[1] < CART_CACHE_TTL)
+    metrics.cache_result("cart", hit)
+    if hit:
+        return entry[2]
+
     try:
-        res = supabase.table("carts").select("id,product_name,price,qty,size,product_image").eq("user_id", user_id).execute()
-        return res.data or []
+        items = _fetch_cart(user_id)
     except Exception as e:
-        print(f"Erreur panier: {e}")
+        log.warning("Erreur panier: %s", e)
         return []
+    # Une simple absence dans ce worker garde la révision ; seule une
+    # divergence avec la copie connue en crée une nouvelle.
+    changed = refresh and (entry is None or entry[2] != items)
+    return _remember_cart(user_id, items, new_revision=changed)
+
+def get_cart_count(user_id):
+    """Nombre d'articles du panier, sans requête si la session le connaît"""
+    count = session.get("cart_count")
+    if count is not None and _session_cart_fresh():
+        return count
+    return len(get_cart_data(user_id))
 
 def calculate_total(cart_items):
-    """Calcule le total du panier"""
-    return sum(float(item.get('price', 0) or 0) * int(item.get('qty', 1) or 1) for item in cart_items)
+    """Total du panier en centimes"""
+    return pricing.cart_total(cart_items)
 
 # ----------------- CONTEXT PROCESSOR UNIFIÉ -----------------
-@app.context_processor
+@bp.app_context_processor
 def inject_global_data():
     """Injecte toutes les données globales en une seule passe"""
     user_id = get_verified_user()
-    cart_count = len(get_cart_data(user_id)) if user_id else 0
+    cart_count = get_cart_count(user_id) if user_id else 0
     
+    # sections / categories : passées par les routes qui les affichent ;
+    # la sidebar de base.html vient du fragment en cache
     return {
         'base_path': '/',
         'cart_count': cart_count,
         'user_id': user_id,
         'user_email': session.get('user_email'),
-        'sections': get_gender_sections(),
         'price_multiplier': CONFIG['PRICE_MULTIPLIER'],
-        'categories': get_categories() or {'headers': [], 'brands': []}
+        'sidebar': sidebar_fragment,
     }
 
+# ----------------- FRAGMENT SIDEBAR -----------------
+# HTML de la sidebar, rendu une seule fois par génération du cache des sections
+# (la génération change quand une section est rechargée avec un contenu différent).
+_sidebar = (None, None)  # (génération, html)
+
+def sidebar_fragment():
+    """Sidebar de base.html, re-rendue seulement si les sections ont changé"""
+    global _sidebar
+    sections = get_gender_sections()
+    generation = _sections_cache.generation
+    cached_generation, cached_html = _sidebar
+    if cached_generation == generation and cached_html is not None:
+        metrics.cache_result("sidebar", True)
+        return cached_html
+    metrics.cache_result("sidebar", False)
+    html = Markup(render_template("_sidebar.html", sections=sections))
+    # Une section indisponible (liste vide de secours) ne fige pas le fragment
+    if stale_cache.data_freshness() != "unavailable":
+        _sidebar = (generation, html)
+    return html
+
 # ----------------- FONCTIONS MÉTIERS CORRIGÉES -----------------
+_sections_cache = stale_cache.StaleCache("sections")
+
 def get_gender_sections():
     """Récupère les sections par genre - VERSION CORRECTE"""
-    pages = {
-        "homme": "/Chaussures-Homme-c100.html",
-        "femme": "/Chaussures-Femme-c101.html",
-        "enfant": "/Chaussures-Enfant-c102.html",
-    }
-    out = {}
+    return {key: _sections_cache.get(key, lambda path=path: _load_section(path), default=list)
+            for key, path in scraper_module.GENDER_PATHS.items()}
+
+def _load_section(path):
+    """Produits mis en avant d'une page genre (lève UpstreamError si l'amont échoue)"""
     scraper_base = getattr(scraper_module, "BASE_URL", "https://www.destockenligne.com")
-    
-    for key, path in pages.items():
-        try:
-            html = safe_get(scraper_module._normalize_href(path, base=scraper_base))
-            soup = scraper_module.BeautifulSoup(html, "html.parser")
-            div = soup.find("div", id="prohref")
-            items = []
-            if div:
-                for a in div.find_all("a", href=True):
-                    name = a.get("title") or a.get_text(strip=True)
-                    href = a["href"]
-                    if href.startswith("http"):
-                        parsed = scraper_module.urlparse(href)
-                        href = parsed.path or href
-                        if parsed.query:
-                            href += "?" + parsed.query
-                    image = None
-                    img = a.find("img")
-                    if img and img.get("src"):
-                        image = img.get("src")
-                        if image and not image.startswith("http"):
-                            image = scraper_module.urljoin(scraper_base, image)
-                    
-                    # Récupérer le prix original
-                    price_text = ""
-                    price_span = a.find_previous("span", class_=lambda x: x and "price" in x.lower()) or a.find_next("span", class_=lambda x: x and "price" in x.lower())
-                    if price_span:
-                        price_text = price_span.get_text(strip=True)
-                    
-                    # Appliquer le multiplicateur
-                    if price_text:
-                        try:
-                            clean_price = price_text.replace('€', '').replace(',', '.').strip()
-                            price_value = float(clean_price) if clean_price else 0.0
-                            multiplied_price = price_value * CONFIG['PRICE_MULTIPLIER']
-                            display_price = f"€ {multiplied_price:.2f}"
-                        except (ValueError, TypeError):
-                            display_price = price_text
-                    else:
-                        display_price = ""
-                    
-                    items.append({
-                        "name": name, 
-                        "path": href, 
-                        "image": image,
-                        "display_price": display_price,
-                        "original_price": price_text
-                    })
-            out[key] = items
-        except Exception as e:
-            print(f"get_gender_sections error for {key}: {e}")
-            out[key] = []
-    return out
+    html = scraper_module.fetch_html(scraper_module._normalize_href(path, base=scraper_base))
+    soup = scraper_module.parse_html(html)
+    div = soup.find("div", id="prohref")
+    items = []
+    if div:
+        for a in div.find_all("a", href=True):
+            name = a.get("title") or a.get_text(strip=True)
+            href = a["href"]
+            if href.startswith("http"):
+                parsed = scraper_module.urlparse(href)
+                href = parsed.path or href
+                if parsed.query:
+                    href += "?" + parsed.query
+            image = None
+            img = a.find("img")
+            if img and img.get("src"):
+                image = img.get("src")
+                if image and not image.startswith("http"):
+                    image = scraper_module.urljoin(scraper_base, image)
+            
+            # Prix fournisseur -> prix de vente (surcharge ou multiplicateur)
+            price_text = ""
+            price_span = a.find_previous("span", class_=lambda x: x and "price" in x.lower()) or a.find_next("span", class_=lambda x: x and "price" in x.lower())
+            if price_span:
+                price_text = price_span.get_text(strip=True)
+            price_cents, display_price = pricing.display_price(href, price_text)
+
+            if pricing.is_hidden(href):
+                continue
+            items.append(Product.make(name=name, path=href, image=pricing.override_image(href) or image,
+                                      new_price=display_price, price_cents=price_cents))
+    return items
 
 def process_order_payment(user_id, cart_items):
     """Traite le paiement et crée la session Stripe"""
     if not cart_items:
         raise ValueError("Panier vide")
     
-    line_items, total = [], 0.0
+    line_items = []
     for item in cart_items:
-        price, qty = float(item.get('price', 0) or 0), int(item.get('qty', 1) or 1)
-        total += price * qty
         line_items.append({
             "price_data": {
                 "currency": "eur",
                 "product_data": {"name": item.get("product_name", "Produit")},
-                "unit_amount": int(price * 100),
+                "unit_amount": item["price_cents"],
             },
-            "quantity": qty
+            "quantity": int(item.get('qty', 1) or 1)
         })
     
     # Ajouter la commission
-    commission = int(total * CONFIG['COMMISSION_RATE'] * 100)
+    commission = pricing.commission(calculate_total(cart_items))
     if commission > 0:
         line_items.append({
             "price_data": {
                 "currency": "eur",
-                "product_data": {"name": f"Commission ({int(CONFIG['COMMISSION_RATE']*100)}%)"},
+                "product_data": {"name": pricing.commission_label()},
                 "unit_amount": commission,
             },
             "quantity": 1
         })
     
-    return stripe.checkout.Session.create(
+    return stripe_gateway.create_checkout_session(
         payment_method_types=["card"],
         mode="payment",
         line_items=line_items,
         success_url=f"{CONFIG['APP_BASE_URL']}/checkout/success?session_id={{CHECKOUT_SESSION_ID}}",
         cancel_url=f"{CONFIG['APP_BASE_URL']}/checkout/cancel",
-        metadata={"user_id": user_id, "commission_rate": str(CONFIG['COMMISSION_RATE'])},
+        metadata={"user_id": user_id, "commission_rate": str(pricing.COMMISSION_RATE)},
         shipping_address_collection={"allowed_countries": os.getenv("ALLOWED_SHIPPING_COUNTRIES", "FR").split(",")},
         customer_email=session.get("user_email")
     )
@@ -212,12 +341,16 @@ def process_order_payment(user_id, cart_items):
 def send_order_email(order_data):
     """Envoie l'email de commande optimisé"""
     if not CONFIG['SMTP_USER'] or not CONFIG['SMTP_PASS']:
-        print("❌ Configuration SMTP manquante")
+        log.error("Configuration SMTP manquante")
         return False
     
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     try:
         items_text = "\n".join([
-            f"- {item.get('qty', 1)} x {item.get('product_name', 'Produit')} ({item.get('size', '')}) - {float(item.get('price', 0)):.2f}€"
+            f"- {item.get('qty', 1)} x {item.get('product_name', 'Produit')} ({item.get('size', '')}) - {pricing.format_price(item['price_cents'])}"
             for item in order_data.get('items', [])
         ])
         
@@ -244,25 +377,69 @@ Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             server.login(CONFIG['SMTP_USER'], CONFIG['SMTP_PASS'])
             server.send_message(msg)
         
-        print("✅ Email envoyé")
+        log.info("Email de commande envoyé")
         return True
     except Exception as e:
-        print(f"❌ Erreur email: {e}")
+        log.error("Erreur email: %s", e)
         return False
 
+# ----------------- STREAMING -----------------
+# Marqueur placé dans les templates aux points où le tampon doit partir vers
+# le client (avant d'attendre l'amont, après chaque lot de produits).
+STREAM_FLUSH = Markup("<!--flush-->")
+STREAM_BUFFER_BYTES = 16 * 1024
+
+class StreamedListing:
+    """Grille de produits produite pendant le rendu, par lots, au fil de l'amont.
+
+    batches(listing) est un générateur de listes de produits ; il peut
+    renseigner listing.paging et listing.count, lus par le template après la grille.
+    """
+
+    def __init__(self, batches, paging=None):
+        self._batches = batches
+        self.paging = paging or {}
+        self.count = 0
+
+    @property
+    def batches(self):
+        return self._batches(self)
+
+def _flushing(chunks):
+    """Regroupe les fragments Jinja et n'envoie qu'aux marqueurs de flush (ou tampon plein)"""
+    buffer, size = [], 0
+    for chunk in chunks:
+        if chunk == STREAM_FLUSH:
+            if buffer:
+                yield "".join(buffer)
+                buffer, size = [], 0
+            continue
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_BUFFER_BYTES:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+def stream_page(template_name, **context):
+    """Rendu en flux : l'en-tête et la navigation partent avant la fin du scraping"""
+    response = Response(_flushing(stream_template(template_name, stream_flush=STREAM_FLUSH, **context)),
+                        mimetype="text/html")
+    # Pas de mise en tampon par un proxy (nginx / Render) devant gunicorn
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 # ----------------- ROUTES PRINCIPALES CORRIGÉES -----------------
-@app.route("/")
+@bp.route("/")
+@cached_page(args=("gender",))
 def home():
     gender = request.args.get("gender", "all")
     categories = get_categories() or {'headers': [], 'brands': []}
     sections = get_gender_sections()
     all_products = []
 
-    GENDER_PATHS = {
-        "homme": "/Chaussures-Homme-c100.html",
-        "femme": "/Chaussures-Femme-c101.html",
-        "enfant": "/Chaussures-Enfant-c102.html",
-    }
+    GENDER_PATHS = scraper_module.GENDER_PATHS
 
     if gender == "all":
         for g in ["homme", "femme", "enfant"]:
@@ -271,7 +448,7 @@ def home():
                 products, _ = get_category_products(path, 1)
                 all_products.extend(products[:4])
             except Exception as e:
-                print(f"Error loading {g} products: {e}")
+                log.warning("Erreur produits %s: %s", g, e)
     else:
         if gender in GENDER_PATHS:
             try:
@@ -279,100 +456,114 @@ def home():
                 products, _ = get_category_products(path, 1)
                 all_products = products[:12]
             except Exception as e:
-                print(f"Error loading {gender} products: {e}")
+                log.warning("Erreur produits %s: %s", gender, e)
 
     return render_template("home.html", categories=categories, sections=sections, 
                          gender=gender, products=all_products)
 
-@app.route("/category")
+@bp.route("/category")
+@cached_page(args=("path", "page"), ttl=300)
 def category():
     path = request.args.get("path")
     if not path:
-        return redirect(url_for("home"))
+        return redirect(url_for("shop.home"))
     
     path = unquote_plus(path)
     page = max(1, int(request.args.get("page", 1)))
-    
-    try:
-        products, paging = get_category_products(path, page)
-    except Exception as e:
-        print(f"category route error: {e}")
-        products, paging = [], {'current': page, 'total': 1, 'has_next': False, 'has_prev': page > 1}
-    
-    categories = get_categories() or {'headers': [], 'brands': []}
-    return render_template("category.html", categories=categories, products=products, 
-                         category_path=path, category_path_enc=quote_plus(path), paging=paging)
 
-@app.route("/product")
+    def batches(listing):
+        try:
+            products, listing.paging = get_category_products(path, page)
+        except Exception as e:
+            log.warning("Erreur catégorie %s: %s", path, e)
+            products = []
+        else:
+            prefetch.next_listing_page(path, listing.paging)
+        listing.count = len(products)
+        yield products
+
+    listing = StreamedListing(batches, paging={'current': page, 'total': 1, 'has_next': False, 'has_prev': page > 1})
+    return stream_page("category.html", listing=listing,
+                       category_path=path, category_path_enc=quote_plus(path))
+
+@bp.route("/product")
+@cached_page(args=("path",), ttl=300)
 def product():
     path = request.args.get("path")
     if not path:
-        return redirect(url_for("home"))
+        return redirect(url_for("shop.home"))
     
     path = unquote_plus(path)
     product_data = get_product_details(path) or {}
+    prefetch.related_products(product_data.get("related"))
     
     categories = get_categories() or {'headers': [], 'brands': []}
     sections = get_gender_sections()
     return render_template("product.html", categories=categories, product=product_data, sections=sections)
 
-@app.route("/search")
+@bp.route("/search")
+@cached_page(args=("q",))
 def search():
     query = request.args.get("q", "").strip()
     if not query:
-        return redirect(url_for("home"))
-
-    categories = get_categories() or {"headers": [], "brands": []}
-    all_products = []
-
-    search_paths = [
-        "/Chaussures-Homme-c100.html",
-        "/Chaussures-Femme-c101.html",
-        "/Chaussures-Enfant-c102.html"
-    ]
-
-    for path in search_paths:
-        for page in range(1, 3):  # Limité à 2 pages pour la performance
-            try:
-                products, paging = get_category_products(path, page)
-                all_products.extend(products)
-                if not paging.get('has_next', False):
-                    break
-            except Exception as e:
-                print(f"Error searching in {path} page {page}: {e}")
-                break
-
-    # Filtrer les produits
-    query_terms = query.lower().split()
-    results = []
+        return redirect(url_for("shop.home"))
+
+    query_lower = query.lower()
+    query_terms = [term for term in query_lower.split() if len(term) > 2]
+
+    def batches(listing):
+        # Les 3 listings sont interrogés en parallèle (2 pages max chacun) ;
+        # chaque page amont est filtrée et envoyée dès son arrivée.
+        seen_names = set()
+        for path, page, products, paging in scraper_module.iter_listing_pages(scraper_module.GENDER_PATHS.values(), max_pages=2):
+            batch = []
+            for product in products:
+                product_name = (product.get("name") or "").lower()
+                if query_lower in product_name or any(term in product_name for term in query_terms):
+                    # Éviter les doublons
+                    if product.get("name") not in seen_names:
+                        seen_names.add(product.get("name"))
+                        batch.append(product)
+            listing.count += len(batch)
+            if batch:
+                yield batch
+
+    return stream_page("search.html", listing=StreamedListing(batches), query=query)
+
+# ----------------- IMAGES -----------------
+IMAGE_MAX_AGE = 30 * 24 * 3600
+
+@bp.app_template_filter("euros")
+def euros(cents):
+    """Centimes -> "12.34" pour l'affichage"""
+    return pricing.format_amount(cents)
+
+@bp.app_template_filter("img")
+def image_url(url, variant="card"):
+    """URL proxifiée (et redimensionnée) d'une image produit"""
+    if not image_proxy.is_proxyable(url):
+        return url
+    return url_for("shop.proxied_image", u=url, v=variant)
+
+@bp.route("/img")
+def proxied_image():
+    """Sert une image du site source depuis le cache disque"""
+    url = request.args.get("u", "")
+    accept_webp = "image/webp" in request.headers.get("Accept", "")
+    try:
+        path, mimetype, etag = image_proxy.get_image(url, request.args.get("v", "orig"), accept_webp)
+    except image_proxy.ImageProxyError as e:
+        log.warning("Image non proxifiée: %s", e)
+        # En cas d'échec on renvoie vers l'image d'origine plutôt qu'une image cassée
+        return redirect(url) if image_proxy.is_proxyable(url) else ("", 404)
 
-    for product in all_products:
-        product_name = product.get("name", "").lower()
-        
-        if query.lower() in product_name:
-            results.append(product)
-            continue
-            
-        match_count = sum(1 for term in query_terms if len(term) > 2 and term in product_name)
-        if match_count > 0:
-            results.append(product)
-
-    # Éviter les doublons
-    seen_names = set()
-    unique_results = []
-    for product in results:
-        if product.get('name') not in seen_names:
-            seen_names.add(product.get('name'))
-            unique_results.append(product)
-
-    return render_template("search.html", 
-                         categories=categories, 
-                         results=unique_results, 
-                         query=query, 
-                         results_count=len(unique_results))
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=IMAGE_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    response.vary.add("Accept")
+    return response
 
 # ----------------- AUTHENTIFICATION -----------------
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     error = None
     if request.method == "POST":
@@ -382,7 +573,7 @@ def register():
             res = register_user(email, password)
             if getattr(res, "user", None):
                 flash('✅ Inscription réussie! Vous pouvez maintenant vous connecter.', 'success')
-                return redirect(url_for("login"))
+                return redirect(url_for("shop.login"))
             error = "Erreur d'inscription, veuillez réessayer."
         except Exception as e:
             if "User already registered" in str(e):
@@ -391,7 +582,7 @@ def register():
                 error = f"Erreur: {e}"
     return render_template("register.html", error=error)
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     error = None
     if request.method == "POST":
@@ -403,8 +594,10 @@ def login():
                 session["access_token"] = res.session.access_token
                 session["user_id"] = res.user.id
                 session["user_email"] = res.user.email
+                # Réconciliation du panier à la connexion
+                get_cart_data(res.user.id, refresh=True)
                 flash('✅ Connexion réussie!', 'success')
-                return redirect(url_for("home"))
+                return redirect(url_for("shop.home"))
             error = "Échec de connexion"
         except Exception as e:
             if "Invalid login credentials" in str(e):
@@ -413,209 +606,238 @@ def login():
                 error = f"Erreur: {e}"
     return render_template("login.html", error=error)
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
+    forget_cart(session.get("user_id"))
     session.clear()
     flash('✅ Déconnexion réussie!', 'success')
-    return redirect(url_for("home"))
+    return redirect(url_for("shop.home"))
 
 # ----------------- GESTION DU PANIER -----------------
-@app.route("/cart")
+@bp.route("/cart")
 def cart_view():
     user_id = get_verified_user()
     if not user_id:
         flash('❌ Veuillez vous connecter pour voir votre panier', 'error')
-        return redirect(url_for("login"))
+        return redirect(url_for("shop.login"))
 
     try:
         cart = get_cart_data(user_id)
         total = calculate_total(cart)
         categories = get_categories() or {'headers': [], 'brands': []}
         return render_template("cart.html", categories=categories, cart=cart, total=total)
-    except Exception as e:
-        print(f"DEBUG - Cart view error: {e}")
+    except Exception:
+        log.exception("Erreur affichage panier")
         return render_template("cart.html", cart=[], total=0, error="Erreur lors du chargement du panier")
 
-@app.route("/cart/add", methods=["POST"])
+@bp.route("/cart/add", methods=["POST"])
 def cart_add():
     user_id = get_verified_user()
     if not user_id:
         flash('❌ Veuillez vous connecter pour ajouter au panier', 'error')
-        return redirect(url_for("login"))
+        return redirect(url_for("shop.login"))
 
     data = request.form
-    print(f"DEBUG - Données reçues: {dict(data)}")  # Debug
     
     try:
         # Validation des données requises
-        if not data.get('name') or not data.get('price'):
+        path = data.get('path', '')
+        if not path:
             flash('❌ Données produit manquantes', 'error')
-            return redirect(request.referrer or url_for('home'))
+            return redirect(request.referrer or url_for('shop.home'))
 
-        # Conversion du prix
-        price_str = data.get('price', '0').replace('€', '').replace(',', '.').strip()
-        try:
-            price = float(price_str) if price_str else 0.0
-        except ValueError:
-            price = 0.0
+        # Prix et libellé relus côté serveur (cache produit), jamais depuis le formulaire
+        product_data = get_product_details(path)
+        price_cents = product_data.get('price_cents') if not product_data.get('is_category') else None
+        if not price_cents:
+            flash('❌ Produit indisponible pour le moment', 'error')
+            return redirect(request.referrer or url_for('shop.home'))
 
         # Conversion de la quantité
         try:
-            qty = int(data.get('qty', 1))
+            qty = min(max(int(data.get('qty', 1)), 1), 10)
         except ValueError:
             qty = 1
 
         cart_item = {
             "user_id": user_id,
-            "product_name": data.get('name'),
-            "path": data.get('path', ''),
-            "product_image": data.get('image', ''),
-            "price": price,
+            "product_name": product_data.get('title') or data.get('name'),
+            "path": path,
+            "product_image": product_data.get('main_img') or '',
+            "price": pricing.to_amount(price_cents),
             "qty": qty,
             "size": data.get('size', 'Unique')
         }
 
-        print(f"DEBUG - Insertion panier: {cart_item}")  # Debug
+        log.debug("Ajout au panier", extra={"product_path": cart_item["path"], "qty": qty})
 
-        # Insertion dans Supabase
-        result = supabase.table("carts").insert(cart_item).execute()
+        # Insertion dans Supabase (écriture directe, puis mise à jour du cache)
+        current = get_cart_data(user_id)
+        with metrics.track("supabase", "carts.insert"):
+            result = get_supabase().table("carts").insert(cart_item).execute()
         
         if hasattr(result, 'error') and result.error:
             flash('❌ Erreur base de données lors de l\'ajout', 'error')
-            print(f"DEBUG - Erreur Supabase: {result.error}")
+            log.error("Erreur Supabase ajout panier: %s", result.error)
+            forget_cart(user_id)
         else:
+            row = (result.data or [None])[0]
+            if row:
+                _remember_cart(user_id, current + [_cart_row(row)])
+            else:
+                forget_cart(user_id)
             flash('✅ Produit ajouté au panier!', 'success')
 
     except Exception as e:
-        print(f"DEBUG - Error adding to cart: {e}")
+        log.exception("Erreur ajout panier")
         flash(f'❌ Erreur: {str(e)}', 'error')
 
-    return redirect(request.referrer or url_for('home'))
+    return redirect(request.referrer or url_for('shop.home'))
 
-    data = request.form
-    try:
-        cart_item = {
-            "user_id": user_id,
-            "product_name": data.get('name'),
-            "path": data.get('path', ''),
-            "product_image": data.get('image', ''),
-            "price": float(data.get('price', '0').replace('€', '').replace(',', '.')) or 0.0,
-            "qty": int(data.get('qty', 1)) or 1,
-            "size": data.get('size', '')
-        }
-        
-        supabase.table("carts").insert(cart_item).execute()
-        flash('✅ Produit ajouté au panier!', 'success')
-    except Exception as e:
-        flash(f'❌ Erreur: {str(e)}', 'error')
-    
-    return redirect(request.referrer or url_for('home'))
-
-@app.route("/cart/remove/<item_id>", methods=["POST"])
+@bp.route("/cart/remove/<item_id>", methods=["POST"])
 def cart_remove(item_id):
     user_id = get_verified_user()
     if not user_id:
         flash('❌ Veuillez vous connecter', 'error')
-        return redirect(url_for("login"))
+        return redirect(url_for("shop.login"))
     
     try:
-        supabase.table("carts").delete().eq("id", item_id).eq("user_id", user_id).execute()
+        current = get_cart_data(user_id)
+        with metrics.track("supabase", "carts.delete"):
+            get_supabase().table("carts").delete().eq("id", item_id).eq("user_id", user_id).execute()
+        _remember_cart(user_id, [it for it in current if str(it.get("id")) != str(item_id)])
         flash('✅ Produit retiré du panier', 'success')
     except Exception as e:
         flash('❌ Erreur lors de la suppression', 'error')
-    return redirect(url_for('cart_view'))
+    return redirect(url_for('shop.cart_view'))
 
-@app.route("/cart/clear", methods=["POST"])
+@bp.route("/cart/clear", methods=["POST"])
 def cart_clear():
     user_id = get_verified_user()
     if not user_id:
         flash('❌ Veuillez vous connecter', 'error')
-        return redirect(url_for("login"))
+        return redirect(url_for("shop.login"))
     
     try:
-        supabase.table("carts").delete().eq("user_id", user_id).execute()
+        with metrics.track("supabase", "carts.delete"):
+            get_supabase().table("carts").delete().eq("user_id", user_id).execute()
+        _remember_cart(user_id, [])
         flash('✅ Panier vidé', 'success')
     except Exception as e:
+        forget_cart(user_id)
         flash('❌ Erreur lors du vidage du panier', 'error')
-    return redirect(url_for('cart_view'))
+    return redirect(url_for('shop.cart_view'))
 
 # ----------------- CHECKOUT -----------------
-@app.route("/create-checkout-session", methods=["POST"])
+@bp.route("/create-checkout-session", methods=["POST"])
 def create_checkout_session():
     user_id = get_verified_user()
     if not user_id:
         return jsonify({"error": "non connecté"}), 403
 
     try:
-        cart_items = get_cart_data(user_id)
+        # Réconciliation avant paiement : le montant vient toujours de la base
+        cart_items = get_cart_data(user_id, refresh=True)
         if not cart_items:
             flash('❌ Votre panier est vide', 'error')
-            return redirect(url_for('cart_view'))
+            return redirect(url_for('shop.cart_view'))
 
         session_stripe = process_order_payment(user_id, cart_items)
         return redirect(session_stripe.url, code=303)
-    except Exception as e:
-        print(f"DEBUG - Stripe error: {e}")
+    except stripe_gateway.StripeUnavailable as e:
+        log.warning("Création session Stripe impossible: %s", e)
+        flash('❌ Le paiement est momentanément indisponible, réessayez dans quelques minutes', 'error')
+        return redirect(url_for('shop.cart_view'))
+    except Exception:
+        log.exception("Erreur création session Stripe")
         flash('❌ Erreur lors de la création de la session de paiement', 'error')
-        return redirect(url_for('cart_view'))
+        return redirect(url_for('shop.cart_view'))
+
+def _find_order(session_id):
+    """Commande déjà enregistrée pour cette session Stripe (None si absente ou base injoignable)"""
+    try:
+        with metrics.track("supabase", "orders.select"):
+            res = (get_supabase().table("orders").select("stripe_session_id,total_amount,status")
+                   .eq("stripe_session_id", session_id).limit(1).execute())
+        return (res.data or [None])[0]
+    except Exception as e:
+        log.warning("Lecture commande %s impossible: %s", session_id, e)
+        return None
 
-@app.route("/checkout/success")
+@bp.route("/checkout/success")
 def checkout_success():
     user_id = get_verified_user()
     if not user_id or not (session_id := request.args.get("session_id")):
-        return redirect(url_for("home"))
+        return redirect(url_for("shop.home"))
 
     try:
-        session_stripe = stripe.checkout.Session.retrieve(session_id)
+        session_stripe = stripe_gateway.retrieve_checkout_session(session_id)
         if session_stripe.payment_status not in ('paid', 'unpaid'):
-            return redirect(url_for('checkout_cancel'))
-        
-        cart_items = get_cart_data(user_id)
+            return redirect(url_for('shop.checkout_cancel'))
+
+        # Page rechargée ou commande déjà enregistrée par le webhook : rien à refaire
+        existing = _find_order(session_id)
+        if existing:
+            return render_template("success.html", order=existing)
+
+        cart_items = get_cart_data(user_id, refresh=True)
         total = calculate_total(cart_items)
-        commission = total * CONFIG['COMMISSION_RATE']
         
         order_data = {
             "user_id": user_id,
             "stripe_session_id": session_id,
-            "total_amount": total,
+            "total_amount": pricing.to_amount(total),
             "commission_rate": CONFIG['COMMISSION_RATE'],
-            "commission_amount": commission,
+            "commission_amount": pricing.to_amount(pricing.commission(total)),
             "status": "paid",
             "items": cart_items,
             "customer_email": getattr(session_stripe.customer_details, 'email', None) if session_stripe.customer_details else session.get("user_email")
         }
         
+        # Déjà comptée (Supabase injoignable lors de la lecture) : ni seconde commande ni second email
+        if reporting.record_order(order_data) is False:
+            return render_template("success.html", order=reporting.get_order(session_id) or order_data)
+
         # Sauvegarde commande
         try:
-            supabase.table("orders").insert(order_data).execute()
+            with metrics.track("supabase", "orders.insert"):
+                get_supabase().table("orders").insert(order_data).execute()
         except Exception as e:
-            print(f"Erreur sauvegarde commande: {e}")
-            # Sauvegarde de fallback...
+            log.error("Erreur sauvegarde commande: %s", e)
+            # Rejouée plus tard par scripts/replay_orders.py
+            reporting.append_backup(order_data, "database_error")
         
         # Envoi email async
         Thread(target=send_order_email, args=(order_data,), daemon=True).start()
         
         # Vider le panier
-        supabase.table("carts").delete().eq("user_id", user_id).execute()
+        with metrics.track("supabase", "carts.delete"):
+            get_supabase().table("carts").delete().eq("user_id", user_id).execute()
+        _remember_cart(user_id, [])
         
         return render_template("success.html", order=order_data)
-    except Exception as e:
-        print(f"DEBUG - Checkout success error: {e}")
-        return redirect(url_for('home'))
+    except stripe_gateway.StripeUnavailable as e:
+        # La commande sera enregistrée par le webhook (aucun appel à l'API Stripe)
+        log.warning("Vérification du paiement impossible: %s", e)
+        flash('⏳ Paiement en cours de vérification : la confirmation vous sera envoyée par email', 'info')
+        return redirect(url_for('shop.home'))
+    except Exception:
+        log.exception("Erreur retour paiement")
+        return redirect(url_for('shop.home'))
 
-@app.route("/checkout/cancel")
+@bp.route("/checkout/cancel")
 def checkout_cancel():
     return render_template("cancel.html")
 
 # ----------------- ROUTES DE TEST -----------------
-@app.route("/test-email")
+@bp.route("/test-email")
 def test_email():
     """Route pour tester l'envoi d'email"""
     try:
         test_order = {
             "stripe_session_id": "test_123",
             "items": [
-                {"product_name": "Produit Test", "price": 50, "qty": 1, "size": "42"}
+                {"product_name": "Produit Test", "price": 50, "price_cents": 5000, "qty": 1, "size": "42"}
             ],
             "total_amount": 50,
             "commission_amount": 7.5,
@@ -630,12 +852,14 @@ def test_email():
     except Exception as e:
         return f"❌ Erreur: {str(e)}"
 
-@app.route("/test-database")
+@bp.route("/test-database")
 def test_database():
     """Route pour tester la connexion à la base de données"""
     try:
-        res = supabase.table("carts").select("*").execute()
-        carts_count = len(res.data) if res.data else 0
+        # Comptage côté serveur : une seule ligne transférée
+        with metrics.track("supabase", "carts.count"):
+            res = get_supabase().table("carts").select("id", count="exact").limit(1).execute()
+        carts_count = res.count or 0
         return f"""
         <h1>Test Base de Données</h1>
         <p>✅ Connexion Supabase: OK</p>
@@ -646,14 +870,14 @@ def test_database():
         return f"❌ Erreur base de données: {str(e)}"
 
 # ----------------- WEBHOOK -----------------
-@app.route("/webhook/stripe", methods=["POST"])
+@bp.route("/webhook/stripe", methods=["POST"])
 def stripe_webhook():
     payload = request.data
     sig_header = request.headers.get("stripe-signature")
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, CONFIG['STRIPE_WEBHOOK_SECRET'])
+        event = stripe_gateway.construct_event(payload, sig_header, CONFIG['STRIPE_WEBHOOK_SECRET'])
     except Exception as e:
-        print("Webhook error (signature):", e)
+        log.warning("Signature webhook invalide: %s", e)
         return "", 400
 
     if event["type"] == "checkout.session.completed":
@@ -665,27 +889,51 @@ def stripe_webhook():
 def process_webhook_order(session_obj):
     """Traitement async des webhooks"""
     try:
-        user_id = session_obj.metadata.get("user_id")
-        if user_id:
+        # StripeObject n'est plus un dict (SDK >= 7) : accès par attribut
+        user_id = getattr(session_obj.metadata, "user_id", None)
+        # Commande déjà enregistrée par la page de retour : pas de doublon ni de second email
+        if user_id and not _find_order(session_obj.id):
             cart_items = get_cart_data(user_id)
             total = calculate_total(cart_items)
             
             order_data = {
                 "user_id": user_id,
                 "stripe_session_id": session_obj.id,
-                "total_amount": total,
+                "total_amount": pricing.to_amount(total),
                 "commission_rate": CONFIG['COMMISSION_RATE'],
-                "commission_amount": total * CONFIG['COMMISSION_RATE'],
+                "commission_amount": pricing.to_amount(pricing.commission(total)),
                 "status": "paid",
                 "items": cart_items,
                 "customer_email": getattr(session_obj.customer_details, 'email', None)
             }
             
-            supabase.table("orders").insert(order_data).execute()
+            if reporting.record_order(order_data) is False:
+                return
+            try:
+                with metrics.track("supabase", "orders.insert"):
+                    get_supabase().table("orders").insert(order_data).execute()
+            except Exception as e:
+                log.error("Erreur sauvegarde commande (webhook): %s", e)
+                reporting.append_backup(order_data, "database_error")
             send_order_email(order_data)
-            supabase.table("carts").delete().eq("user_id", user_id).execute()
+            with metrics.track("supabase", "carts.delete"):
+                get_supabase().table("carts").delete().eq("user_id", user_id).execute()
+            forget_cart(user_id)
+    except Exception:
+        log.exception("Erreur webhook")
+
+# ----------------- DÉMARRAGE -----------------
+def warm_caches(app):
+    """Pré-remplit les caches (catégories, sections, page d'accueil) d'un worker"""
+    started = time.time()
+    try:
+        # Priorité basse : les premiers visiteurs passent avant le préchauffage
+        with upstream_limiter.background(), app.test_client() as client:
+            client.get("/")
+        log.info("Caches préchauffés en %.1fs", time.time() - started)
     except Exception as e:
-        print(f"Webhook error: {e}")
+        log.warning("Erreur préchauffage: %s", e)
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0")
\ No newline at end of file
+    # Serveur de développement uniquement ; en production : gunicorn -c gunicorn.conf.py
+    create_app().run(debug=os.getenv("DEBUG") == "1", host="0.0.0.0")
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Assets statiques empreintés : url_for('static', ...) pointe vers static/dist/
+(produit par scripts/build_assets.py) avec cache immuable et variantes
+précompressées brotli / gzip.
+"""
+import os
+import json
+import mimetypes
+
+from flask import request, send_from_directory
+
+MANIFEST_PATH = os.path.join("dist", "manifest.json")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Ordre de préférence des variantes précompressées
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {}
+
+
+def load_manifest(static_folder):
+    """Charge le manifeste du build (vide si le build n'a pas été lancé)"""
+    global _manifest
+    try:
+        with open(os.path.join(static_folder, MANIFEST_PATH)) as fh:
+            _manifest = json.load(fh)
+    except (OSError, ValueError):
+        _manifest = {}
+    return _manifest
+
+
+def asset_path(filename):
+    """Nom empreinté d'un fichier statique, ou le nom d'origine hors build"""
+    return _manifest.get(filename, filename)
+
+
+def _hashed_static(endpoint, values):
+    if endpoint == "static" and "filename" in values:
+        values["filename"] = asset_path(values["filename"])
+
+
+def init_app(app):
+    """Branche la réécriture des URLs statiques et le service précompressé"""
+    load_manifest(app.static_folder)
+    app.url_defaults(_hashed_static)
+    static_folder = app.static_folder
+
+    def static(filename):
+        if not filename.startswith("dist/"):
+            return app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and os.path.exists(os.path.join(static_folder, filename + suffix)):
+                response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype,
+                                               max_age=IMMUTABLE_MAX_AGE)
+                response.content_encoding = encoding
+                break
+        if response is None:
+            response = send_from_directory(static_folder, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        # Le nom change à chaque modification du contenu : cache permanent
+        response.cache_control.immutable = True
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.view_functions["static"] = static
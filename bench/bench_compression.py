@@ -0,0 +1,114 @@
+"""
+Compression des réponses : octets envoyés et coût CPU par page.
+
+Les pages sont rendues par l'application elle-même, alimentée par l'amont
+factice de loadtest/fake_services.py (démarré dans ce processus, sans
+latence) : accueil, catégorie, produit et réponses JSON de l'API. Chaque
+corps est compressé avec gzip et brotli à plusieurs niveaux ; la ligne
+« flux » compresse la page catégorie morceau par morceau comme pour une
+page envoyée en flux (un flush par morceau).
+
+  python bench/bench_compression.py --repeat 20
+"""
+import os
+import sys
+import time
+import zlib
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "loadtest"))
+
+import brotli  # noqa: E402
+
+import fake_services  # noqa: E402
+
+VARIANTS = (("gzip", 1), ("gzip", 6), ("gzip", 9), ("br", 1), ("br", 5), ("br", 11))
+
+
+def start_upstream():
+    fake_services.UpstreamHandler.latency = fake_services.Latency()
+    fake_services.UpstreamHandler.catalogue = fake_services.Catalogue()
+    server = fake_services.serve(fake_services.UpstreamHandler, "127.0.0.1", 0)
+    os.environ["SCRAPER_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    return server
+
+
+def collect_pages():
+    """{nom: (corps, morceaux du flux)} rendus sans compression"""
+    os.environ["COMPRESS_ENABLED"] = "0"
+    os.environ["PREFETCH_ENABLED"] = "0"
+    import app_supabase
+    import scraper
+
+    client = app_supabase.create_app().test_client()
+    category = list(scraper.GENDER_PATHS.values())[0]
+    product = scraper.get_category_products(category, 1)[0][0].path
+    urls = {
+        "accueil": ("/", {}),
+        "catégorie": ("/category", {"path": category}),
+        "produit": ("/product", {"path": product}),
+        "api catégorie": ("/api/category", {"path": category}),
+        "api sections": ("/api/sections", {}),
+    }
+    pages = {}
+    for name, (url, query) in urls.items():
+        response = client.get(url, query_string=query)
+        chunks = [chunk for chunk in response.response]
+        pages[name] = (b"".join(chunks), chunks)
+    return pages
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_chunks(chunks, encoding, level):
+    """Taille d'un flux compressé avec un flush après chaque morceau"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        size = sum(len(compressor.process(chunk) + compressor.flush()) for chunk in chunks)
+        return size + len(compressor.finish())
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    size = sum(len(compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)) for chunk in chunks)
+    return size + len(compressor.flush())
+
+
+def timed(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    return result, statistics.median(durations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="compressions par mesure (médiane)")
+    args = parser.parse_args(argv)
+
+    start_upstream()
+    pages = collect_pages()
+    print(f"{'page':15} {'encodage':9} {'octets':>9} {'ratio':>6} {'CPU ms':>8} {'Mo/s':>7}")
+    for name, (body, chunks) in pages.items():
+        print(f"{name:15} {'identity':9} {len(body):9d} {1:6.2f} {0:8.2f} {'-':>7}")
+        for encoding, level in VARIANTS:
+            data, duration = timed(lambda: compress(body, encoding, level), args.repeat)
+            print(f"{'':15} {f'{encoding}-{level}':9} {len(data):9d} {len(body) / len(data):6.2f} "
+                  f"{duration * 1000:8.2f} {len(body) / duration / 1e6:7.1f}")
+        if len(chunks) > 1:
+            for encoding, level in (("gzip", 6), ("br", 5)):
+                size, duration = timed(lambda: compress_chunks(chunks, encoding, level), args.repeat)
+                print(f"{'':15} {f'{encoding}-{level}':9} {size:9d} {len(body) / size:6.2f} "
+                      f"{duration * 1000:8.2f} {len(body) / duration / 1e6:7.1f}  flux ({len(chunks)} morceaux)")
+    print("\nPages du cache anonyme : compressées une fois par encodage, coût CPU nul ensuite.")
+
+
+if __name__ == "__main__":
+    main()
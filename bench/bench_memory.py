@@ -0,0 +1,102 @@
+"""
+Mémoire d'un catalogue complet en cache : anciens dicts vs models.Product.
+
+Le catalogue synthétique reproduit la répartition des caches d'un worker :
+chaque produit apparaît dans son listing, dans les résultats de recherche,
+dans les « produits similaires » de plusieurs pages produit et, pour une
+partie, dans les sections de l'accueil. Avec des dicts, chaque copie vient
+d'un parsing séparé (chaînes distinctes) ; avec Product.make(), les copies
+partagent un seul objet.
+
+  python bench/bench_memory.py --categories 60 --pages 5 --per-page 30
+"""
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Product  # noqa: E402
+
+
+def _fresh(value):
+    """Copie distincte d'une chaîne, comme en produit un nouveau parsing HTML"""
+    return value.encode().decode() if isinstance(value, str) else value
+
+
+def product_fields(n):
+    """Champs réalistes (longueurs) du produit n, tels que renvoyés par le parsing"""
+    return {
+        "name": f"Chaussures Nike Air Max 90 Essential Homme Réf {n}",
+        "path": f"/Nike-Air-Max-90-Essential-Homme-p{n}.html",
+        "image": f"https://www.destockenligne.com/pic/upload/{n % 997}/{n}_1.jpg",
+        "old_price": f"{89 + n % 60},00 €",
+        "new_price": f"€ {49 + n % 40}.90",
+        "price_cents": 4990 + n % 40 * 100,
+        "economy": f"Economie : {20 + n % 50} %",
+    }
+
+
+def parse_dict(n):
+    fields = {k: _fresh(v) for k, v in product_fields(n).items()}
+    fields["url"] = "https://www.destockenligne.com" + fields["path"]
+    return fields
+
+
+def parse_record(n):
+    fields = {k: _fresh(v) for k, v in product_fields(n).items()}
+    return Product.make(**fields)
+
+
+def build_catalogue(parse, categories, pages, per_page, related=20, related_copies=3, sections=12):
+    """Caches d'un worker : listings, produits similaires, recherche, sections"""
+    total = categories * pages * per_page
+    listings = {}
+    for c in range(categories):
+        for p in range(pages):
+            start = (c * pages + p) * per_page
+            listings[(c, p)] = [parse(n) for n in range(start, start + per_page)]
+    # Chaque produit figure dans les « similaires » de `related_copies` pages produit
+    related_cache = {}
+    pages_with_related = total * related_copies // related
+    for i in range(pages_with_related):
+        start = (i * related) % total
+        related_cache[i] = [parse((start + k) % total) for k in range(related)]
+    search = {f"q{i}": [parse(n) for n in range(i, total, 7)] for i in range(7)}
+    home = {g: [parse(n) for n in range(i * sections, (i + 1) * sections)] for i, g in enumerate(("homme", "femme", "enfant"))}
+    return listings, related_cache, search, home, total
+
+
+def measure(parse, args):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    caches = build_catalogue(parse, args.categories, args.pages, args.per_page)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return used, caches[-1], caches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", type=int, default=60)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--per-page", type=int, default=30)
+    parser.add_argument("--budget-mb", type=float, default=64, help="mémoire allouée aux caches par worker")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for label, parse in (("dict", parse_dict), ("Product", parse_record)):
+        used, total, caches = measure(parse, args)
+        results[label] = used
+        per_product = used / total
+        capacity = int(args.budget_mb * 1024 * 1024 / per_product)
+        print(f"{label:8} {used / 1024 / 1024:8.1f} Mo pour {total} produits "
+              f"({per_product:6.0f} o/produit, toutes copies) -> ~{capacity} produits dans {args.budget_mb:g} Mo")
+        del caches
+    print(f"\nGain : x{results['dict'] / results['Product']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Débit de parsing du pipeline de crawl selon le nombre de processus.
+
+Les pages viennent des fixtures enregistrées (loadtest/fixtures, voir
+`fake_services.py --record`) ou, à défaut, du catalogue synthétique de
+fake_services.py. Aucun réseau : le téléchargement est remplacé par une
+lecture en mémoire, seul le parsing BeautifulSoup est mesuré. Le temps
+inclut le démarrage des processus.
+
+  python bench/bench_parse.py --pages 600 --workers 1,2,4,8
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "loadtest"))
+
+import crawl  # noqa: E402
+import scraper  # noqa: E402
+import fake_services  # noqa: E402
+
+
+def load_fixtures(directory, limit):
+    """{chemin: html} des pages enregistrées"""
+    pages = {}
+    if not os.path.isdir(directory):
+        return pages
+    for name in sorted(os.listdir(directory))[:limit]:
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), encoding="utf-8", errors="replace") as fh:
+                pages["/" + name.replace("__", "/")] = fh.read()
+    return pages
+
+
+def synthetic_pages(limit):
+    """Fiches produit et pages de listing du catalogue synthétique (4 fiches pour 1 listing)"""
+    catalogue = fake_services.Catalogue()
+    pages = {}
+    n = 0
+    while len(pages) < limit:
+        if n % 5 == 4:
+            cid, page = (n // 5) % catalogue.categories, (n // 5) // catalogue.categories % catalogue.pages + 1
+            pages[catalogue.category_path(cid, page)] = catalogue.listing(cid, page)
+        else:
+            product = catalogue.product(n)
+            pages[product["path"]] = catalogue.detail(n)
+        n += 1
+    return pages
+
+
+def run(pages, parse_workers):
+    by_url = {scraper.listing_url(path): html for path, html in pages.items()}
+    started = time.perf_counter()
+    errors = 0
+    with crawl.CrawlPipeline(fetch_workers=4, parse_workers=parse_workers, fetch=by_url.__getitem__,
+                             store=False) as pipeline:
+        for _path, _details, error in pipeline.products(pages):
+            errors += error is not None
+    return time.perf_counter() - started, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--fixtures", default=fake_services.FIXTURES_DIR)
+    parser.add_argument("--workers", default=None, help="nombres de processus à comparer (1,2,4,... par défaut)")
+    args = parser.parse_args(argv)
+
+    pages = load_fixtures(args.fixtures, args.pages)
+    source = f"fixtures {args.fixtures}"
+    if not pages:
+        pages = synthetic_pages(args.pages)
+        source = "catalogue synthétique (aucune fixture enregistrée)"
+    size = sum(len(html) for html in pages.values())
+    print(f"{len(pages)} pages, {size / 1024 / 1024:.1f} Mo ({source}), {os.cpu_count()} cœur(s)\n")
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        counts = sorted({1, 2, 4, cpus} | ({cpus * 2} if cpus > 1 else set()))
+    baseline, errors = run(pages, 0)
+    print(f"{'processus':>10} {'durée s':>8} {'pages/s':>8} {'accélération':>13}")
+    print(f"{'0 (inline)':>10} {baseline:8.2f} {len(pages) / baseline:8.0f} {1:12.2f}x"
+          + (f"  {errors} erreur(s)" if errors else ""))
+    for workers in counts:
+        duration, errors = run(pages, workers)
+        print(f"{workers:>10} {duration:8.2f} {len(pages) / duration:8.0f} {baseline / duration:12.2f}x"
+              + (f"  {errors} erreur(s)" if errors else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Instantané des caches de l'amont (catégories, sections, listings, fiches
+produit) pour démarrer un conteneur déjà chaud.
+
+Format : JSON versionné compressé gzip. Les produits sont dédoublonnés dans
+une table (un produit présent dans plusieurs listings n'est écrit qu'une
+fois) et rechargés via Product.make, donc à nouveau partagés entre les
+caches. Chaque entrée garde sa date de chargement : une entrée ancienne est
+servie périmée puis rafraîchie en arrière-plan, une entrée trop vieille
+(UPSTREAM_STALE_MAX_AGE) est ignorée. La recherche se fait sur les
+listings : elle est chaude avec eux.
+
+gunicorn (preload_app) charge l'instantané une fois dans le maître
+(when_ready) : les workers forkés partagent ces pages en copy-on-write.
+
+Variables d'environnement :
+  CACHE_SNAPSHOT_FILE      fichier de l'instantané (.cache/snapshot.json.gz ; vide = désactivé)
+  CACHE_SNAPSHOT_ON_EXIT   1 = un worker qui s'arrête réécrit l'instantané (0)
+"""
+import os
+import gzip
+import json
+import time
+import logging
+
+import metrics
+import stale_cache
+from models import Product
+
+log = logging.getLogger(__name__)
+
+CACHE_SNAPSHOT_FILE = os.getenv("CACHE_SNAPSHOT_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "snapshot.json.gz"))
+CACHE_SNAPSHOT_ON_EXIT = os.getenv("CACHE_SNAPSHOT_ON_EXIT", "0") == "1"
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotError(ValueError):
+    """Instantané illisible ou d'une autre version"""
+
+
+# ----------------- ENCODAGE -----------------
+class _Encoder:
+    def __init__(self):
+        self.products = []
+        self._index = {}
+
+    def encode(self, value):
+        if isinstance(value, Product):
+            fields = tuple(getattr(value, field) for field in Product.FIELDS)
+            index = self._index.get(fields)
+            if index is None:
+                index = self._index[fields] = len(self.products)
+                self.products.append(list(fields))
+            return {"$p": index}
+        if isinstance(value, tuple):
+            return {"$t": [self.encode(item) for item in value]}
+        if isinstance(value, list):
+            return [self.encode(item) for item in value]
+        if isinstance(value, dict):
+            if not all(isinstance(key, str) for key in value):
+                raise TypeError("clé de dictionnaire non textuelle")
+            return {key: self.encode(item) for key, item in value.items()}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        raise TypeError(f"type non sérialisable : {type(value).__name__}")
+
+
+def _decode(value, products):
+    if isinstance(value, list):
+        return [_decode(item, products) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if "$p" in value:
+                return products[value["$p"]]
+            if "$t" in value:
+                return tuple(_decode(item, products) for item in value["$t"])
+        return {key: _decode(item, products) for key, item in value.items()}
+    return value
+
+
+# ----------------- EXPORT / CHARGEMENT -----------------
+def export(path=CACHE_SNAPSHOT_FILE):
+    """Écrit l'instantané des caches du processus ; renvoie {cache: entrées écrites}"""
+    encoder = _Encoder()
+    caches, stats = {}, {}
+    for name, cache in stale_cache.registered_caches().items():
+        entries = []
+        for key, value, fetched_at in cache.export():
+            try:
+                entries.append([encoder.encode(key), encoder.encode(value), fetched_at])
+            except TypeError as e:
+                log.warning("Instantané : entrée %s %r ignorée (%s)", name, key, e)
+        caches[name] = entries
+        stats[name] = len(entries)
+    payload = {"version": SNAPSHOT_VERSION, "created_at": time.time(),
+               "products": encoder.products, "caches": caches}
+    data = gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                         compresslevel=6)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Temporaire puis renommage : un worker qui démarre ne lit jamais un fichier partiel
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    metrics.inc("cache_snapshot_total", operation="export")
+    log.info("Instantané écrit : %s (%d Ko, %d produits)", path, len(data) // 1024, len(encoder.products))
+    return stats
+
+
+def read(path=CACHE_SNAPSHOT_FILE):
+    """Contenu brut de l'instantané (SnapshotError si illisible ou d'une autre version)"""
+    try:
+        with gzip.open(path, "rb") as fh:
+            payload = json.loads(fh.read())
+    except (OSError, EOFError, ValueError) as e:
+        raise SnapshotError(f"instantané illisible {path}: {e}") from e
+    if not isinstance(payload, dict) or payload.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"version d'instantané non prise en charge : {payload.get('version')!r}"
+                            if isinstance(payload, dict) else "instantané mal formé")
+    return payload
+
+
+def load(path=CACHE_SNAPSHOT_FILE):
+    """Recharge l'instantané dans les caches du processus ; renvoie {cache: entrées rechargées}"""
+    if not path or not os.path.exists(path):
+        return {}
+    started = time.perf_counter()
+    try:
+        payload = read(path)
+    except SnapshotError as e:
+        log.warning("%s", e)
+        metrics.inc("cache_snapshot_total", operation="load_error")
+        return {}
+    products = [Product.make(*fields) for fields in payload["products"]]
+    caches = stale_cache.registered_caches()
+    stats = {}
+    for name, entries in payload["caches"].items():
+        cache = caches.get(name)
+        if cache is None:
+            continue
+        stats[name] = cache.restore((_decode(key, products), _decode(value, products), fetched_at)
+                                    for key, value, fetched_at in entries)
+    metrics.inc("cache_snapshot_total", operation="load")
+    log.info("Instantané rechargé en %.0f ms (créé il y a %.0f s) : %s",
+             (time.perf_counter() - started) * 1000, time.time() - payload["created_at"], stats)
+    return stats
+
+
+metrics.describe("cache_snapshot_total", "Instantanés des caches écrits ou rechargés")
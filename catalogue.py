@@ -0,0 +1,221 @@
+"""
+Catalogue local synchronisé par différence avec destockenligne.com.
+
+Un cycle de synchronisation relit les listings (pages catégories), compare
+chaque produit à la version enregistrée (empreinte nom / prix / ancien prix /
+économie) et ne télécharge la fiche produit que pour les produits nouveaux ou
+modifiés. Les autres fiches sont rafraîchies au fil de l'eau, les plus
+anciennes d'abord, par lots de CATALOGUE_REFRESH_BATCH. Un produit absent
+d'un listing relu en entier est marqué retiré (removed_at). Téléchargements
+et parsing passent par le pipeline de crawl.py (parsing multi-processus).
+
+Variables d'environnement :
+  CATALOGUE_DB              base SQLite du catalogue (.cache/catalogue.sqlite3)
+  CATALOGUE_REFRESH_AGE     âge en secondes au-delà duquel une fiche inchangée est relue (604800)
+  CATALOGUE_REFRESH_BATCH   fiches inchangées relues au plus par cycle (50)
+  CATALOGUE_MAX_PAGES       pages lues au plus par listing (20)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+from contextlib import nullcontext
+
+import crawl
+import scraper
+import upstream_limiter
+
+log = logging.getLogger(__name__)
+
+CATALOGUE_DB = os.getenv("CATALOGUE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "catalogue.sqlite3"))
+CATALOGUE_REFRESH_AGE = int(os.getenv("CATALOGUE_REFRESH_AGE", str(7 * 86400)))
+CATALOGUE_REFRESH_BATCH = int(os.getenv("CATALOGUE_REFRESH_BATCH", "50"))
+CATALOGUE_MAX_PAGES = int(os.getenv("CATALOGUE_MAX_PAGES", "20"))
+
+# Champs de la fiche conservés en base (les produits liés sont des objets du cache)
+DETAIL_FIELDS = ("title", "main_img", "new_price", "price_cents", "old_price", "economy", "sizes", "description")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    path TEXT PRIMARY KEY,
+    category TEXT,
+    name TEXT,
+    image TEXT,
+    price_cents INTEGER,
+    old_price TEXT,
+    economy TEXT,
+    fingerprint TEXT,
+    details TEXT,
+    details_at REAL,
+    first_seen REAL,
+    last_seen REAL,
+    removed_at REAL
+);
+CREATE INDEX IF NOT EXISTS products_details_at ON products (details_at);
+CREATE TABLE IF NOT EXISTS sync_runs (
+    started_at REAL,
+    finished_at REAL,
+    stats TEXT
+);
+"""
+
+
+# ----------------- BASE -----------------
+def connect(path=None):
+    path = path or CATALOGUE_DB
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(_SCHEMA)
+    return db
+
+
+def fingerprint(product):
+    """Empreinte des données de listing qui justifient de relire la fiche"""
+    raw = "\x1f".join(str(product.get(key) or "") for key in ("name", "price_cents", "old_price", "economy"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def get_product(path, db=None):
+    """Produit enregistré (dict, fiche décodée) ou None"""
+    own = db is None
+    db = db or connect()
+    try:
+        row = db.execute("SELECT * FROM products WHERE path = ?", (path,)).fetchone()
+    finally:
+        if own:
+            db.close()
+    if row is None:
+        return None
+    product = dict(row)
+    product["details"] = json.loads(product["details"]) if product["details"] else None
+    return product
+
+
+# ----------------- LISTINGS -----------------
+def _category_paths():
+    paths = list(scraper.GENDER_PATHS.values())
+    for brand in scraper.get_categories().get("brands", []):
+        if brand["path"] not in paths:
+            paths.append(brand["path"])
+    return paths
+
+
+def _crawl_listings(pipeline, paths, max_pages):
+    """{path produit: (catégorie, produit)}, catégories relues en entier, pages lues, pages en échec"""
+    seen = {}
+    pages = errors = 0
+    complete = set(paths)
+    for path, page, products, paging, error in pipeline.listings(paths, max_pages=max_pages):
+        # Page en échec ou listing tronqué : pas fiable pour les retraits
+        if error is not None or (paging.get("has_next") and page >= max_pages):
+            complete.discard(path)
+        if error is None:
+            pages += 1
+        else:
+            errors += 1
+        for product in products:
+            if product.path:
+                seen.setdefault(product.path, (path, product))
+    return seen, complete, pages, errors
+
+
+# ----------------- FICHES -----------------
+def _fetch_all_details(pipeline, paths):
+    """(path, fiche ou None) au fil des téléchargements"""
+    for path, details, error in pipeline.products(paths):
+        if error is not None:
+            log.warning("Fiche %s non relue: %s", path, error)
+            yield path, None
+        elif not details or details.get("is_category"):
+            yield path, None
+        else:
+            yield path, {key: details[key] for key in DETAIL_FIELDS if key in details}
+
+
+# ----------------- SYNCHRONISATION -----------------
+def sync(categories=None, max_pages=CATALOGUE_MAX_PAGES, refresh_batch=CATALOGUE_REFRESH_BATCH,
+         refresh_age=CATALOGUE_REFRESH_AGE, db_path=None, pipeline=None):
+    """Un cycle de synchronisation ; renvoie les compteurs du cycle.
+
+    pipeline : CrawlPipeline déjà ouvert (par défaut, un pipeline le temps du cycle).
+    """
+    started = time.time()
+    stats = {"listing_pages": 0, "listing_errors": 0, "seen": 0, "new": 0, "changed": 0, "unchanged": 0,
+             "restored": 0, "removed": 0, "refreshed": 0, "detail_fetches": 0, "detail_errors": 0}
+    db = connect(db_path)
+    try:
+        with upstream_limiter.background(), (nullcontext(pipeline) if pipeline else crawl.CrawlPipeline()) as pipeline:
+            paths = list(categories) if categories else _category_paths()
+            seen, complete, stats["listing_pages"], stats["listing_errors"] = _crawl_listings(pipeline, paths,
+                                                                                             max_pages)
+            stats["seen"] = len(seen)
+
+            stored = {row["path"]: row for row in db.execute(
+                "SELECT path, fingerprint, removed_at FROM products")}
+            to_fetch = []
+            with db:
+                for path, (category, product) in seen.items():
+                    row = stored.get(path)
+                    digest = fingerprint(product)
+                    if row is None:
+                        stats["new"] += 1
+                        to_fetch.append(path)
+                    elif row["fingerprint"] != digest:
+                        stats["changed"] += 1
+                        to_fetch.append(path)
+                    else:
+                        stats["unchanged"] += 1
+                    if row is not None and row["removed_at"]:
+                        # Produit revenu : sa fiche a pu changer pendant son absence
+                        stats["restored"] += 1
+                        if to_fetch[-1:] != [path]:
+                            to_fetch.append(path)
+                    db.execute(
+                        "INSERT INTO products (path, category, name, image, price_cents, old_price, economy,"
+                        " fingerprint, first_seen, last_seen, removed_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)"
+                        " ON CONFLICT(path) DO UPDATE SET category = excluded.category, name = excluded.name,"
+                        " image = excluded.image, price_cents = excluded.price_cents,"
+                        " old_price = excluded.old_price, economy = excluded.economy,"
+                        " fingerprint = excluded.fingerprint, last_seen = excluded.last_seen, removed_at = NULL",
+                        (path, category, product.name, product.image, product.price_cents,
+                         product.old_price, product.economy, digest, started, started))
+
+                # Retraits : seulement pour les catégories relues en entier pendant ce cycle
+                for category in complete:
+                    stats["removed"] += db.execute(
+                        "UPDATE products SET removed_at = ? WHERE category = ? AND last_seen < ?"
+                        " AND removed_at IS NULL", (started, category, started)).rowcount
+
+            # Longue traîne : fiches jamais lues ou les plus anciennes, hors celles déjà prévues
+            scheduled = set(to_fetch)
+            if refresh_batch > 0:
+                rows = db.execute(
+                    "SELECT path FROM products WHERE removed_at IS NULL"
+                    " AND (details_at IS NULL OR details_at < ?) ORDER BY details_at LIMIT ?",
+                    (started - refresh_age, refresh_batch + len(scheduled))).fetchall()
+                stale = [row["path"] for row in rows if row["path"] not in scheduled][:refresh_batch]
+                stats["refreshed"] = len(stale)
+                to_fetch.extend(stale)
+
+            for path, details in _fetch_all_details(pipeline, to_fetch):
+                stats["detail_fetches"] += 1
+                if details is None:
+                    stats["detail_errors"] += 1
+                    continue
+                with db:
+                    db.execute("UPDATE products SET details = ?, details_at = ? WHERE path = ?",
+                               (json.dumps(details, ensure_ascii=False), time.time(), path))
+
+        stats["duration"] = round(time.time() - started, 2)
+        with db:
+            db.execute("INSERT INTO sync_runs (started_at, finished_at, stats) VALUES (?, ?, ?)",
+                       (started, time.time(), json.dumps(stats)))
+    finally:
+        db.close()
+    log.info("Synchronisation catalogue : %s", stats)
+    return stats
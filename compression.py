@@ -0,0 +1,128 @@
+"""
+Compression des réponses HTML / JSON / texte (brotli si le client l'accepte,
+sinon gzip), y compris les pages envoyées en flux : chaque morceau est
+compressé puis vidé (flush) pour que le navigateur l'affiche aussitôt.
+
+Les pages du cache anonyme (response_cache) gardent leurs variantes
+compressées à côté du corps : une page n'est compressée qu'une fois par
+encodage, pas à chaque requête. L'ETag devient faible (W/"...") sur les
+réponses compressées, ce qui garde les 304 valides pour toutes les variantes.
+
+Variables d'environnement :
+  COMPRESS_ENABLED     "0" pour désactiver la compression (activée par défaut)
+  COMPRESS_MIN_SIZE    taille min en octets d'un corps compressé (1024)
+  COMPRESS_GZIP_LEVEL  niveau gzip (6)
+  COMPRESS_BR_QUALITY  qualité brotli des réponses dynamiques (5)
+"""
+import os
+import zlib
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "1") != "0"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "5"))
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/plain", "text/css", "text/xml", "text/javascript",
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+}
+
+
+# ----------------- ENCODAGES -----------------
+def negotiate(mimetype, size=None):
+    """Encodage à utiliser pour la requête en cours ("br", "gzip") ou None"""
+    if not COMPRESS_ENABLED or mimetype not in COMPRESSIBLE_MIMETYPES:
+        return None
+    if size is not None and size < COMPRESS_MIN_SIZE:
+        return None
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding):
+    """Corps compressé en une fois"""
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BR_QUALITY)
+    compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """Compresse un flux morceau par morceau, chaque morceau vidé aussitôt"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESS_BR_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            if data:
+                yield process(data) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def mark_encoded(response, encoding):
+    """En-têtes d'une réponse dont le corps est déjà compressé"""
+    response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+# ----------------- MIDDLEWARE -----------------
+def compress_response(response):
+    """after_request : compresse les réponses qui s'y prêtent"""
+    if (response.status_code != 200 or response.direct_passthrough or response.content_encoding
+            or "no-transform" in response.headers.get("Cache-Control", "")):
+        return response
+    if response.is_streamed:
+        encoding = negotiate(response.mimetype)
+        if encoding:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+            mark_encoded(response, encoding)
+            metrics.inc("compressed_responses_total", encoding=encoding, mode="stream")
+        return response
+
+    data = response.get_data()
+    encoding = negotiate(response.mimetype, len(data))
+    if encoding is None:
+        if response.mimetype in COMPRESSIBLE_MIMETYPES:
+            response.vary.add("Accept-Encoding")
+        return response
+    with metrics.track("compression", encoding):
+        body = compress(data, encoding)
+    response.set_data(body)
+    mark_encoded(response, encoding)
+    metrics.inc("compressed_responses_total", encoding=encoding, mode="body")
+    metrics.inc("compression_saved_bytes_total", len(data) - len(body))
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
+
+
+metrics.describe("compressed_responses_total", "Réponses compressées par encodage")
+metrics.describe("compression_saved_bytes_total", "Octets économisés par la compression des réponses")
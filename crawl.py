@@ -0,0 +1,160 @@
+"""
+Pipeline de crawl : téléchargements et parsing séparés.
+
+Les pages sont téléchargées par des threads (limiteur amont, priorité de
+fond) et parsées par BeautifulSoup dans un pool de processus : le parsing
+tient le GIL, des threads ne l'accélèrent pas, des processus l'étalent sur
+tous les cœurs. Les résultats sont rendus au fil de l'eau, dans l'ordre
+d'arrivée, et enregistrés dans les caches du scraper. Le HTML en attente de
+parsing est borné (quelques pages par processus).
+
+Variables d'environnement :
+  CRAWL_FETCH_WORKERS   téléchargements en parallèle (8)
+  CRAWL_PARSE_WORKERS   processus de parsing (un par cœur ; 0 = parsing dans le processus courant)
+"""
+import os
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import metrics
+import scraper
+import upstream_limiter
+
+log = logging.getLogger(__name__)
+
+CRAWL_FETCH_WORKERS = int(os.getenv("CRAWL_FETCH_WORKERS", "8"))
+CRAWL_PARSE_WORKERS = int(os.getenv("CRAWL_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Pages téléchargées en attente de parsing, par processus
+PARSE_BACKLOG = 2
+
+
+class _InlineExecutor:
+    """Exécution immédiate dans le processus courant (CRAWL_PARSE_WORKERS=0)"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class CrawlPipeline:
+    """Téléchargements en threads, parsing en processus ; à utiliser dans un bloc `with`.
+
+    `fetch(url) -> html` remplace le téléchargement (benchmark, tests) ;
+    store=False n'écrit pas les résultats dans les caches du scraper.
+    """
+
+    def __init__(self, fetch_workers=CRAWL_FETCH_WORKERS, parse_workers=CRAWL_PARSE_WORKERS,
+                 fetch=None, store=True):
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(0, parse_workers)
+        self.fetch = fetch or scraper.fetch_html
+        self.store = store
+        self._fetch_pool = None
+        self._parse_pool = None
+
+    def __enter__(self):
+        if self.parse_workers:
+            # spawn : pas de fork d'un processus qui a déjà des threads (verrous du logging, pools)
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                   mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._parse_pool = _InlineExecutor()
+        self._fetch_pool = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="crawl")
+        return self
+
+    def __exit__(self, *exc):
+        self._fetch_pool.shutdown(wait=True, cancel_futures=True)
+        self._parse_pool.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch(self, url):
+        with upstream_limiter.background():
+            return self.fetch(url)
+
+    def _run(self, tasks, parser, follow=None):
+        """(clé, résultat, erreur) pour chaque tâche (clé, url, arguments du parser).
+
+        follow(clé, résultat) peut renvoyer de nouvelles tâches (page suivante).
+        """
+        tasks = iter(tasks)
+        queue = deque()
+        fetching, parsing = {}, {}
+        in_flight = self.fetch_workers + PARSE_BACKLOG * max(1, self.parse_workers)
+        exhausted = False
+        while True:
+            while len(fetching) + len(parsing) < in_flight:
+                if queue:
+                    task = queue.popleft()
+                elif not exhausted:
+                    task = next(tasks, None)
+                    exhausted = task is None
+                    if exhausted:
+                        break
+                else:
+                    break
+                key, url, args = task
+                fetching[self._fetch_pool.submit(self._fetch, url)] = (key, args)
+            if not fetching and not parsing:
+                return
+            done, _ = wait([*fetching, *parsing], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetching:
+                    key, args = fetching.pop(future)
+                    try:
+                        html = future.result()
+                    except Exception as e:
+                        metrics.inc("crawl_pages_total", stage="fetch", result="error")
+                        yield key, None, e
+                        continue
+                    parsing[self._parse_pool.submit(parser, html, *args)] = key
+                    continue
+                key = parsing.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    metrics.inc("crawl_pages_total", stage="parse", result="error")
+                    yield key, None, e
+                    continue
+                metrics.inc("crawl_pages_total", stage="parse", result="ok")
+                if follow:
+                    queue.extend(follow(key, result))
+                yield key, result, None
+
+    def listings(self, paths, max_pages=1):
+        """(path, page, produits, pagination, erreur) des listings ; page suivante tant que has_next"""
+        def task(path, page):
+            return (path, page), scraper.listing_url(path, page), (path, page)
+
+        def follow(key, result):
+            path, page = key
+            if result[1].get("has_next") and page < max_pages:
+                yield task(path, page + 1)
+
+        for (path, page), result, error in self._run((task(path, 1) for path in paths),
+                                                     scraper.parse_listing, follow):
+            if error is not None:
+                log.warning("Erreur listing %s page %s: %s", path, page, error)
+                yield path, page, [], {}, error
+                continue
+            if self.store:
+                scraper.store_listing(path, page, result)
+            yield path, page, result[0], result[1], None
+
+    def products(self, paths):
+        """(path, détails, erreur) des fiches produit"""
+        tasks = ((path, scraper.listing_url(path), (path,)) for path in paths)
+        for path, details, error in self._run(tasks, scraper.parse_product):
+            if error is None and self.store:
+                scraper.store_product_details(path, details)
+            yield path, details, error
+
+
+metrics.describe("crawl_pages_total", "Pages du pipeline de crawl par étape (téléchargement, parsing)")
@@ -0,0 +1,100 @@
+"""
+Configuration gunicorn de production.
+
+L'application passe l'essentiel de son temps à attendre destockenligne.com,
+Supabase et Stripe : on utilise des workers à threads (gthread) pour qu'une
+requête bloquée sur l'amont n'immobilise pas tout un processus.
+
+Variables d'environnement :
+  PORT                   port d'écoute (5000)
+  WEB_CONCURRENCY        nombre de workers (2 x CPU + 1, CPU du conteneur, au plus
+                         GUNICORN_MAX_WORKERS = 9)
+  GUNICORN_THREADS       threads par worker gthread (8)
+  METRICS_DIR            état des métriques de chaque worker, fusionné par /metrics
+                         (répertoire temporaire propre à ce maître par défaut)
+  GUNICORN_ACCESSLOG     journal d'accès gunicorn (désactivé : l'application
+                         écrit le sien via la file de app_logging, cf. LOG_ACCESS)
+"""
+import os
+import tempfile
+from threading import Thread
+
+# Avant le préchargement de l'application : metrics lit METRICS_DIR à l'import
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"shop-metrics-{os.getpid()}"))
+
+import upstream_limiter  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+worker_class = "gthread"
+workers = upstream_limiter.default_workers()
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import de l'application une seule fois dans le maître (copy-on-write)
+preload_app = True
+
+# Un amont lent ne doit pas faire tuer le worker avant le timeout du scraper (12 s)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recyclage progressif des workers (limite la dérive mémoire des caches)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+# Écriture synchrone dans le worker : remplacée par le journal "access" de l'application
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None
+errorlog = "-"
+
+
+def on_starting(server):
+    """Vide le répertoire des métriques d'une exécution précédente"""
+    import metrics
+    metrics.prepare_dir()
+
+
+def when_ready(server):
+    """Recharge l'instantané des caches dans le maître : les workers le partagent en copy-on-write"""
+    import gc
+    import cache_snapshot
+    import metrics
+    stats = cache_snapshot.load()
+    if stats:
+        server.log.info("Instantané des caches rechargé : %s", stats)
+    # Mesures du préchargement comptées une fois, pas héritées par chaque worker
+    metrics.archive_process()
+    # Objets du maître hors du ramasse-miettes : ses passages n'écrivent plus dans
+    # leurs pages, qui restent partagées avec les workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Relance le thread de journalisation et préchauffe les caches du worker"""
+    import app_logging
+    import metrics
+    from app_supabase import warm_caches
+    # Le thread d'écriture des logs du maître n'a pas survécu au fork
+    app_logging.configure_logging()
+    # Nombre réel de workers (ligne de commande, WEB_CONCURRENCY ou défaut) : part du débit amont
+    upstream_limiter.configure_web_worker(server.cfg.workers)
+    metrics.start_worker()
+    Thread(target=warm_caches, args=(server.app.wsgi(),), daemon=True).start()
+    server.log.info("Worker %s: préchauffage des caches lancé", worker.pid)
+
+
+def worker_exit(server, worker):
+    """Dernières métriques du worker ; réécrit l'instantané des caches (CACHE_SNAPSHOT_ON_EXIT=1)"""
+    import cache_snapshot
+    import metrics
+    metrics.flush()
+    if cache_snapshot.CACHE_SNAPSHOT_ON_EXIT and cache_snapshot.CACHE_SNAPSHOT_FILE:
+        try:
+            cache_snapshot.export()
+        except Exception as e:
+            server.log.warning("Worker %s: instantané non écrit (%s)", worker.pid, e)
+
+
+def child_exit(server, worker):
+    """Maître : les compteurs du worker arrêté (recyclé ou tué) vont à l'archive des métriques"""
+    import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,239 @@
+"""
+Proxy d'images produits avec cache disque et variantes redimensionnées
+"""
+import os
+import io
+import hashlib
+import logging
+from threading import Lock
+from urllib.parse import urlparse
+
+import requests
+
+import upstream_limiter
+
+log = logging.getLogger(__name__)
+
+# Configuration
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "images"))
+CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024
+FETCH_TIMEOUT = 10
+# Bornes d'une image source : taille téléchargée et pixels décodés (bombes de décompression)
+IMAGE_MAX_BYTES = int(float(os.getenv("IMAGE_MAX_MB", "10")) * 1024 * 1024)
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(40_000_000)))
+DOWNLOAD_CHUNK = 64 * 1024
+ALLOWED_HOSTS = {"www.destockenligne.com", "destockenligne.com"}
+if os.getenv("SCRAPER_BASE_URL"):
+    ALLOWED_HOSTS.add(urlparse(os.getenv("SCRAPER_BASE_URL")).hostname)
+
+# Côté max (px) de chaque variante ; None = image d'origine
+VARIANTS = {
+    "mini": 96,       # sidebar (40px) et panier (60px), écrans haute densité
+    "card": 480,      # vignettes des grilles produits
+    "product": 1000,  # image principale de la fiche produit
+    "orig": None,
+}
+QUALITY = {"webp": 78, "jpeg": 82}
+MIME_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+_session = requests.Session()
+_pil = None
+_locks = [Lock() for _ in range(64)]
+_evict_lock = Lock()
+_stored_bytes = None
+
+
+class ImageProxyError(Exception):
+    """Image non autorisée ou indisponible"""
+
+
+def is_proxyable(url):
+    """Vrai si l'URL pointe vers une image du site source"""
+    if not url or not url.startswith(("http://", "https://")):
+        return False
+    return urlparse(url).hostname in ALLOWED_HOSTS
+
+
+def _key(*parts):
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+
+def _lock_for(key):
+    """Verrou par fichier (réparti sur un jeu fixe) pour ne télécharger qu'une fois"""
+    return _locks[hash(key) % len(_locks)]
+
+
+def _sniff_mime(path):
+    """Type MIME d'une image d'origine d'après ses premiers octets"""
+    with open(path, "rb") as fh:
+        head = fh.read(12)
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _write_atomic(path, data):
+    """Écrit le fichier via un temporaire pour ne jamais servir un fichier partiel"""
+    global _stored_bytes
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    if _stored_bytes is not None:
+        _stored_bytes += len(data)
+    _evict_if_needed()
+
+
+def _touch(path):
+    """Marque un fichier comme récemment utilisé (LRU basé sur mtime)"""
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _evict_if_needed():
+    """Supprime les fichiers les moins récemment utilisés au-delà du budget"""
+    global _stored_bytes
+    with _evict_lock:
+        if _stored_bytes is None or _stored_bytes > CACHE_MAX_BYTES:
+            entries = []
+            for entry in os.scandir(CACHE_DIR):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            if total > CACHE_MAX_BYTES:
+                entries.sort()
+                # On redescend à 90 % pour ne pas évincer à chaque écriture
+                target = CACHE_MAX_BYTES * 0.9
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+            _stored_bytes = total
+
+
+def _fetch_source(url):
+    """Télécharge l'image d'origine une seule fois et la garde sur disque"""
+    path = os.path.join(CACHE_DIR, _key(url) + ".src")
+    if os.path.exists(path):
+        _touch(path)
+        with open(path, "rb") as fh:
+            return fh.read()
+    with _lock_for(path):
+        if os.path.exists(path):
+            with open(path, "rb") as fh:
+                return fh.read()
+        if not upstream_limiter.acquire():
+            raise ImageProxyError(f"Débit amont saturé: {url}")
+        try:
+            response = _session.get(url, timeout=FETCH_TIMEOUT, stream=True)
+        except requests.RequestException as e:
+            if isinstance(e, requests.Timeout):
+                upstream_limiter.record_failure()
+            raise ImageProxyError(f"Erreur image {url}: {e}")
+        with response:
+            upstream_limiter.record_response(response.status_code, response.headers.get("Retry-After"))
+            try:
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise ImageProxyError(f"Erreur image {url}: {e}")
+            if not response.headers.get("Content-Type", "image/").startswith("image/"):
+                raise ImageProxyError(f"Contenu non image: {url}")
+            data = _read_limited(response, url)
+        _write_atomic(path, data)
+        return data
+
+
+def _read_limited(response, url):
+    """Corps de la réponse, lu par morceaux et abandonné au-delà de IMAGE_MAX_BYTES"""
+    try:
+        announced = int(response.headers.get("Content-Length") or 0)
+    except ValueError:
+        announced = 0
+    if announced > IMAGE_MAX_BYTES:
+        raise ImageProxyError(f"Image trop lourde ({announced} octets): {url}")
+    chunks, size = [], 0
+    try:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK):
+            size += len(chunk)
+            if size > IMAGE_MAX_BYTES:
+                raise ImageProxyError(f"Image trop lourde (plus de {IMAGE_MAX_BYTES} octets): {url}")
+            chunks.append(chunk)
+    except requests.RequestException as e:
+        raise ImageProxyError(f"Erreur image {url}: {e}")
+    return b"".join(chunks)
+
+
+def _pil_image():
+    """Module PIL.Image, importé au premier usage (None si Pillow est absent)"""
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image
+        except ImportError:  # Pillow optionnel : on sert alors l'image d'origine
+            Image = False
+        _pil = Image
+    return _pil or None
+
+
+def _render_variant(data, size, fmt):
+    """Redimensionne et ré-encode l'image"""
+    with _pil_image().open(io.BytesIO(data)) as img:
+        # open() ne lit que l'en-tête : dimensions vérifiées avant tout décodage
+        if img.width * img.height > IMAGE_MAX_PIXELS:
+            raise ImageProxyError(f"Image trop grande ({img.width}x{img.height})")
+        img.thumbnail((size, size))
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode == "P":
+            img = img.convert("RGBA")
+        out = io.BytesIO()
+        img.save(out, format=fmt.upper(), quality=QUALITY[fmt], optimize=True)
+        return out.getvalue()
+
+
+def get_image(url, variant="orig", accept_webp=False):
+    """Retourne (chemin du fichier en cache, type MIME, etag) pour une variante"""
+    if not is_proxyable(url):
+        raise ImageProxyError(f"Hôte non autorisé: {url}")
+    if variant not in VARIANTS:
+        variant = "orig"
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    size = VARIANTS[variant]
+    if size is None or _pil_image() is None:
+        _fetch_source(url)
+        path = os.path.join(CACHE_DIR, _key(url) + ".src")
+        return path, _sniff_mime(path), _key(url, "orig")
+
+    fmt = "webp" if accept_webp else "jpeg"
+    etag = _key(url, variant, fmt)
+    path = os.path.join(CACHE_DIR, f"{etag}.{fmt}")
+    if os.path.exists(path):
+        _touch(path)
+        return path, MIME_TYPES[fmt], etag
+
+    # Source récupérée hors du verrou de variante : un seul verrou tenu à la fois
+    source = _fetch_source(url)
+    with _lock_for(path):
+        if not os.path.exists(path):
+            try:
+                _write_atomic(path, _render_variant(source, size, fmt))
+            except ImageProxyError:
+                raise
+            except Exception as e:
+                # Format non supporté par Pillow : on sert l'original
+                log.warning("Erreur redimensionnement %s: %s", url, e)
+                path = os.path.join(CACHE_DIR, _key(url) + ".src")
+                return path, _sniff_mime(path), _key(url, "orig")
+    return path, MIME_TYPES[fmt], etag
@@ -0,0 +1,504 @@
+"""
+Services factices pour tester la charge hors ligne : destockenligne.com,
+Supabase (auth + PostgREST) et Stripe (checkout + webhook), avec latence
+configurable. Aucune requête ne sort de la machine.
+
+  python loadtest/fake_services.py --latency 0.15 --jitter 0.05
+
+puis, dans un autre terminal (les variables sont affichées au démarrage) :
+
+  SCRAPER_BASE_URL=http://127.0.0.1:9101 SUPABASE_URL=http://127.0.0.1:9102 \\
+  SUPABASE_ANON_KEY=<clé affichée> STRIPE_API_BASE=http://127.0.0.1:9103 \\
+  STRIPE_SECRET_KEY=sk_test_fake STRIPE_WEBHOOK_SECRET=whsec_fake \\
+  gunicorn -c gunicorn.conf.py -b 127.0.0.1:8000 "app_supabase:create_app()"
+
+  python loadtest/loadtest.py http://127.0.0.1:8000 --scenario shop -c 16 -d 60
+
+Amont : les pages enregistrées de --fixtures sont servies telles quelles
+(--record URL enregistre les pages manquantes depuis le vrai site) ; sinon
+une page synthétique au format de destockenligne.com est générée (catalogue
+déterministe : --categories, --pages, --per-page).
+"""
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+GENDER_CATEGORIES = {100: "Chaussures-Homme", 101: "Chaussures-Femme", 102: "Chaussures-Enfant"}
+BRANDS = ["Nike", "Adidas", "New Balance", "Puma", "Asics", "Reebok", "Vans", "Converse"]
+WEBHOOK_SECRET = "whsec_fake"
+
+
+def _fake_jwt(payload):
+    """Jeton au format JWT (non signé) : les SDK vérifient seulement sa forme"""
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    return f"{part({'alg': 'HS256', 'typ': 'JWT'})}.{part(payload)}.c2lnbmF0dXJl"
+
+
+ANON_KEY = _fake_jwt({"role": "anon", "iss": "supabase"})
+
+
+class Latency:
+    """Délai (gaussien) et taux d'erreur 5xx appliqués à chaque requête"""
+
+    def __init__(self, mean=0.0, jitter=0.0, error_rate=0.0):
+        self.mean = mean
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def wait(self):
+        if self.mean or self.jitter:
+            time.sleep(max(0.0, random.gauss(self.mean, self.jitter)))
+        return random.random() >= self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = Latency()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def body(self):
+        return self._body
+
+    def json_body(self):
+        return json.loads(self._body) if self._body else {}
+
+    def dispatch(self):
+        # Corps toujours lu (même ignoré) : la connexion keep-alive reste alignée
+        length = int(self.headers.get("Content-Length") or 0)
+        self._body = self.rfile.read(length) if length else b""
+        if not self.latency.wait():
+            return self.send(503, {"message": "erreur injectée"})
+        return self.route(urlparse(self.path))
+
+    do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = dispatch
+
+
+# ----------------- DESTOCKENLIGNE -----------------
+class Catalogue:
+    """Pages synthétiques reprenant les sélecteurs lus par scraper.py"""
+
+    def __init__(self, categories=30, pages=5, per_page=30):
+        self.categories = categories
+        self.pages = pages
+        self.per_page = per_page
+
+    def category_name(self, cid):
+        return GENDER_CATEGORIES.get(cid) or f"{BRANDS[cid % len(BRANDS)].replace(' ', '-')}-{cid}"
+
+    def category_path(self, cid, page=1):
+        suffix = f"_{page}" if page > 1 else ""
+        return f"/{self.category_name(cid)}-c{cid}{suffix}.html"
+
+    def product(self, n):
+        brand = BRANDS[n % len(BRANDS)]
+        supplier = 25 + n % 60
+        return {
+            "name": f"{brand} Sneaker Modele {n}",
+            "path": f"/{brand.replace(' ', '-')}-Sneaker-Modele-{100000 + n}.html",
+            "image": f"/pic/upload/{n % 97}.jpg",
+            "price": f"{supplier},00 €",
+            "old_price": f"{supplier + 20},00 €",
+            "economy": f"Economie : {20 + n % 40} %",
+        }
+
+    def _card(self, n):
+        p = self.product(n)
+        return (f"<ul class='re00'><li class='hw1'><a href='{p['path']}'><img src='{p['image']}'></a></li>"
+                f"<li class='hw2'><a href='{p['path']}'>{p['name']}</a><s>{p['old_price']}</s>"
+                f"<span>{p['price']}</span><span>{p['economy']}</span></li></ul>")
+
+    def _sidebar(self):
+        items = []
+        for i, header in enumerate(("Homme", "Femme", "Marques")):
+            links = "".join(f"<p class='insort1'><a href='{self.category_path(cid)}'>{self.category_name(cid)}</a></p>"
+                            for cid in range(i, self.categories, 3))
+            items.append(f"<div><p class='insort0'>{header}</p>{links}</div>")
+        return f"<div class='sideBar_left'>{''.join(items)}</div>"
+
+    def _prohref(self, cid):
+        links = []
+        for k in range(12):
+            p = self.product(cid * 1000 + 500 + k)
+            links.append(f"<span class='price'>{p['price']}</span>"
+                         f"<a href='{p['path']}' title='{p['name']}'><img src='{p['image']}'></a>")
+        return f"<div id='prohref'>{''.join(links)}</div>"
+
+    def _page(self, title, body):
+        return f"<html><head><title>{title}</title></head><body>{self._sidebar()}{body}</body></html>"
+
+    def home(self):
+        return self._page("Accueil", self._prohref(100))
+
+    def listing(self, cid, page):
+        page = min(max(page, 1), self.pages)
+        start = cid * 1000 + (page - 1) * self.per_page
+        cards = "".join(self._card(n) for n in range(start, start + self.per_page))
+        options = "".join(f"<option value='{i}'>{i}</option>" for i in range(1, self.pages + 1))
+        nav = ""
+        if page > 1:
+            nav += f"<a href='{self.category_path(cid, page - 1)}'>Prev</a>"
+        if page < self.pages:
+            nav += f"<a href='{self.category_path(cid, page + 1)}'>Next</a>"
+        showpage = (f"<div id='showpage'>Total {self.pages * self.per_page} items "
+                    f"<select name='page'>{options}</select>{nav}</div>")
+        bar = f"<div id='bar'><a href='/'>Accueil</a> &gt; <b>{self.category_name(cid)}</b></div>"
+        return self._page(self.category_name(cid), bar + self._prohref(cid) + cards + showpage)
+
+    def detail(self, n):
+        p = self.product(n)
+        sizes = "".join(f"<option value='{s}'>{s}</option>" for s in range(38, 46))
+        related = "".join(self._card(n + k) for k in range(1, 9))
+        return self._page(p["name"], (
+            f"<div id='bar'><a href='/'>Accueil</a> &gt; <b>{p['name']}</b></div>"
+            f"<div class='h_name'>{p['name']}</div>"
+            f"<div class='views_pics'><img src='{p['image']}'></div>"
+            f"<b style='color:red'>{p['price']}</b><s>{p['old_price']}</s>"
+            f"<select name='hw_sizeone'><option value=''>Taille</option>{sizes}</select>"
+            f"<div id='Content'><div class='con_bot'>Description du modèle {n}.</div></div>"
+            f"{related}"))
+
+
+_CATEGORY_RE = re.compile(r"-c(\d+)(?:_(\d+))?\.html$")
+_PRODUCT_RE = re.compile(r"-(\d+)\.html$")
+_image_cache = {}
+
+
+def _image(n):
+    """Petite image JPEG (une couleur par numéro) ; GIF 1x1 sans Pillow"""
+    if n not in _image_cache:
+        try:
+            from io import BytesIO
+            from PIL import Image
+
+            out = BytesIO()
+            Image.new("RGB", (600, 600), ((n * 37) % 256, (n * 67) % 256, (n * 97) % 256)).save(out, "JPEG")
+            _image_cache[n] = (out.getvalue(), "image/jpeg")
+        except ImportError:
+            _image_cache[n] = (base64.b64decode("R0lGODlhAQABAAAAACw="), "image/gif")
+    return _image_cache[n]
+
+
+class UpstreamHandler(_Handler):
+    catalogue = Catalogue()
+    fixtures = FIXTURES_DIR
+    record_from = None
+
+    def _fixture_path(self, path):
+        name = path.strip("/").replace("/", "__") or "index.html"
+        return os.path.join(self.fixtures, name)
+
+    def _recorded(self, path):
+        fixture = self._fixture_path(path)
+        if os.path.exists(fixture):
+            with open(fixture, "rb") as fh:
+                return fh.read()
+        if self.record_from:
+            response = requests.get(self.record_from.rstrip("/") + path, timeout=20,
+                                    headers={"User-Agent": "Mozilla/5.0"})
+            if response.ok and response.content:
+                os.makedirs(self.fixtures, exist_ok=True)
+                with open(fixture, "wb") as fh:
+                    fh.write(response.content)
+                return response.content
+        return None
+
+    def route(self, url):
+        path = url.path
+        if path.startswith("/pic/"):
+            match = re.search(r"(\d+)\.\w+$", path)
+            body, mimetype = _image(int(match.group(1)) if match else 0)
+            return self.send(200, body, mimetype)
+        recorded = self._recorded(path)
+        if recorded is not None:
+            return self.send(200, recorded, "text/html; charset=utf-8")
+        if path in ("/", "/index.html"):
+            return self.send(200, self.catalogue.home(), "text/html; charset=utf-8")
+        match = _CATEGORY_RE.search(path)
+        if match:
+            return self.send(200, self.catalogue.listing(int(match.group(1)), int(match.group(2) or 1)),
+                             "text/html; charset=utf-8")
+        match = _PRODUCT_RE.search(path)
+        if match:
+            return self.send(200, self.catalogue.detail(int(match.group(1)) - 100000), "text/html; charset=utf-8")
+        return self.send(404, "introuvable", "text/html")
+
+
+# ----------------- SUPABASE -----------------
+class SupabaseState:
+    """Utilisateurs, jetons et tables en mémoire"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = {}
+        self.tokens = {}
+        self.tables = defaultdict(list)
+        self.next_id = 1
+
+
+def _user_json(user):
+    return {"id": user["id"], "aud": "authenticated", "role": "authenticated", "email": user["email"],
+            "app_metadata": {"provider": "email"}, "user_metadata": {},
+            "created_at": user["created_at"], "confirmed_at": user["created_at"]}
+
+
+def _matches(row, filters):
+    for column, value in filters:
+        op, _, expected = value.partition(".")
+        actual = row.get(column)
+        if op == "eq" and str(actual) != expected:
+            return False
+        if op == "neq" and str(actual) == expected:
+            return False
+        if op == "in" and str(actual) not in expected.strip("()").split(","):
+            return False
+    return True
+
+
+class SupabaseHandler(_Handler):
+    state = SupabaseState()
+
+    def route(self, url):
+        path, query = url.path, parse_qs(url.query)
+        if path.startswith("/auth/v1/"):
+            return self.auth(path[len("/auth/v1/"):], query)
+        if path.startswith("/rest/v1/"):
+            return self.rest(path[len("/rest/v1/"):], query)
+        return self.send(404, {"message": "introuvable"})
+
+    def _session(self, user):
+        token = _fake_jwt({"sub": user["id"], "email": user["email"], "role": "authenticated",
+                           "exp": int(time.time()) + 3600})
+        with self.state.lock:
+            self.state.tokens[token] = user
+        return {"access_token": token, "refresh_token": uuid.uuid4().hex, "token_type": "bearer",
+                "expires_in": 3600, "expires_at": int(time.time()) + 3600, "user": _user_json(user)}
+
+    def auth(self, action, query):
+        state = self.state
+        if action == "signup" and self.command == "POST":
+            data = self.json_body()
+            with state.lock:
+                if data.get("email") in state.users:
+                    return self.send(422, {"code": 422, "error_code": "user_already_exists",
+                                           "msg": "User already registered"})
+                user = state.users[data["email"]] = {
+                    "id": str(uuid.uuid4()), "email": data["email"], "password": data.get("password"),
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+            return self.send(200, self._session(user))
+        if action == "token" and self.command == "POST":
+            data = self.json_body()
+            user = state.users.get(data.get("email"))
+            if not user or user["password"] != data.get("password"):
+                return self.send(400, {"code": 400, "error_code": "invalid_credentials",
+                                       "msg": "Invalid login credentials"})
+            return self.send(200, self._session(user))
+        if action == "user":
+            token = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+            user = state.tokens.get(token)
+            if not user:
+                return self.send(401, {"code": 401, "msg": "invalid JWT"})
+            return self.send(200, _user_json(user))
+        if action == "logout":
+            return self.send(204, b"")
+        return self.send(404, {"msg": "introuvable"})
+
+    def rest(self, table, query):
+        state = self.state
+        filters = [(column, values[-1]) for column, values in query.items()
+                   if column not in ("select", "order", "limit", "offset", "columns", "on_conflict")]
+        prefer = self.headers.get("Prefer", "")
+        with state.lock:
+            rows = state.tables[table]
+            if self.command in ("GET", "HEAD"):
+                result = [dict(row) for row in rows if _matches(row, filters)]
+                total = len(result)
+                if "limit" in query:
+                    result = result[:int(query["limit"][-1])]
+                headers = {"Content-Range": f"0-{max(0, len(result) - 1)}/{total if 'count=' in prefer else '*'}"}
+                return self.send(200, result, headers=headers)
+            if self.command == "POST":
+                data = self.json_body()
+                created = []
+                for item in data if isinstance(data, list) else [data]:
+                    row = dict(item, id=item.get("id") or state.next_id,
+                               created_at=time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()))
+                    state.next_id += 1
+                    rows.append(row)
+                    created.append(row)
+                return self.send(201, created if "return=representation" in prefer else b"")
+            if self.command == "PATCH":
+                data = self.json_body()
+                updated = [row for row in rows if _matches(row, filters)]
+                for row in updated:
+                    row.update(data)
+                return self.send(200, updated if "return=representation" in prefer else b"")
+            if self.command == "DELETE":
+                deleted = [row for row in rows if _matches(row, filters)]
+                rows[:] = [row for row in rows if not _matches(row, filters)]
+                return self.send(200, deleted if "return=representation" in prefer else b"")
+        return self.send(405, {"message": "méthode non supportée"})
+
+
+# ----------------- STRIPE -----------------
+def sign_webhook(payload, secret=WEBHOOK_SECRET, timestamp=None):
+    """Header Stripe-Signature accepté par stripe.Webhook.construct_event"""
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def _form(raw):
+    """Formulaire Stripe (metadata[user_id]=...) -> dict, un niveau d'imbrication"""
+    data = {}
+    for key, values in parse_qs(raw.decode()).items():
+        match = re.match(r"^(\w+)\[(\w+)\]", key)
+        if match:
+            data.setdefault(match.group(1), {})[match.group(2)] = values[-1]
+        else:
+            data[key] = values[-1]
+    return data
+
+
+class StripeHandler(_Handler):
+    sessions = {}
+    lock = threading.Lock()
+    app_url = None
+    public_url = None
+
+    def route(self, url):
+        path = url.path
+        if path == "/v1/checkout/sessions" and self.command == "POST":
+            return self.create_session(_form(self.body()))
+        match = re.match(r"^/v1/checkout/sessions/([\w-]+)$", path)
+        if match:
+            checkout = self.sessions.get(match.group(1))
+            return self.send(200, checkout) if checkout else self.send(404, {"error": {"message": "No such checkout.session"}})
+        match = re.match(r"^/pay/([\w-]+)$", path)
+        if match:
+            return self.pay(match.group(1))
+        return self.send(404, {"error": {"message": "introuvable"}})
+
+    def create_session(self, form):
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        checkout = {
+            "id": session_id, "object": "checkout.session", "mode": "payment",
+            "url": f"{self.public_url}/pay/{session_id}", "payment_status": "unpaid", "status": "open",
+            "success_url": form.get("success_url", ""), "cancel_url": form.get("cancel_url", ""),
+            "metadata": form.get("metadata", {}), "customer_email": form.get("customer_email"),
+            "customer_details": {"email": form.get("customer_email")}, "amount_total": None,
+        }
+        with self.lock:
+            self.sessions[session_id] = checkout
+        return self.send(200, checkout)
+
+    def pay(self, session_id):
+        """Page de paiement : session payée, webhook envoyé, retour vers success_url"""
+        checkout = self.sessions.get(session_id)
+        if not checkout:
+            return self.send(404, "session inconnue", "text/plain")
+        checkout.update(payment_status="paid", status="complete")
+        if self.app_url:
+            threading.Thread(target=self.send_webhook, args=(checkout,), daemon=True).start()
+        location = checkout["success_url"].replace("{CHECKOUT_SESSION_ID}", session_id)
+        return self.send(303, b"", "text/plain", headers={"Location": location})
+
+    def send_webhook(self, checkout):
+        event = {"id": f"evt_{uuid.uuid4().hex}", "object": "event", "type": "checkout.session.completed",
+                 "data": {"object": checkout}}
+        payload = json.dumps(event)
+        try:
+            requests.post(f"{self.app_url}/webhook/stripe", data=payload, timeout=10,
+                          headers={"Content-Type": "application/json", "Stripe-Signature": sign_webhook(payload)})
+        except requests.RequestException:
+            pass
+
+
+# ----------------- DÉMARRAGE -----------------
+def serve(handler, host, port):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--upstream-port", type=int, default=9101)
+    parser.add_argument("--supabase-port", type=int, default=9102)
+    parser.add_argument("--stripe-port", type=int, default=9103)
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000", help="application (webhooks Stripe)")
+    parser.add_argument("--latency", type=float, default=0.15, help="latence moyenne de l'amont (s)")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part des requêtes amont en 503")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="latence Supabase / Stripe (s)")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="pages HTML enregistrées")
+    parser.add_argument("--record", metavar="URL", help="enregistre les pages manquantes depuis ce site")
+    parser.add_argument("--categories", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--per-page", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    api_latency = Latency(args.api_latency, args.api_latency / 3)
+    UpstreamHandler.latency = Latency(args.latency, args.jitter, args.error_rate)
+    UpstreamHandler.catalogue = Catalogue(args.categories, args.pages, args.per_page)
+    UpstreamHandler.fixtures = args.fixtures
+    UpstreamHandler.record_from = args.record
+    SupabaseHandler.latency = api_latency
+    StripeHandler.latency = api_latency
+    StripeHandler.app_url = args.app_url.rstrip("/") if args.app_url else None
+    StripeHandler.public_url = f"http://{args.host}:{args.stripe_port}"
+
+    servers = [serve(UpstreamHandler, args.host, args.upstream_port),
+               serve(SupabaseHandler, args.host, args.supabase_port),
+               serve(StripeHandler, args.host, args.stripe_port)]
+    print("Services factices démarrés. Environnement de l'application :\n")
+    print(f"  SCRAPER_BASE_URL=http://{args.host}:{args.upstream_port}")
+    print(f"  SUPABASE_URL=http://{args.host}:{args.supabase_port}")
+    print(f"  SUPABASE_ANON_KEY={ANON_KEY}")
+    print(f"  STRIPE_API_BASE=http://{args.host}:{args.stripe_port}")
+    print("  STRIPE_SECRET_KEY=sk_test_fake")
+    print(f"  STRIPE_WEBHOOK_SECRET={WEBHOOK_SECRET}\n")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
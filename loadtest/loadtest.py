@@ -0,0 +1,191 @@
+"""
+Générateur de charge minimal : débit et latences (p50/p95/p99) par URL.
+
+Exemple, pour comparer l'ancien mode (1 worker sync) et la config gthread :
+  gunicorn -w 1 -k sync -b 127.0.0.1:8001 app_supabase:app
+  gunicorn -c gunicorn.conf.py -b 127.0.0.1:8002 "app_supabase:create_app()"
+  python loadtest/loadtest.py http://127.0.0.1:8001 -c 32 -d 30
+  python loadtest/loadtest.py http://127.0.0.1:8002 -c 32 -d 30
+
+Scénario « shop » (parcours complet d'un client connecté : accueil, catégorie,
+produit, recherche, ajout au panier, panier, paiement), à lancer contre les
+services factices de loadtest/fake_services.py :
+  python loadtest/loadtest.py http://127.0.0.1:8000 --scenario shop -c 16 -d 60
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from urllib.parse import quote_plus, unquote_plus, urlparse
+
+import requests
+
+DEFAULT_PATHS = [
+    "/",
+    "/?gender=homme",
+    "/category?path=/Chaussures-Homme-c100.html",
+    "/search?q=nike",
+]
+
+CATEGORY_PATHS = [
+    "/Chaussures-Homme-c100.html",
+    "/Chaussures-Femme-c101.html",
+    "/Chaussures-Enfant-c102.html",
+]
+SEARCH_TERMS = ["nike", "adidas", "new balance", "puma sneaker", "modele 42"]
+_PRODUCT_LINK = re.compile(r"/product\?path=([^\"&'\s]+)")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, name, elapsed, ok):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+
+    def report(self, duration, out=sys.stdout):
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        out.write(f"\n{'route':45} {'req':>7} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}\n")
+        for name in sorted(self.latencies):
+            lat = self.latencies[name]
+            out.write(f"{name[:45]:45} {len(lat):>7} {self.errors[name]:>5} "
+                      f"{percentile(lat, 50) * 1000:>8.1f} {percentile(lat, 95) * 1000:>8.1f} "
+                      f"{percentile(lat, 99) * 1000:>8.1f}\n")
+        all_lat = [x for v in self.latencies.values() for x in v]
+        out.write(f"\nTotal: {total} requêtes, {errors} erreurs en {duration:.1f}s "
+                  f"-> {total / duration:.1f} req/s | p50 {percentile(all_lat, 50) * 1000:.1f} ms, "
+                  f"p95 {percentile(all_lat, 95) * 1000:.1f} ms, p99 {percentile(all_lat, 99) * 1000:.1f} ms\n")
+
+
+def run_user(base_url, paths, deadline, stats, timeout):
+    http = requests.Session()
+    i = 0
+    while time.time() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            ok = http.get(base_url + path, timeout=timeout, allow_redirects=False).status_code < 500
+        except requests.RequestException:
+            ok = False
+        stats.record(path, time.perf_counter() - started, ok)
+
+
+class Shopper:
+    """Client virtuel : un compte, une session HTTP, le parcours d'achat en boucle"""
+
+    def __init__(self, base_url, number, stats, timeout, checkout_every):
+        self.base_url = base_url
+        self.stats = stats
+        self.timeout = timeout
+        self.checkout_every = checkout_every
+        self.email = f"load-{os.getpid()}-{number}@example.test"
+        self.http = requests.Session()
+
+    def call(self, name, method, path, expected=400, **kwargs):
+        """Requête chronométrée sous le nom de l'étape ; None en cas d'erreur réseau"""
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=self.timeout,
+                                         allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            self.stats.record(name, time.perf_counter() - started, False)
+            return None
+        self.stats.record(name, time.perf_counter() - started, response.status_code < expected)
+        return response
+
+    def sign_in(self):
+        credentials = {"email": self.email, "password": "load-test-password"}
+        self.call("POST /register", "POST", "/register", data=credentials)
+        self.call("POST /login", "POST", "/login", data=credentials)
+
+    def browse(self):
+        """Accueil, catégorie, produit, ajout au panier, recherche, panier"""
+        self.call("GET /", "GET", "/")
+        category = random.choice(CATEGORY_PATHS)
+        response = self.call("GET /category", "GET",
+                             f"/category?path={quote_plus(category)}&page={random.randint(1, 3)}")
+        links = _PRODUCT_LINK.findall(response.text) if response is not None else []
+        if links:
+            path = unquote_plus(random.choice(links))
+            self.call("GET /product", "GET", f"/product?path={quote_plus(path)}")
+            self.call("POST /cart/add", "POST", "/cart/add",
+                      data={"path": path, "qty": random.randint(1, 2), "size": "42"})
+        self.call("GET /search", "GET", f"/search?q={quote_plus(random.choice(SEARCH_TERMS))}")
+        self.call("GET /cart", "GET", "/cart")
+
+    def checkout(self):
+        """Session Stripe, page de paiement factice, retour sur /checkout/success"""
+        response = self.call("POST /create-checkout-session", "POST", "/create-checkout-session")
+        if response is None or "/pay/" not in response.headers.get("Location", ""):
+            return
+        try:
+            paid = self.http.get(response.headers["Location"], timeout=self.timeout, allow_redirects=False)
+        except requests.RequestException:
+            return
+        success = urlparse(paid.headers.get("Location", ""))
+        if success.path:
+            self.call("GET /checkout/success", "GET", f"{success.path}?{success.query}")
+
+    def run(self, deadline):
+        self.sign_in()
+        iteration = 0
+        while time.time() < deadline:
+            iteration += 1
+            self.browse()
+            if self.checkout_every and iteration % self.checkout_every == 0 and time.time() < deadline:
+                self.checkout()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=20.0)
+    parser.add_argument("-t", "--timeout", type=float, default=30.0)
+    parser.add_argument("-p", "--path", action="append", dest="paths", help="URL à tester (répétable)")
+    parser.add_argument("--scenario", choices=("paths", "shop"), default="paths",
+                        help="paths : GET en boucle sur --path ; shop : parcours d'achat complet")
+    parser.add_argument("--checkout-every", type=int, default=5,
+                        help="scénario shop : un paiement tous les N parcours (0 : jamais)")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or DEFAULT_PATHS
+    stats = Stats()
+    started = time.time()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for n in range(args.concurrency):
+            if args.scenario == "shop":
+                shopper = Shopper(args.base_url.rstrip("/"), n, stats, args.timeout, args.checkout_every)
+                pool.submit(shopper.run, deadline)
+                continue
+            # Décalage du point de départ pour répartir les routes entre utilisateurs
+            user_paths = paths[n % len(paths):] + paths[:n % len(paths)]
+            pool.submit(run_user, args.base_url.rstrip("/"), user_paths, deadline, stats, args.timeout)
+    stats.report(time.time() - started)
+    return stats
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Même parcours que `loadtest.py --scenario shop`, pour locust (pip install locust) :
+
+  locust -f loadtest/locustfile.py --host http://127.0.0.1:8000 \
+         --headless -u 32 -r 8 -t 2m --csv loadtest/results
+
+Latences p50/p95/p99 et débit par étape dans le résumé et dans results_stats.csv.
+"""
+import re
+import random
+import uuid
+from urllib.parse import quote_plus, unquote_plus, urlparse
+
+from locust import HttpUser, between, task
+
+CATEGORY_PATHS = [
+    "/Chaussures-Homme-c100.html",
+    "/Chaussures-Femme-c101.html",
+    "/Chaussures-Enfant-c102.html",
+]
+SEARCH_TERMS = ["nike", "adidas", "new balance", "puma sneaker", "modele 42"]
+PRODUCT_LINK = re.compile(r"/product\?path=([^\"&'\s]+)")
+
+
+class Shopper(HttpUser):
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        credentials = {"email": f"locust-{uuid.uuid4().hex[:12]}@example.test", "password": "load-test-password"}
+        self.client.post("/register", data=credentials, name="POST /register", allow_redirects=False)
+        self.client.post("/login", data=credentials, name="POST /login", allow_redirects=False)
+        self.products = []
+
+    @task(4)
+    def home(self):
+        self.client.get("/", name="GET /")
+
+    @task(6)
+    def category(self):
+        path = random.choice(CATEGORY_PATHS)
+        response = self.client.get(f"/category?path={quote_plus(path)}&page={random.randint(1, 3)}",
+                                   name="GET /category")
+        self.products = [unquote_plus(link) for link in PRODUCT_LINK.findall(response.text)] or self.products
+
+    @task(5)
+    def product(self):
+        if self.products:
+            path = random.choice(self.products)
+            self.client.get(f"/product?path={quote_plus(path)}", name="GET /product")
+
+    @task(3)
+    def search(self):
+        self.client.get(f"/search?q={quote_plus(random.choice(SEARCH_TERMS))}", name="GET /search")
+
+    @task(2)
+    def cart_add(self):
+        if self.products:
+            self.client.post("/cart/add", data={"path": random.choice(self.products), "qty": 1, "size": "42"},
+                             name="POST /cart/add", allow_redirects=False)
+            self.client.get("/cart", name="GET /cart")
+
+    @task(1)
+    def checkout(self):
+        response = self.client.post("/create-checkout-session", name="POST /create-checkout-session",
+                                    allow_redirects=False)
+        location = response.headers.get("Location", "")
+        if "/pay/" not in location:
+            return
+        # Page de paiement du Stripe factice (hors application : non mesurée)
+        paid = self.client.request("GET", location, allow_redirects=False, name="(stripe) pay")
+        success = urlparse(paid.headers.get("Location", ""))
+        if success.path:
+            self.client.get(f"{success.path}?{success.query}", name="GET /checkout/success")
@@ -0,0 +1,362 @@
+"""
+Métriques de latence par route et par dépendance (destockenligne, Supabase,
+Stripe, parsing) : format texte Prometheus sur /metrics et header Server-Timing.
+
+Sous gunicorn, chaque worker a ses propres compteurs et un scrape tombe sur
+un worker quelconque : avec METRICS_DIR, chaque processus y écrit son état
+(METRICS_FLUSH_INTERVAL) et /metrics fusionne tous les fichiers. Compteurs et
+histogrammes sont additionnés, y compris ceux des workers arrêtés (versés dans
+une archive par le maître) pour rester croissants malgré le recyclage ; les
+jauges des collecteurs restent par worker (label `worker`), workers vivants
+seulement.
+
+Variables d'environnement :
+  METRICS_TOKEN            jeton exigé sur /metrics (Authorization: Bearer ...)
+  METRICS_DIR              répertoire partagé par les workers (posé par gunicorn.conf.py ;
+                           vide = métriques du seul processus)
+  METRICS_FLUSH_INTERVAL   secondes entre deux écritures de l'état d'un worker (5)
+"""
+import os
+import glob
+import json
+import time
+import logging
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock, Thread
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+ARCHIVE_FILE = "archive.json"
+
+_lock = Lock()
+_histograms = {}
+_counters = defaultdict(float)
+_help = {}
+_collectors = []
+log = logging.getLogger(__name__)
+
+# Durées des dépendances de la requête en cours (pour Server-Timing)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    """Texte d'aide (# HELP) d'une métrique"""
+    _help[name] = text
+
+
+def observe(name, value, **labels):
+    """Ajoute une observation (secondes) à un histogramme"""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram()
+        hist.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    """Incrémente un compteur"""
+    with _lock:
+        _counters[_key(name, labels)] += amount
+
+
+def cache_result(cache, hit):
+    """Compte un accès cache (hit / miss) pour le calcul du taux de succès"""
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def register_collector(func):
+    """func() -> [(nom, type, labels, valeur)] ; lu à chaque export"""
+    _collectors.append(func)
+    return func
+
+
+class _Call:
+    __slots__ = ("failed",)
+
+    def __init__(self):
+        self.failed = False
+
+
+@contextmanager
+def track(dependency, operation):
+    """Mesure un appel à une dépendance ; erreur si exception ou call.failed = True"""
+    call = _Call()
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("dependency_duration_seconds", elapsed, dependency=dependency, operation=operation)
+        inc("dependency_calls_total", dependency=dependency, operation=operation)
+        if call.failed:
+            inc("dependency_errors_total", dependency=dependency, operation=operation)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[dependency][0] += elapsed
+            timings[dependency][1] += 1
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + inner + "}"
+
+
+def _local_state():
+    """(compteurs, histogrammes, échantillons des collecteurs) du processus"""
+    with _lock:
+        histograms = {k: (list(h.counts), h.total, h.count) for k, h in _histograms.items()}
+        counters = dict(_counters)
+    samples = []
+    for func in _collectors:
+        try:
+            for name, kind, labels, value in func():
+                samples.append((name, kind, tuple(sorted(labels.items())), value))
+        except Exception as e:
+            log.warning("Erreur collecteur métriques: %s", e)
+    return counters, histograms, samples
+
+
+# ----------------- AGRÉGATION ENTRE WORKERS -----------------
+def _write_state(path, counters, histograms, samples):
+    payload = {"counters": [[name, labels, value] for (name, labels), value in counters.items()],
+               "histograms": [[name, labels, *state] for (name, labels), state in histograms.items()],
+               "samples": [list(sample) for sample in samples]}
+    # Temporaire puis renommage : /metrics ne lit jamais un fichier partiel
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(payload, fh, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _pairs(labels):
+    # JSON rend des listes ; les clés des métriques sont des tuples
+    return tuple(tuple(pair) for pair in labels)
+
+
+def _read_state(path):
+    with open(path) as fh:
+        payload = json.load(fh)
+    counters = {(name, _pairs(labels)): value for name, labels, value in payload["counters"]}
+    histograms = {(name, _pairs(labels)): (counts, total, count)
+                  for name, labels, counts, total, count in payload["histograms"]}
+    samples = [(name, kind, _pairs(labels), value) for name, kind, labels, value in payload["samples"]]
+    return counters, histograms, samples
+
+
+def _merge(counters, histograms, into_counters, into_histograms):
+    for key, value in counters.items():
+        into_counters[key] = into_counters.get(key, 0) + value
+    for key, (counts, total, count) in histograms.items():
+        previous = into_histograms.get(key)
+        if previous is not None:
+            counts = [a + b for a, b in zip(previous[0], counts)]
+            total, count = previous[1] + total, previous[2] + count
+        into_histograms[key] = (list(counts), total, count)
+
+
+def flush():
+    """Écrit l'état du processus dans METRICS_DIR (sans effet si non configuré)"""
+    if not METRICS_DIR:
+        return
+    try:
+        _write_state(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), *_local_state())
+    except OSError as e:
+        log.warning("Métriques non écrites dans %s: %s", METRICS_DIR, e)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def start_worker():
+    """Worker gunicorn : écriture périodique de son état dans METRICS_DIR"""
+    if METRICS_DIR:
+        Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def prepare_dir():
+    """Maître gunicorn, au démarrage : vide METRICS_DIR des fichiers d'une exécution précédente"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        os.remove(path)
+
+
+def mark_process_dead(pid):
+    """Maître gunicorn : verse compteurs et histogrammes d'un processus arrêté dans l'archive"""
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f"{pid}.json")
+    archive = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+    try:
+        counters, histograms, _samples = _read_state(path)
+    except (OSError, ValueError):
+        return
+    try:
+        archived_counters, archived_histograms, _ = _read_state(archive)
+    except (OSError, ValueError):
+        archived_counters, archived_histograms = {}, {}
+    _merge(counters, histograms, archived_counters, archived_histograms)
+    _write_state(archive, archived_counters, archived_histograms, [])
+    os.remove(path)
+
+
+def archive_process():
+    """Maître gunicorn avant le fork : ses mesures (préchargement) vont à l'archive, pas aux workers"""
+    if not METRICS_DIR:
+        return
+    flush()
+    mark_process_dead(os.getpid())
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _service_state():
+    """État fusionné de tous les processus de METRICS_DIR (le sien à jour)"""
+    flush()
+    counters, histograms, samples = {}, {}, []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            file_counters, file_histograms, file_samples = _read_state(path)
+        except (OSError, ValueError) as e:
+            # Fichier d'un worker disparu entre-temps
+            log.debug("Métriques illisibles %s: %s", path, e)
+            continue
+        _merge(file_counters, file_histograms, counters, histograms)
+        worker = os.path.basename(path)[:-len(".json")]
+        samples.extend((name, kind, tuple(sorted(labels + (("worker", worker),))), value)
+                       for name, kind, labels, value in file_samples)
+    return counters, histograms, samples
+
+
+def render():
+    """Export au format texte Prometheus 0.0.4 (tous les workers si METRICS_DIR)"""
+    lines = []
+    counters, histograms, samples = _service_state() if METRICS_DIR else _local_state()
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[(name, "counter")].append((labels, value))
+    for name, kind, labels, value in samples:
+        by_name[(name, kind)].append((labels, value))
+
+    for (name, kind), series in sorted(by_name.items()):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series):
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+
+    names = sorted({name for name, _ in histograms})
+    for name in names:
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for (hname, labels), (counts, total, count) in sorted(histograms.items()):
+            if hname != name:
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+describe("http_request_duration_seconds", "Durée des requêtes HTTP par route")
+describe("http_requests_total", "Requêtes HTTP par route et statut")
+describe("dependency_duration_seconds", "Durée des appels aux dépendances")
+describe("dependency_calls_total", "Appels aux dépendances")
+describe("dependency_errors_total", "Appels aux dépendances en erreur")
+describe("cache_requests_total", "Accès aux caches (hit / miss)")
+
+
+def init_app(app):
+    """Middleware de mesure des requêtes + route /metrics"""
+    from flask import request, g, Response, abort
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_token = _request_timings.set(defaultdict(lambda: [0.0, 0]))
+
+    @app.after_request
+    def _record(response):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        method, status = request.method, response.status_code
+        token = g.pop("_metrics_token", None)
+
+        def finish():
+            elapsed = time.perf_counter() - started
+            if route != "/metrics":
+                observe("http_request_duration_seconds", elapsed, route=route, method=method)
+                inc("http_requests_total", route=route, method=method, status=status)
+            timings = _request_timings.get() or {}
+            parts = [f"app;dur={elapsed * 1000:.1f}"]
+            for dependency, (total, count) in sorted(timings.items()):
+                parts.append(f'{dependency};dur={total * 1000:.1f};desc="{count} appel(s)"')
+            # Après un flux, l'en-tête est déjà parti : la valeur complète reste lisible
+            # par les hooks de fermeture suivants (profil)
+            response.headers["Server-Timing"] = ", ".join(parts)
+            if token is not None:
+                try:
+                    _request_timings.reset(token)
+                except ValueError:
+                    _request_timings.set(None)
+
+        if response.is_streamed:
+            # Corps produit après after_request (scraping, rendu) : mesure à la fin de l'envoi,
+            # l'en-tête ne donne que le temps jusqu'aux en-têtes
+            response.headers["Server-Timing"] = \
+                f'app;dur={(time.perf_counter() - started) * 1000:.1f};desc="avant le flux"'
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            abort(403)
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,99 @@
+"""
+Enregistrement compact des produits du catalogue (listings, produits similaires,
+recherche, sections de l'accueil).
+
+Un produit est un objet à __slots__ dont les chaînes répétitives (chemins, URLs
+d'images, prix formatés) sont internées ; `Product.make()` renvoie l'instance
+déjà connue pour un même chemin et les mêmes valeurs, si bien que les caches
+partagent un seul objet au lieu d'un dict par copie.
+"""
+import sys
+import weakref
+from threading import Lock
+
+# Produits vivants par (chemin, valeurs) : une entrée disparaît quand plus aucun cache ne la référence
+_registry = weakref.WeakValueDictionary()
+_registry_lock = Lock()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Product:
+    """Produit d'un listing ; accès par attribut (templates) ou `.get()` (ancien format dict)"""
+
+    __slots__ = ("name", "path", "image", "old_price", "new_price", "price_cents", "economy", "__weakref__")
+
+    FIELDS = ("name", "path", "image", "old_price", "new_price", "price_cents", "economy")
+    COMPUTED = ("url", "price", "display_price", "price_value")
+
+    def __init__(self, name, path, image=None, old_price="", new_price="", price_cents=0, economy=""):
+        self.name = name
+        self.path = _intern(path)
+        self.image = _intern(image)
+        self.old_price = _intern(old_price)
+        self.new_price = _intern(new_price)
+        self.price_cents = price_cents
+        self.economy = _intern(economy)
+
+    @classmethod
+    def make(cls, name, path, image=None, old_price="", new_price="", price_cents=0, economy=""):
+        """Instance partagée pour ce produit et ces valeurs"""
+        if not path:
+            return cls(name, path, image, old_price, new_price, price_cents, economy)
+        # Clé sur toutes les valeurs : une variante (section de l'accueil sans ancien prix,
+        # prix modifié) coexiste avec l'instance du listing au lieu de l'évincer
+        key = (path, name, image, old_price, new_price, price_cents, economy)
+        with _registry_lock:
+            known = _registry.get(key)
+            if known is not None:
+                return known
+            product = _registry[key] = cls(name, path, image, old_price, new_price, price_cents, economy)
+            return product
+
+    # Champs calculés de l'ancien format dict
+    @property
+    def url(self):
+        from scraper import _normalize_href
+        return _normalize_href(self.path)
+
+    @property
+    def price(self):
+        return self.new_price
+
+    display_price = price
+
+    @property
+    def price_value(self):
+        """Prix en euros, pour l'affichage uniquement (les calculs utilisent price_cents)"""
+        return self.price_cents / 100
+
+    def get(self, key, default=None):
+        """Compatibilité avec l'ancien format dict"""
+        if key in self.FIELDS or key in self.COMPUTED:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __getitem__(self, key):
+        if key in self.FIELDS or key in self.COMPUTED:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __reduce__(self):
+        # Désérialisé (retour d'un processus de parsing) via make() : instance partagée du processus
+        return Product.make, tuple(getattr(self, field) for field in self.FIELDS)
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["url"] = self.url
+        return data
+
+    def __repr__(self):
+        return f"Product({self.path!r}, {self.new_price!r})"
+
+
+def registry_size():
+    """Nombre d'instances de produits (variantes comprises) référencées par les caches"""
+    return len(_registry)
@@ -0,0 +1,108 @@
+"""
+Préchargement des pages que le visiteur ouvrira probablement ensuite : page
+suivante d'un listing, premiers produits similaires d'une fiche. Elles sont
+chargées en tâche de fond (priorité basse du limiteur amont) dans les caches
+du scraper, pour que le clic suivant soit servi depuis le cache.
+
+Borné : au plus PREFETCH_MAX_PENDING préchargements en attente ou en cours
+par processus (les suivants sont abandonnés), aucun si la page est déjà
+fraîche ou en cours de chargement, aucun pendant que l'amont ralentit.
+
+Variables d'environnement :
+  PREFETCH_ENABLED      "0" pour désactiver le préchargement (activé par défaut)
+  PREFETCH_RELATED      produits similaires préchargés par fiche (4)
+  PREFETCH_WORKERS      threads de préchargement par processus (2)
+  PREFETCH_MAX_PENDING  préchargements en attente ou en cours au plus (16)
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import metrics
+import scraper
+import upstream_limiter
+
+log = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") != "0"
+PREFETCH_RELATED = int(os.getenv("PREFETCH_RELATED", "4"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "16"))
+
+_executor = None
+_executor_pid = None
+_pending = set()
+_lock = Lock()
+
+
+def _get_executor():
+    """Pool de préchargement, recréé après un fork"""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        _executor_pid = os.getpid()
+        _pending.clear()
+    return _executor
+
+
+def _run(key, kind, load):
+    try:
+        with upstream_limiter.background():
+            load()
+        metrics.inc("prefetch_total", kind=kind, result="done")
+    except Exception as e:
+        log.debug("Préchargement %s échoué: %s", key, e)
+        metrics.inc("prefetch_total", kind=kind, result="failed")
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def _schedule(key, kind, load):
+    """Planifie load() si la limite le permet ; False si abandonné"""
+    limiter = upstream_limiter.limiter
+    if limiter.rate < limiter.max_rate:
+        # L'amont ralentit : les visiteurs d'abord
+        metrics.inc("prefetch_total", kind=kind, result="skipped")
+        return False
+    with _lock:
+        executor = _get_executor()
+        if key in _pending:
+            return False
+        if len(_pending) >= PREFETCH_MAX_PENDING:
+            metrics.inc("prefetch_total", kind=kind, result="dropped")
+            return False
+        _pending.add(key)
+    try:
+        executor.submit(_run, key, kind, load)
+    except RuntimeError:
+        # Pool arrêté : le processus se termine
+        with _lock:
+            _pending.discard(key)
+        return False
+    metrics.inc("prefetch_total", kind=kind, result="scheduled")
+    return True
+
+
+def next_listing_page(path, paging):
+    """Précharge la page suivante d'un listing qui vient d'être affiché"""
+    if not PREFETCH_ENABLED or not path or not paging or not paging.get("has_next"):
+        return
+    page = int(paging.get("current") or 1) + 1
+    if scraper.listing_wanted(path, page):
+        _schedule(("listing", path, page), "listing", lambda: scraper.get_category_products(path, page))
+
+
+def related_products(products, limit=None):
+    """Précharge les fiches des premiers produits similaires"""
+    if not PREFETCH_ENABLED or not products:
+        return
+    limit = PREFETCH_RELATED if limit is None else limit
+    for product in products[:limit]:
+        path = product.get("path")
+        if path and scraper.product_wanted(path):
+            _schedule(("product", path), "product", lambda path=path: scraper.get_product_details(path))
+
+
+metrics.describe("prefetch_total", "Préchargements de pages probables (planifiés, abandonnés, terminés)")
@@ -0,0 +1,150 @@
+"""
+Prix de vente : calculés une seule fois, en centimes entiers, à l'extraction.
+
+Le prix fournisseur lu sur destockenligne.com est multiplié par PRICE_MULTIPLIER,
+sauf si overrides.json fixe un prix pour le produit ; la commission est calculée
+sur le total en centimes. Aucun calcul monétaire ne passe par des float.
+
+Variables d'environnement :
+  PRICE_MULTIPLIER   multiplicateur appliqué aux prix fournisseur (2.0)
+  COMMISSION_RATE    taux de commission ajouté au paiement (0.15)
+  OVERRIDES_FILE     fichier des surcharges produit (overrides.json)
+"""
+import os
+import re
+import json
+import logging
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from threading import Lock
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+PRICE_MULTIPLIER = Decimal(os.getenv("PRICE_MULTIPLIER", "2.0"))
+COMMISSION_RATE = Decimal(os.getenv("COMMISSION_RATE", "0.15"))
+OVERRIDES_FILE = os.getenv("OVERRIDES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "overrides.json"))
+CUSTOM_IMAGES_URL = "/static/custom/"
+
+_AMOUNT_RE = re.compile(r"\d+(?:[.,]\d{1,2})?")
+_overrides = None
+_overrides_lock = Lock()
+
+
+# ----------------- CONVERSIONS -----------------
+def parse_amount(text):
+    """Montant en centimes d'un texte de prix ("12,00 €", "€ 99.90"), None si illisible"""
+    if not text:
+        return None
+    # Séparateurs de milliers ("1 234,50 €")
+    match = _AMOUNT_RE.search(re.sub(r"(?<=\d)[\s .](?=\d{3}\b)", "", str(text)))
+    if not match:
+        return None
+    return to_cents(match.group(0).replace(",", "."))
+
+
+def to_cents(value):
+    """Centimes d'un montant en euros (float / str / Decimal venant de la base)"""
+    try:
+        return int((Decimal(str(value)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, TypeError):
+        return 0
+
+
+def to_amount(cents):
+    """Montant en euros pour la base / JSON (deux décimales exactes)"""
+    return float(Decimal(cents) / 100)
+
+
+def format_amount(cents):
+    """Montant sans symbole : "12.34" """
+    return f"{Decimal(cents) / 100:.2f}"
+
+
+def format_price(cents):
+    """Affichage d'un prix de vente"""
+    return f"€ {format_amount(cents)}"
+
+
+def apply_multiplier(cents):
+    return int((Decimal(cents) * PRICE_MULTIPLIER).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def commission(total_cents):
+    """Commission (centimes) sur un total en centimes"""
+    return int((Decimal(total_cents) * COMMISSION_RATE).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def commission_label():
+    return f"Commission ({int(COMMISSION_RATE * 100)}%)"
+
+
+# ----------------- SURCHARGES -----------------
+def _load_overrides():
+    try:
+        with open(OVERRIDES_FILE, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.error("overrides.json illisible: %s", e)
+        return {}
+    return {_path_key(path): value for path, value in data.items() if isinstance(value, dict)}
+
+
+def reload_overrides():
+    """Relit overrides.json (les produits déjà en cache gardent leur prix jusqu'au rafraîchissement)"""
+    global _overrides
+    with _overrides_lock:
+        _overrides = _load_overrides()
+    return _overrides
+
+
+def _path_key(path):
+    """Chemin normalisé : '/Produit-123.html', que le lien soit absolu ou relatif"""
+    path = urlparse(path).path if "://" in path else path
+    return "/" + path.lstrip("/")
+
+
+def get_override(path):
+    """Surcharge d'un produit ({} si aucune)"""
+    if not path:
+        return {}
+    overrides = _overrides if _overrides is not None else reload_overrides()
+    return overrides.get(_path_key(path), {})
+
+
+def is_hidden(path):
+    return bool(get_override(path).get("hidden"))
+
+
+def override_image(path):
+    """Image de remplacement (URL) ou None"""
+    override = get_override(path)
+    if override.get("image"):
+        return override["image"]
+    if override.get("images"):
+        return CUSTOM_IMAGES_URL + override["images"][0]
+    return None
+
+
+# ----------------- PRIX DE VENTE -----------------
+def sale_price(path, supplier_price_text):
+    """Prix de vente en centimes : surcharge, sinon prix fournisseur x multiplicateur (0 si inconnu)"""
+    override = get_override(path).get("price")
+    if override:
+        cents = parse_amount(override)
+        if cents:
+            return cents
+    cents = parse_amount(supplier_price_text)
+    return apply_multiplier(cents) if cents else 0
+
+
+def display_price(path, supplier_price_text):
+    """(centimes, texte affiché) d'un prix de vente"""
+    cents = sale_price(path, supplier_price_text)
+    return cents, format_price(cents) if cents else ""
+
+
+def cart_total(items):
+    """Total d'un panier en centimes (lignes avec price_cents et qty)"""
+    return sum(item["price_cents"] * int(item.get("qty") or 1) for item in items)
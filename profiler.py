@@ -0,0 +1,241 @@
+"""
+Profilage à la demande des requêtes (cProfile, ou pyinstrument s'il est installé).
+
+Une requête est profilée si elle porte le header `X-Profile: <PROFILE_TOKEN>`
+ou si elle est tirée au sort (PROFILE_SAMPLE_RATE, 0 par défaut). Chaque profil
+est écrit dans PROFILE_DIR (.prof lisible par snakeviz / pstats, ou .html
+pyinstrument) avec un .json de métadonnées ; /admin/profiles liste les plus lents.
+"""
+import os
+import io
+import re
+import json
+import time
+import random
+import logging
+import pstats
+import cProfile
+from threading import Lock
+
+import app_logging
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "profiles"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_ENGINE = os.getenv("PROFILE_ENGINE", "cprofile")  # ou "pyinstrument"
+TOP_FUNCTIONS = 25
+EXCLUDED_PREFIXES = ("/static/", "/img", "/metrics", "/admin/profiles")
+
+# Un seul profil à la fois : les profileurs Python ne supportent pas bien la concurrence
+_active = Lock()
+log = logging.getLogger(__name__)
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-")[:40] or "root"
+
+
+def is_profiling():
+    """True si la requête en cours est profilée (décision prise par before_request)"""
+    from flask import g
+    return "_profile" in g
+
+
+def _wants_profile(request):
+    if request.path.startswith(EXCLUDED_PREFIXES):
+        return False
+    if PROFILE_TOKEN and request.headers.get("X-Profile") == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class _CProfileEngine:
+    suffix = ".prof"
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        self.profiler.dump_stats(path)
+
+    def top(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+
+class _PyinstrumentEngine:
+    suffix = ".html"
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler(interval=0.001)
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def save(self, path):
+        with open(path, "w") as fh:
+            fh.write(self.profiler.output_html())
+
+    def top(self):
+        return self.profiler.output_text(unicode=False, color=False)
+
+
+def _engine():
+    if PROFILE_ENGINE == "pyinstrument":
+        try:
+            return _PyinstrumentEngine()
+        except ImportError:
+            pass
+    return _CProfileEngine()
+
+
+def _prune():
+    """Garde les PROFILE_MAX_FILES profils les plus récents"""
+    metas = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for name in metas[:-PROFILE_MAX_FILES]:
+        base = os.path.join(PROFILE_DIR, name[:-5])
+        for suffix in (".json", ".prof", ".html"):
+            try:
+                os.remove(base + suffix)
+            except OSError:
+                pass
+
+
+def list_profiles(limit=50):
+    """Métadonnées des profils enregistrés, du plus lent au plus rapide"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name)) as fh:
+                    profiles.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+    profiles.sort(key=lambda p: p.get("duration_ms", 0), reverse=True)
+    return profiles[:limit]
+
+
+def init_app(app):
+    """Branche le profilage sur les requêtes et les routes d'administration"""
+    from flask import request, g, abort, send_from_directory, Response, render_template_string
+
+    @app.before_request
+    def _start_profile():
+        if not _wants_profile(request) or not _active.acquire(blocking=False):
+            return
+        try:
+            g._profile = _engine()
+            g._profile_started = time.perf_counter()
+            g._profile.start()
+        except Exception:
+            _active.release()
+            raise
+
+    @app.after_request
+    def _stop_profile(response):
+        engine = g.pop("_profile", None)
+        if engine is None:
+            return response
+        started = g.pop("_profile_started")
+        route = request.url_rule.rule if request.url_rule else request.path
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{_slug(route)}"
+        meta = {
+            "name": name,
+            "file": name + engine.suffix,
+            "route": route,
+            "path": app_logging.loggable_path(request),
+            "method": request.method,
+            "status": response.status_code,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+        def finish():
+            try:
+                engine.stop()
+                meta["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                meta["server_timing"] = response.headers.get("Server-Timing", "")
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                engine.save(os.path.join(PROFILE_DIR, name + engine.suffix))
+                meta["top"] = engine.top()
+                with open(os.path.join(PROFILE_DIR, name + ".json"), "w") as fh:
+                    json.dump(meta, fh)
+                _prune()
+            except Exception:
+                log.exception("Erreur profilage")
+            finally:
+                _active.release()
+
+        response.headers["X-Profile-Id"] = name
+        if response.is_streamed:
+            # Page en flux : le scraping et le rendu ont lieu pendant l'envoi, profil arrêté à la fin
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+    @app.teardown_request
+    def _abort_profile(exc):
+        # Requête terminée sans passer par after_request : on libère le profileur
+        engine = g.pop("_profile", None)
+        if engine is not None:
+            engine.stop()
+            _active.release()
+
+    def _check_token():
+        token = request.headers.get("X-Profile") or request.args.get("token")
+        if not PROFILE_TOKEN or token != PROFILE_TOKEN:
+            abort(403)
+
+    @app.route("/admin/profiles")
+    def admin_profiles():
+        _check_token()
+        return render_template_string(PROFILES_PAGE, profiles=list_profiles())
+
+    @app.route("/admin/profiles/<name>")
+    def admin_profile(name):
+        _check_token()
+        name = os.path.basename(name)
+        if name.endswith((".prof", ".html")):
+            return send_from_directory(PROFILE_DIR, name, as_attachment=name.endswith(".prof"))
+        try:
+            with open(os.path.join(PROFILE_DIR, name + ".json")) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            abort(404)
+        return Response(meta["top"], mimetype="text/plain")
+
+
+PROFILES_PAGE = """
+<h1>Profils des requêtes les plus lentes</h1>
+<p><small>Liens à ouvrir avec le header <code>X-Profile: &lt;PROFILE_TOKEN&gt;</code> (le jeton ne passe pas dans les URL).</small></p>
+<table border="1" cellpadding="4">
+  <tr><th>Durée (ms)</th><th>Route</th><th>URL</th><th>Statut</th><th>Date</th><th>Server-Timing</th><th>Fichiers</th></tr>
+  {% for p in profiles %}
+  <tr>
+    <td>{{ p.duration_ms }}</td><td>{{ p.route }}</td><td>{{ p.method }} {{ p.path }}</td>
+    <td>{{ p.status }}</td><td>{{ p.timestamp }}</td><td><small>{{ p.server_timing }}</small></td>
+    <td>
+      <a href="{{ url_for('admin_profile', name=p.name) }}">top</a> |
+      <a href="{{ url_for('admin_profile', name=p.file) }}">{{ p.file.rsplit('.', 1)[1] }}</a>
+    </td>
+  </tr>
+  {% else %}
+  <tr><td colspan="7">Aucun profil enregistré.</td></tr>
+  {% endfor %}
+</table>
+"""
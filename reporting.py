@@ -0,0 +1,370 @@
+"""
+Rapports sur les commandes (chiffre d'affaires par jour, commission,
+produits les plus vendus) sans relire la table orders à chaque consultation.
+
+Un cumul local (SQLite) est tenu à jour au fil de l'eau : chaque commande
+enregistrée met à jour ses agrégats une seule fois (clé stripe_session_id).
+Il est alimenté par le checkout et le webhook, par les sauvegardes de
+secours (scripts/replay_orders.py) et par un rattrapage incrémental depuis
+Supabase (sync_from_supabase, pages de REPORTING_PAGE_SIZE lignes).
+
+Variables d'environnement :
+  REPORTING_DB         base SQLite du cumul (.cache/reporting.sqlite3)
+  REPORTING_TOKEN      jeton des routes /admin/reports (désactivées si absent)
+  REPORTING_PAGE_SIZE  lignes par page lues dans Supabase (500)
+  ORDERS_BACKUP_FILE   commandes non enregistrées dans Supabase, une par ligne (orders_backup.json)
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+
+import metrics
+import pricing
+
+log = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+REPORTING_DB = os.getenv("REPORTING_DB", os.path.join(_ROOT, ".cache", "reporting.sqlite3"))
+REPORTING_TOKEN = os.getenv("REPORTING_TOKEN")
+REPORTING_PAGE_SIZE = int(os.getenv("REPORTING_PAGE_SIZE", "500"))
+ORDERS_BACKUP_FILE = os.getenv("ORDERS_BACKUP_FILE", os.path.join(_ROOT, "orders_backup.json"))
+MAX_LIMIT = 366
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    day TEXT,
+    created_at TEXT,
+    total_cents INTEGER,
+    commission_cents INTEGER,
+    items INTEGER,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT PRIMARY KEY,
+    orders INTEGER,
+    revenue_cents INTEGER,
+    commission_cents INTEGER
+);
+CREATE TABLE IF NOT EXISTS product_daily (
+    day TEXT,
+    product TEXT,
+    name TEXT,
+    qty INTEGER,
+    revenue_cents INTEGER,
+    PRIMARY KEY (day, product)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# ----------------- BASE -----------------
+_local = threading.local()
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def connect(path=None):
+    """Nouvelle connexion (scripts) ; schéma et WAL mis en place une fois par processus"""
+    path = path or REPORTING_DB
+    db = sqlite3.connect(path, timeout=10) if _schema_ready_for(path) else _init_schema(path)
+    db.row_factory = sqlite3.Row
+    return db
+
+
+def _schema_ready_for(path):
+    return (os.getpid(), path) in _schema_ready
+
+
+def _init_schema(path):
+    with _schema_lock:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path, timeout=10)
+        if not _schema_ready_for(path):
+            # Plusieurs workers écrivent : lectures non bloquées par les écritures (réglage du fichier)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            _schema_ready.add((os.getpid(), path))
+        return db
+
+
+def _connection(path=None):
+    """Connexion du thread courant, réutilisée d'une requête à l'autre (jamais après un fork)"""
+    path = path or REPORTING_DB
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid, _local.connections = os.getpid(), {}
+    db = _local.connections.get(path)
+    if db is None:
+        db = _local.connections[path] = connect(path)
+    return db
+
+
+def _day(created_at):
+    """Jour UTC (AAAA-MM-JJ) d'une date ISO ou d'un datetime ; aujourd'hui si absente"""
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            created_at = None
+    if created_at is None:
+        created_at = datetime.now(timezone.utc)
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.strftime("%Y-%m-%d")
+
+
+def _item_cents(item):
+    cents = item.get("price_cents")
+    return int(cents) if cents is not None else pricing.to_cents(item.get("price") or 0)
+
+
+# ----------------- CUMUL -----------------
+def _add_order(db, order, created_at, source):
+    """Ajoute une commande et ses agrégats ; False si elle est déjà comptée"""
+    session_id = order.get("stripe_session_id")
+    if not session_id:
+        return False
+    day = _day(created_at)
+    items = order.get("items") or []
+    total = pricing.to_cents(order.get("total_amount") or 0)
+    commission = pricing.to_cents(order.get("commission_amount") or 0)
+    inserted = db.execute(
+        "INSERT OR IGNORE INTO orders (session_id, user_id, day, created_at, total_cents, commission_cents, items, source)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (session_id, order.get("user_id"), day, str(created_at or ""), total, commission, len(items), source),
+    ).rowcount
+    if not inserted:
+        return False
+    db.execute(
+        "INSERT INTO daily (day, orders, revenue_cents, commission_cents) VALUES (?, 1, ?, ?)"
+        " ON CONFLICT(day) DO UPDATE SET orders = orders + 1, revenue_cents = revenue_cents + excluded.revenue_cents,"
+        " commission_cents = commission_cents + excluded.commission_cents",
+        (day, total, commission))
+    for item in items:
+        qty = int(item.get("qty") or 1)
+        name = item.get("product_name") or item.get("name") or ""
+        db.execute(
+            "INSERT INTO product_daily (day, product, name, qty, revenue_cents) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(day, product) DO UPDATE SET qty = qty + excluded.qty,"
+            " revenue_cents = revenue_cents + excluded.revenue_cents",
+            (day, item.get("path") or name, name, qty, _item_cents(item) * qty))
+    return True
+
+
+def record_order(order, created_at=None, source="live", db=None):
+    """Compte une commande dans le cumul (idempotent) ; n'échoue jamais côté checkout.
+
+    True si ajoutée, False si déjà comptée, None si le cumul est indisponible.
+    """
+    try:
+        db = db or _connection()
+        with db:
+            added = _add_order(db, order, created_at, source)
+        if added:
+            metrics.inc("reporting_orders_total", source=source)
+        return added
+    except sqlite3.Error as e:
+        log.error("Cumul des commandes non mis à jour: %s", e)
+        return None
+
+
+def get_order(session_id, db_path=None):
+    """Commande du cumul au format de la table orders Supabase (None si inconnue)"""
+    try:
+        row = _connection(db_path).execute(
+            "SELECT total_cents FROM orders WHERE session_id = ?", (session_id,)).fetchone()
+    except sqlite3.Error as e:
+        log.error("Lecture du cumul impossible: %s", e)
+        return None
+    if row is None:
+        return None
+    return {"stripe_session_id": session_id, "total_amount": pricing.to_amount(row["total_cents"])}
+
+
+def ingest(orders, source="backup", db_path=None):
+    """Ajoute en une transaction une suite de (commande, date) ; renvoie (ajoutées, déjà comptées)"""
+    added = skipped = 0
+    db = connect(db_path)
+    try:
+        with db:
+            for order, created_at in orders:
+                if _add_order(db, order, created_at, source):
+                    added += 1
+                else:
+                    skipped += 1
+    finally:
+        db.close()
+    if added:
+        metrics.inc("reporting_orders_total", added, source=source)
+    return added, skipped
+
+
+# ----------------- SAUVEGARDES -----------------
+def append_backup(order, reason):
+    """Ajoute une commande non enregistrée au fichier de secours (une ligne JSON)"""
+    line = json.dumps({"timestamp": datetime.now().isoformat(), "reason": reason, "order": order},
+                      ensure_ascii=False, default=str)
+    try:
+        with open(ORDERS_BACKUP_FILE, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+    except OSError as e:
+        log.error("Sauvegarde de secours impossible (%s): %s", ORDERS_BACKUP_FILE, e)
+
+
+def read_backups(path):
+    """(commande, date) des lignes d'un fichier de secours ; lignes illisibles ignorées"""
+    with open(path, encoding="utf-8") as fh:
+        for number, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                log.warning("%s:%d illisible, ignorée", path, number)
+                continue
+            order = record.get("order") if isinstance(record.get("order"), dict) else record
+            yield order, record.get("timestamp") or order.get("created_at")
+
+
+# ----------------- RATTRAPAGE SUPABASE -----------------
+def sync_from_supabase(client, page_size=REPORTING_PAGE_SIZE, db_path=None):
+    """Ajoute au cumul les commandes Supabase créées depuis le dernier rattrapage.
+
+    Lecture par pages triées sur (created_at, stripe_session_id), colonnes
+    utiles seulement ; le curseur (dernier couple vu) est conservé dans la
+    base locale : des commandes de même date à cheval sur deux pages ne sont
+    ni perdues ni relues.
+    """
+    db = connect(db_path)
+    added = 0
+    try:
+        row = db.execute("SELECT value FROM meta WHERE key = 'supabase_cursor'").fetchone()
+        cursor = _load_cursor(row["value"]) if row else None
+        while True:
+            query = (client.table("orders")
+                     .select("stripe_session_id,user_id,total_amount,commission_amount,items,created_at")
+                     .order("created_at").order("stripe_session_id").limit(page_size))
+            if cursor:
+                created_at, session_id = cursor
+                query = query.or_(f'created_at.gt."{created_at}",'
+                                  f'and(created_at.eq."{created_at}",stripe_session_id.gt."{session_id}")')
+            with metrics.track("supabase", "orders.select"):
+                rows = query.execute().data or []
+            with db:
+                for order in rows:
+                    added += _add_order(db, order, order.get("created_at"), "supabase")
+                if rows:
+                    cursor = (rows[-1]["created_at"], rows[-1]["stripe_session_id"])
+                    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('supabase_cursor', ?)",
+                               (json.dumps(cursor),))
+            if len(rows) < page_size:
+                break
+    finally:
+        db.close()
+    return added
+
+
+def _load_cursor(value):
+    """(created_at, stripe_session_id) ; ancien format : created_at seul"""
+    try:
+        created_at, session_id = json.loads(value)
+    except (ValueError, TypeError):
+        return value, ""
+    return created_at, session_id
+
+
+# ----------------- REQUÊTES -----------------
+def _range(start, end):
+    """Bornes (jours inclus) par défaut : les 30 derniers jours"""
+    end = end or _day(None)
+    start = start or (datetime.strptime(end, "%Y-%m-%d") - timedelta(days=29)).strftime("%Y-%m-%d")
+    return start, end
+
+
+def daily_revenue(start=None, end=None, limit=31, before=None, db_path=None):
+    """Jours (du plus récent au plus ancien) et curseur de la page suivante"""
+    start, end = _range(start, end)
+    if before:
+        end = min(end, (datetime.strptime(before, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d"))
+    rows = [dict(row) for row in _connection(db_path).execute(
+        "SELECT day, orders, revenue_cents, commission_cents FROM daily"
+        " WHERE day BETWEEN ? AND ? ORDER BY day DESC LIMIT ?", (start, end, limit + 1))]
+    next_cursor = rows[limit - 1]["day"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def top_products(start=None, end=None, limit=20, db_path=None):
+    start, end = _range(start, end)
+    return [dict(row) for row in _connection(db_path).execute(
+        "SELECT product, MAX(name) AS name, SUM(qty) AS qty, SUM(revenue_cents) AS revenue_cents"
+        " FROM product_daily WHERE day BETWEEN ? AND ? GROUP BY product"
+        " ORDER BY revenue_cents DESC, qty DESC LIMIT ?", (start, end, limit))]
+
+
+def summary(start=None, end=None, db_path=None):
+    start, end = _range(start, end)
+    row = _connection(db_path).execute(
+        "SELECT COALESCE(SUM(orders), 0) AS orders, COALESCE(SUM(revenue_cents), 0) AS revenue_cents,"
+        " COALESCE(SUM(commission_cents), 0) AS commission_cents FROM daily WHERE day BETWEEN ? AND ?",
+        (start, end)).fetchone()
+    return dict(row, start=start, end=end)
+
+
+# ----------------- ROUTES ADMIN -----------------
+def init_app(app):
+    """Routes JSON /admin/reports/... (jeton REPORTING_TOKEN)"""
+    from flask import request, jsonify, abort
+
+    def _check_token():
+        auth = request.headers.get("Authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else request.args.get("token")
+        if not REPORTING_TOKEN or token != REPORTING_TOKEN:
+            abort(403)
+
+    def _args():
+        start, end = request.args.get("from"), request.args.get("to")
+        try:
+            for value in (start, end, request.args.get("cursor")):
+                if value:
+                    datetime.strptime(value, "%Y-%m-%d")
+            limit = max(1, min(int(request.args.get("limit", 31)), MAX_LIMIT))
+        except ValueError:
+            abort(400)
+        return start, end, limit
+
+    @app.route("/admin/reports/daily")
+    def admin_reports_daily():
+        _check_token()
+        start, end, limit = _args()
+        days, next_cursor = daily_revenue(start, end, limit, before=request.args.get("cursor"))
+        for day in days:
+            day["revenue"] = pricing.format_amount(day["revenue_cents"])
+            day["commission"] = pricing.format_amount(day["commission_cents"])
+        return jsonify({"days": days, "next_cursor": next_cursor})
+
+    @app.route("/admin/reports/top-products")
+    def admin_reports_top_products():
+        _check_token()
+        start, end, limit = _args()
+        return jsonify({"products": top_products(start, end, min(limit, 100))})
+
+    @app.route("/admin/reports/summary")
+    def admin_reports_summary():
+        _check_token()
+        start, end, _limit = _args()
+        data = summary(start, end)
+        data["revenue"] = pricing.format_amount(data["revenue_cents"])
+        data["commission"] = pricing.format_amount(data["commission_cents"])
+        return jsonify(data)
+
+
+metrics.describe("reporting_orders_total", "Commandes ajoutées au cumul des rapports")
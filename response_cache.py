@@ -0,0 +1,168 @@
+"""
+Cache des pages HTML du catalogue pour les visiteurs anonymes
+"""
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import request, session, make_response, Response
+
+import compression
+import metrics
+import profiler
+import stale_cache
+
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "120"))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "512"))
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1") != "0"
+
+_pages = OrderedDict()
+_lock = Lock()
+
+
+class CachedPage:
+    __slots__ = ("body", "mimetype", "etag", "expires", "encoded")
+
+    def __init__(self, body, mimetype, ttl):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.expires = time.time() + ttl
+        # Variantes compressées ({"br": ..., "gzip": ...}), calculées à la première demande
+        self.encoded = {}
+
+    def body_for(self, encoding):
+        """Corps dans l'encodage demandé (compressé une seule fois par encodage)"""
+        if encoding is None:
+            return self.body
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = compression.compress(self.body, encoding)
+        else:
+            metrics.inc("compressed_responses_total", encoding=encoding, mode="cached")
+        return body
+
+
+def _cache_key(allowed_args):
+    """Clé = route + arguments connus normalisés ; None si la requête n'est pas cacheable"""
+    if set(request.args) - set(allowed_args):
+        # Arguments inconnus : on ne pollue pas le cache (la page affiche request.args)
+        return None
+    parts = [request.path]
+    for name in allowed_args:
+        value = request.args.get(name, "").strip()
+        if value:
+            parts.append(f"{name}={value}")
+    return "|".join(parts)
+
+
+def _is_anonymous():
+    return not session.get("user_id")
+
+
+def _respond(entry, status):
+    encoding = compression.negotiate(entry.mimetype, len(entry.body))
+    response = Response(entry.body_for(encoding), mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    if encoding:
+        compression.mark_encoded(response, encoding)
+    # Le navigateur revalide (304) ; un proxy partagé ne doit pas servir cette page à un client connecté
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    response.headers["X-Cache"] = status
+    return response.make_conditional(request)
+
+
+def get(key):
+    with _lock:
+        entry = _pages.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.time():
+            del _pages[key]
+            return None
+        _pages.move_to_end(key)
+        return entry
+
+
+def put(key, entry):
+    with _lock:
+        _pages[key] = entry
+        _pages.move_to_end(key)
+        while len(_pages) > PAGE_CACHE_MAX_ENTRIES:
+            _pages.popitem(last=False)
+
+
+metrics.describe("page_cache_entries", "Pages en cache dans ce worker")
+metrics.describe("cache_bypass_total", "Requêtes servies sans le cache de pages")
+
+
+@metrics.register_collector
+def _collect():
+    return [("page_cache_entries", "gauge", {}, len(_pages))]
+
+
+def clear():
+    with _lock:
+        _pages.clear()
+
+
+def _tee(chunks, key, mimetype, ttl):
+    """Transmet une réponse en flux et la met en cache si elle est complète et construite avec l'amont"""
+    body = []
+    try:
+        for chunk in chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            body.append(data)
+            yield data
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    # Fraîcheur connue seulement ici : les données ont été lues pendant l'envoi
+    if stale_cache.data_freshness() == "fresh":
+        put(key, CachedPage(b"".join(body), mimetype, ttl))
+
+
+def cached_page(args=(), ttl=None):
+    """Décorateur : sert la page depuis le cache pour les visiteurs anonymes.
+
+    args : arguments de requête qui font varier la page (les autres
+    désactivent le cache pour cette requête).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*a, **kw):
+            key = None
+            # Les requêtes profilées (jeton valide ou tirage) doivent exécuter la vraie page
+            if (PAGE_CACHE_ENABLED and request.method in ("GET", "HEAD") and _is_anonymous()
+                    and not profiler.is_profiling()):
+                key = _cache_key(args)
+            if key is None:
+                metrics.inc("cache_bypass_total", cache="page")
+                return view(*a, **kw)
+
+            entry = get(key)
+            metrics.cache_result("page", entry is not None)
+            if entry is not None:
+                return _respond(entry, "HIT")
+
+            response = make_response(view(*a, **kw))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            if response.is_streamed:
+                # Page en flux : copie des morceaux envoyés, mise en cache à la fin
+                response.response = _tee(response.response, key, response.mimetype, ttl or PAGE_CACHE_TTL)
+                response.headers["X-Cache"] = "MISS"
+                return response
+            if stale_cache.data_freshness() != "fresh":
+                # Page construite sans l'amont : on ne la fige pas, la suivante le retentera
+                response.headers["X-Cache"] = "BYPASS"
+                return response
+            entry = CachedPage(response.get_data(), response.mimetype, ttl or PAGE_CACHE_TTL)
+            put(key, entry)
+            return _respond(entry, "MISS")
+        return wrapper
+    return decorator
@@ -2,16 +2,33 @@
 Scraper optimisé pour destockenligne.com - Extraction complète
 """
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import re
 import os
 import time
-from functools import lru_cache
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+
+import metrics
+import pricing
+import upstream_limiter
+from models import Product
+import stale_cache
+from stale_cache import StaleCache
+
+log = logging.getLogger(__name__)
 
 # Configuration
-BASE_URL = "https://www.destockenligne.com"
-PRICE_MULTIPLIER = float(os.getenv('PRICE_MULTIPLIER', '2.0'))
+# SCRAPER_BASE_URL : amont factice des tests de charge (loadtest/fake_services.py)
+BASE_URL = os.getenv("SCRAPER_BASE_URL", "https://www.destockenligne.com").rstrip("/")
+GENDER_PATHS = {
+    "homme": "/Chaussures-Homme-c100.html",
+    "femme": "/Chaussures-Femme-c101.html",
+    "enfant": "/Chaussures-Enfant-c102.html",
+}
+LISTING_WORKERS = int(os.getenv("LISTING_WORKERS", "6"))
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
@@ -21,21 +38,54 @@ HEADERS = {
 session = requests.Session()
 session.headers.update(HEADERS)
 
-# Cache
-PRODUCT_CACHE = {}
-CACHE_DURATION = 300
+# Caches : dernière valeur connue servie si l'amont échoue ou est trop lent
+CATEGORIES_TTL = int(os.getenv("CATEGORIES_CACHE_TTL", "3600"))
+_categories_cache = StaleCache("categories", ttl=CATEGORIES_TTL)
+_listing_cache = StaleCache("listings")
+_product_cache = StaleCache("products")
+
+class UpstreamError(Exception):
+    """Page de l'amont indisponible (erreur réseau, HTTP ou réponse vide)"""
 
 # ----------------- FONCTIONS DE BASE -----------------
+def fetch_html(url, timeout=12):
+    """Récupère le contenu HTML ; lève UpstreamError en cas d'échec"""
+    # Débit limité et adaptatif : un pic de requêtes ne doit pas nous faire bloquer par l'amont
+    if not upstream_limiter.acquire():
+        raise UpstreamError(f"{url}: débit amont saturé")
+    with metrics.track("destockenligne", "fetch") as call:
+        try:
+            response = session.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            call.failed = True
+            if isinstance(e, requests.Timeout):
+                upstream_limiter.record_failure()
+            raise UpstreamError(f"{url}: {e}") from e
+        upstream_limiter.record_response(response.status_code, response.headers.get("Retry-After"))
+        try:
+            response.raise_for_status()
+        except requests.RequestException as e:
+            call.failed = True
+            raise UpstreamError(f"{url}: {e}") from e
+        if not response.text:
+            call.failed = True
+            raise UpstreamError(f"{url}: réponse vide")
+        return response.text
+
 def safe_get(url, timeout=12):
-    """Récupère le contenu HTML avec gestion d'erreurs améliorée"""
+    """Récupère le contenu HTML, "" en cas d'erreur"""
     try:
-        response = session.get(url, timeout=timeout)
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as e:
-        print(f"Erreur requête {url}: {e}")
+        return fetch_html(url, timeout)
+    except UpstreamError as e:
+        log.warning("Erreur requête %s", e)
         return ""
 
+def parse_html(html):
+    """Parse une page avec BeautifulSoup (importé au premier usage)"""
+    from bs4 import BeautifulSoup
+    with metrics.track("parse", "html.parser"):
+        return BeautifulSoup(html, "html.parser")
+
 def _normalize_href(href, base=BASE_URL):
     """Normalise les URLs"""
     if not href:
@@ -44,26 +94,17 @@ def _normalize_href(href, base=BASE_URL):
         return href
     return urljoin(base, href.lstrip('/'))
 
-def _extract_price(price_text):
-    """Extrait et applique le multiplicateur de prix de manière robuste"""
-    if not price_text:
-        return 0.0, ""
-    
-    # Nettoyage plus agressif du texte de prix
-    clean_text = re.sub(r'[^\d,]', '', price_text.strip())
-    clean_text = clean_text.replace(',', '.')
-    
-    # Extraction du premier nombre trouvé
-    price_match = re.search(r'(\d+\.?\d*)', clean_text)
-    if price_match:
-        try:
-            price_value = float(price_match.group(1))
-            final_price = price_value * PRICE_MULTIPLIER
-            return final_price, f"€ {final_price:.2f}"
-        except (ValueError, TypeError):
-            pass
-    
-    return 0.0, "Prix non disponible"
+def _extract_price(price_text, path=None):
+    """Prix de vente (centimes, texte affiché) : surcharge ou prix fournisseur x multiplicateur"""
+    cents, formatted = pricing.display_price(path, price_text)
+    if cents:
+        return cents, formatted
+    return 0, "Prix non disponible" if price_text else ""
+
+def _extract_old_price(price_text):
+    """Ancien prix fournisseur ramené au même multiplicateur que le prix de vente"""
+    cents = pricing.parse_amount(price_text)
+    return pricing.format_price(pricing.apply_multiplier(cents)) if cents else price_text
 
 # ----------------- EXTRACTION COMPLÈTE -----------------
 def _extract_title_improved(soup):
@@ -221,7 +262,7 @@ def _extract_sizes_improved(soup):
     return sizes if sizes else ["Unique"]
 
 def _extract_products_from_soup(soup):
-    """Extrait les produits d'une page de catégorie"""
+    """Extrait les produits d'une page de catégorie (models.Product partagés entre caches)"""
     products = []
     for ul in soup.select("ul.re00"):
         try:
@@ -242,41 +283,38 @@ def _extract_products_from_soup(soup):
 
             name = info_a.get_text(strip=True) if info_a else ""
             href = info_a.get("href") if info_a else None
+            if pricing.is_hidden(href):
+                continue
 
-            # Extraction du prix
+            # Extraction du prix (une seule fois, en centimes)
             new_price_text = new_price_tag.get_text(strip=True) if new_price_tag else ""
-            price_value, formatted_price = _extract_price(new_price_text)
-
-            products.append({
-                "name": name,
-                "path": href,
-                "url": _normalize_href(href),
-                "image": _normalize_href(img_tag["src"]) if img_tag and img_tag.get("src") else None,
-                "old_price": old_price_tag.get_text(strip=True) if old_price_tag else "",
-                "new_price": formatted_price,
-                "price_value": price_value,
-                "economy": econ,
-            })
+            price_cents, formatted_price = _extract_price(new_price_text, href)
+
+            products.append(Product.make(
+                name=name,
+                path=href,
+                image=pricing.override_image(href) or (_normalize_href(img_tag["src"]) if img_tag and img_tag.get("src") else None),
+                old_price=_extract_old_price(old_price_tag.get_text(strip=True)) if old_price_tag else "",
+                new_price=formatted_price,
+                price_cents=price_cents,
+                economy=econ,
+            ))
         except Exception as e:
-            print(f"Erreur extraction produit: {e}")
+            log.debug("Erreur extraction produit: %s", e)
             continue
             
     return products
 
 # ----------------- SCRAPING PRINCIPAL AMÉLIORÉ -----------------
-@lru_cache(maxsize=128)
-def get_categories():
-    """Récupère les catégories"""
+def _load_categories():
+    """Catégories de la barre latérale (lève UpstreamError si l'amont échoue)"""
+    soup = parse_html(fetch_html(BASE_URL + "/"))
     try:
-        html = safe_get(BASE_URL + "/")
-        if not html:
-            return {"headers": [], "brands": []}
-            
-        soup = BeautifulSoup(html, "html.parser")
         sidebar = soup.select_one("div.sideBar_left") or soup.select_one("#leftsideBar")
         
         if not sidebar:
-            return {"headers": [], "brands": []}
+            # Page inattendue (maintenance...) : on garde les catégories précédentes
+            raise UpstreamError("page d'accueil sans barre latérale")
         
         headers = [h.get_text(strip=True) for h in sidebar.select(".insort0")]
         brands = []
@@ -296,56 +334,118 @@ def get_categories():
                     })
         
         return {"headers": headers, "brands": brands}
+    except UpstreamError:
+        raise
     except Exception as e:
-        print(f"Erreur catégories: {e}")
-        return {"headers": [], "brands": []}
+        raise UpstreamError(f"Erreur catégories: {e}") from e
 
-def get_category_products(path, page=1):
-    """Récupère les produits d'une catégorie avec pagination"""
+def get_categories():
+    """Récupère les catégories"""
+    return _categories_cache.get("/", _load_categories, default=lambda: {"headers": [], "brands": []})
+
+def _page_path(path, page):
+    """Chemin de la page `page` d'un listing"""
+    if page > 1:
+        base = path.split(".html")[0]
+        base = re.sub(r"_[0-9]+$", "", base)
+        return f"{base}_{page}.html"
+    return path
+
+def listing_url(path, page=1):
+    return _normalize_href(_page_path(path, page))
+
+def _load_category_products(path, page):
+    return parse_listing(fetch_html(listing_url(path, page)), path, page)
+
+def parse_listing(html, path, page=1):
+    """(produits, pagination) d'une page de listing ; sans réseau (exécutable dans un processus de parsing)"""
+    soup = parse_html(html)
     try:
-        # Construction URL paginée
-        if page > 1:
-            base = path.split(".html")[0]
-            base = re.sub(r"_[0-9]+$", "", base)
-            page_path = f"{base}_{page}.html"
-        else:
-            page_path = path
-
-        html = safe_get(_normalize_href(page_path))
-        if not html:
-            return [], {"current": page, "total": 1, "has_next": False}
-            
-        soup = BeautifulSoup(html, "html.parser")
         products = _extract_products_from_soup(soup)
-        
         # Pagination complète
         paging = _extract_pagination_info(soup, path, page)
-        
         return products, paging
-        
     except Exception as e:
-        print(f"Erreur produits catégorie {path}: {e}")
-        return [], {"current": page, "total": 1, "has_next": False}
+        raise UpstreamError(f"Erreur produits catégorie {path}: {e}") from e
+
+def get_category_products(path, page=1):
+    """Récupère les produits d'une catégorie avec pagination"""
+    return _listing_cache.get(
+        (path, page), lambda: _load_category_products(path, page),
+        default=lambda: ([], {"current": page, "total": 1, "has_next": False}),
+    )
+
+def listing_wanted(path, page=1):
+    """True si la page de listing n'est ni fraîche en cache ni en cours de chargement"""
+    return _listing_cache.wants((path, page))
+
+_listing_pool = None
+_listing_pool_pid = None
+_listing_pool_lock = Lock()
+
+def _get_listing_pool():
+    """Pool des requêtes de listings parallèles (recréé après un fork)"""
+    global _listing_pool, _listing_pool_pid
+    with _listing_pool_lock:
+        if _listing_pool is None or _listing_pool_pid != os.getpid():
+            _listing_pool = ThreadPoolExecutor(max_workers=LISTING_WORKERS, thread_name_prefix="listing")
+            _listing_pool_pid = os.getpid()
+        return _listing_pool
+
+def _fetch_listing(path, page):
+    # Exécuté dans une copie du contexte de la requête (budget de latence) ;
+    # la fraîcheur observée est renvoyée pour être reportée sur la requête.
+    return get_category_products(path, page), stale_cache.data_freshness()
+
+def iter_listing_pages(paths, max_pages=1):
+    """(path, page, products, paging) des listings, dans l'ordre d'arrivée.
+
+    Les premières pages sont demandées en parallèle ; la page suivante d'un
+    listing part dès que la précédente annonce has_next.
+    """
+    pool = _get_listing_pool()
+
+    def submit(path, page):
+        return pool.submit(contextvars.copy_context().run, _fetch_listing, path, page)
+
+    pending = {submit(path, 1): (path, 1) for path in paths}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, page = pending.pop(future)
+            try:
+                (products, paging), freshness = future.result()
+            except Exception as e:
+                log.warning("Erreur listing %s page %s: %s", path, page, e)
+                continue
+            stale_cache.note_freshness(freshness)
+            if paging.get("has_next") and page < max_pages:
+                pending[submit(path, page + 1)] = (path, page + 1)
+            yield path, page, products, paging
+
+def store_listing(path, page, value):
+    """Enregistre une page de listing obtenue hors du cache (crawl)"""
+    _listing_cache.put((path, page), value)
+
+def store_product_details(path, details):
+    _product_cache.put((path, 1), details)
 
 def get_product_details(path, page=1):
     """Récupère les détails d'un produit - VERSION COMPLÈTE"""
-    try:
-        # Construction URL
-        if page > 1:
-            base = path.split(".html")[0]
-            base = re.sub(r"_[0-9]+$", "", base)
-            page_path = f"{base}_{page}.html"
-        else:
-            page_path = path
-
-        full_url = _normalize_href(page_path)
-        html = safe_get(full_url)
-        
-        if not html:
-            return {}
-            
-        soup = BeautifulSoup(html, "html.parser")
+    return _product_cache.get((path, page), lambda: _load_product_details(path, page), default=dict)
 
+def product_wanted(path):
+    """True si la fiche n'est ni fraîche en cache ni en cours de chargement"""
+    return _product_cache.wants((path, 1))
+
+def _load_product_details(path, page=1):
+    return parse_product(fetch_html(listing_url(path, page)), path, page)
+
+def parse_product(html, path, page=1):
+    """Détails d'une fiche produit (ou d'une page catégorie) ; sans réseau"""
+    full_url = listing_url(path, page)
+    soup = parse_html(html)
+    try:
         # Vérification type de page
         is_category = bool(soup.select("ul.re00")) and not bool(soup.select("div.views_pics, select[name='hw_sizeone']"))
         
@@ -393,13 +493,13 @@ def get_product_details(path, page=1):
                     price_text = candidate_text
                     break
         
-        price_value, formatted_price = _extract_price(price_text)
+        price_cents, formatted_price = _extract_price(price_text, path)
         
         # Ancien prix
         old_price = ""
         old_price_tag = soup.select_one("s")
         if old_price_tag:
-            old_price = old_price_tag.get_text(strip=True)
+            old_price = _extract_old_price(old_price_tag.get_text(strip=True))
         
         # Tailles
         sizes = _extract_sizes_improved(soup)
@@ -419,10 +519,11 @@ def get_product_details(path, page=1):
         result = {
             "is_category": False,
             "title": title,
-            "main_img": main_img,
+            "main_img": pricing.override_image(path) or main_img,
             "old_price": old_price,
             "new_price": formatted_price,
-            "price_value": price_value,
+            "price_cents": price_cents,
+            "price_value": pricing.to_amount(price_cents),
             "sizes": sizes,
             "qty_options": qty_options,
             "description": description,
@@ -436,15 +537,16 @@ def get_product_details(path, page=1):
         return result
         
     except Exception as e:
-        print(f"Erreur détails produit {path}: {e}")
-        return {}
+        raise UpstreamError(f"Erreur détails produit {path}: {e}") from e
 # ----------------- FONCTIONS DE COMPATIBILITÉ -----------------
 def reload_overrides():
-    """Fonction de compatibilité"""
-    pass
+    """Relit overrides.json et vide les caches pour appliquer les nouveaux prix"""
+    pricing.reload_overrides()
+    for cache in (_listing_cache, _product_cache):
+        cache.clear()
 
 if __name__ == "__main__":
-    print(f"🔧 Multiplicateur: {PRICE_MULTIPLIER}x")
+    print(f"🔧 Multiplicateur: {pricing.PRICE_MULTIPLIER}x")
     
     # Test avec le produit problématique
     test_path = "/Nike-Air-Max-Plus-2025-325541.html"
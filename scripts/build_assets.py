@@ -0,0 +1,145 @@
+"""
+Build des assets statiques : minification CSS/JS, ré-encodage des images,
+noms empreintés par contenu et variantes précompressées (gzip / brotli).
+
+Usage : python scripts/build_assets.py
+Produit static/dist/ et static/dist/manifest.json, lus au runtime par assets.py.
+"""
+import os
+import io
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST = "manifest.json"
+
+COMPRESSIBLE = {".css", ".js", ".svg"}
+IMAGES = {".png", ".jpg", ".jpeg"}
+# Côté max (px) des images affichées en petit ; les autres sont plafonnées à DEFAULT_MAX_DIM
+MAX_DIMENSIONS = {"logo.png": 240, "instagram.png": 64, "whatsapp.png": 64}
+DEFAULT_MAX_DIM = 1600
+JPEG_QUALITY = 82
+
+
+def minify_css(text):
+    """Minification CSS par rcssmin ; sans lui, fichier copié tel quel"""
+    # Pas de repli par expressions régulières : elles cassent les chaînes
+    # contenant "/*" ; la compression gzip / brotli fait l'essentiel du gain
+    return rcssmin.cssmin(text) if rcssmin else text
+
+
+def minify_js(text):
+    """Minification JS par rjsmin ; sans lui, fichier copié tel quel"""
+    # Un repli naïf corrompt chaînes, regex et gabarits multi-lignes :
+    # seul un vrai tokenizer peut retirer les commentaires sans risque
+    return rjsmin.jsmin(text) if rjsmin else text
+
+
+def optimize_image(name, data):
+    """Redimensionne / ré-encode une image ; garde l'original si ce n'est pas plus léger"""
+    if Image is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            max_dim = MAX_DIMENSIONS.get(os.path.basename(name), DEFAULT_MAX_DIM)
+            img.thumbnail((max_dim, max_dim))
+            out = io.BytesIO()
+            if img.format == "PNG" or name.lower().endswith(".png"):
+                img.save(out, format="PNG", optimize=True)
+            else:
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    except Exception as e:
+        print(f"⚠️  Image ignorée {name}: {e}")
+        return data
+    optimized = out.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+def hashed_name(name, data):
+    """style.css -> style.<hash>.css"""
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    base, ext = os.path.splitext(name)
+    return f"{base}.{digest}{ext}"
+
+
+def write_variants(path, data):
+    """Écrit le fichier et ses variantes .gz / .br"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(data)
+    if os.path.splitext(path)[1] not in COMPRESSIBLE:
+        return
+    with open(path + ".gz", "wb") as fh:
+        fh.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        with open(path + ".br", "wb") as fh:
+            fh.write(brotli.compress(data, quality=11))
+
+
+def iter_sources():
+    """Fichiers de static/ à traiter (hors dist/)"""
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != DIST_DIR]
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"), path
+
+
+def build():
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+    before = after = 0
+    for name, path in iter_sources():
+        ext = os.path.splitext(name)[1].lower()
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if ext == ".css":
+            out = minify_css(data.decode("utf-8")).encode("utf-8")
+        elif ext == ".js":
+            out = minify_js(data.decode("utf-8")).encode("utf-8")
+        elif ext in IMAGES:
+            out = optimize_image(name, data)
+        else:
+            out = data
+        target = "dist/" + hashed_name(name, out)
+        write_variants(os.path.join(STATIC_DIR, target), out)
+        manifest[name] = target
+        before += len(data)
+        after += len(out)
+        print(f"  {name:45} {len(data):>9} -> {len(out):>9}  {target}")
+
+    with open(os.path.join(DIST_DIR, MANIFEST), "w") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    print(f"✅ {len(manifest)} assets, {before} -> {after} octets")
+    return manifest
+
+
+if __name__ == "__main__":
+    sys.exit(0 if build() is not None else 1)
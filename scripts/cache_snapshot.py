@@ -0,0 +1,83 @@
+"""
+Écrit ou décrit l'instantané des caches de l'amont (voir cache_snapshot.py).
+
+Usage :
+  python scripts/cache_snapshot.py export [--max-pages N] [--products N] [--file F]
+  python scripts/cache_snapshot.py info [--file F]
+
+`export` préchauffe les caches (catégories, sections, listings par le
+pipeline de crawl, fiches des premiers produits de chaque catégorie) puis
+écrit l'instantané ; à lancer avant le déploiement ou par cron sur le volume
+partagé que lit CACHE_SNAPSHOT_FILE.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_snapshot  # noqa: E402
+import crawl  # noqa: E402
+import upstream_limiter  # noqa: E402
+import scraper  # noqa: E402
+
+
+def warm(max_pages, products, parse_workers):
+    """Remplit les caches du processus ; renvoie (pages de listing, fiches) lues"""
+    # Import de l'application : enregistre le cache des sections
+    from app_supabase import get_gender_sections
+
+    get_gender_sections()
+    paths = list(dict.fromkeys([*scraper.GENDER_PATHS.values(),
+                                *(brand["path"] for brand in scraper.get_categories().get("brands", []))]))
+    pages, details = 0, 0
+    with crawl.CrawlPipeline(parse_workers=parse_workers) as pipeline:
+        wanted = []
+        for _path, page, listing, _paging, error in pipeline.listings(paths, max_pages=max_pages):
+            if error is None:
+                pages += 1
+                if page == 1:
+                    wanted.extend(product.path for product in listing[:products] if product.path)
+        for _path, _details, error in pipeline.products(dict.fromkeys(wanted)):
+            details += error is None
+    return pages, details
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instantané des caches de l'amont")
+    parser.add_argument("command", choices=("export", "info"))
+    parser.add_argument("--file", default=cache_snapshot.CACHE_SNAPSHOT_FILE)
+    parser.add_argument("--max-pages", type=int, default=3, help="pages lues au plus par listing")
+    parser.add_argument("--products", type=int, default=12,
+                        help="fiches préchargées par catégorie (premiers produits de la page 1)")
+    parser.add_argument("--parse-workers", type=int, default=crawl.CRAWL_PARSE_WORKERS,
+                        help="processus de parsing (0 = dans ce processus)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(levelname)s %(name)s: %(message)s")
+    # Part réservée aux crawls planifiés, en plus des workers web
+    upstream_limiter.configure_cron()
+    if args.command == "info":
+        try:
+            payload = cache_snapshot.read(args.file)
+        except cache_snapshot.SnapshotError as e:
+            print(e)
+            return 1
+        print(f"{args.file} : version {payload['version']}, {os.path.getsize(args.file) // 1024} Ko, "
+              f"créé il y a {time.time() - payload['created_at']:.0f} s, {len(payload['products'])} produits")
+        for name, entries in payload["caches"].items():
+            print(f"  {name:<12} {len(entries)} entrées")
+        return 0
+
+    started = time.time()
+    pages, details = warm(args.max_pages, args.products, args.parse_workers)
+    stats = cache_snapshot.export(args.file)
+    print(f"{pages} pages de listing et {details} fiches lues en {time.time() - started:.0f} s ; "
+          f"instantané {args.file} : {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
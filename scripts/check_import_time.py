@@ -0,0 +1,45 @@
+"""
+Vérifie le coût d'import de l'application (démarrage à froid des conteneurs).
+
+Usage : python scripts/check_import_time.py [budget_ms]
+Échoue si `import app_supabase` dépasse le budget (IMPORT_BUDGET_MS, 400 ms par
+défaut) ou s'il importe un SDK qui doit rester paresseux.
+"""
+import os
+import re
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = float(sys.argv[1] if len(sys.argv) > 1 else os.getenv("IMPORT_BUDGET_MS", "400"))
+LAZY_MODULES = ("stripe", "supabase", "postgrest", "httpx", "bs4", "smtplib", "PIL")
+
+
+def measure():
+    """Retourne (temps cumulé d'import en ms, modules paresseux chargés)"""
+    code = (
+        "import sys, app_supabase;"
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    cumulative = 0
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| app_supabase$", line)
+        if match:
+            cumulative = int(match.group(1)) / 1000
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return cumulative, loaded
+
+
+if __name__ == "__main__":
+    # Première passe pour que le bytecode des dépendances soit en cache
+    measure()
+    elapsed, loaded = measure()
+    print(f"import app_supabase: {elapsed:.0f} ms (budget {BUDGET_MS:.0f} ms)")
+    if loaded:
+        print(f"❌ Modules importés trop tôt: {', '.join(loaded)}")
+    if elapsed > BUDGET_MS:
+        print("❌ Budget d'import dépassé")
+    sys.exit(1 if loaded or elapsed > BUDGET_MS else 0)
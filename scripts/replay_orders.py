@@ -0,0 +1,90 @@
+"""
+Rejoue en masse les commandes des fichiers de secours (orders_backup.json,
+une commande JSON par ligne) : ajout au cumul des rapports et, avec
+--to-supabase, insertion dans la table orders de celles qui y manquent.
+
+Usage : python scripts/replay_orders.py [FICHIER ...] [--to-supabase] [--sync-supabase] [--dry-run]
+Rejouer plusieurs fois est sans effet : les commandes sont identifiées par stripe_session_id.
+--dry-run affiche les commandes retenues (articles, total) sans rien écrire.
+"""
+import os
+import sys
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reporting  # noqa: E402
+
+BATCH_SIZE = 100
+
+
+def load(paths):
+    """Commandes des fichiers, dédoublonnées par session.
+
+    La première version d'une session l'emporte : les suivantes viennent d'un
+    rechargement de la page de retour (panier déjà vidé, items vides). Une
+    version sans articles est seulement remplacée par une version qui en a.
+    """
+    orders = {}
+    for path in paths:
+        for order, created_at in reporting.read_backups(path):
+            session_id = order.get("stripe_session_id")
+            if not session_id:
+                continue
+            kept = orders.get(session_id)
+            if kept is None or (not kept[0].get("items") and order.get("items")):
+                orders[session_id] = (order, created_at)
+    return list(orders.values())
+
+
+def push_to_supabase(client, orders):
+    """Insère par lots les commandes absentes de la table orders ; renvoie le nombre inséré"""
+    inserted = 0
+    for start in range(0, len(orders), BATCH_SIZE):
+        batch = [order for order, _created_at in orders[start:start + BATCH_SIZE]]
+        ids = [order["stripe_session_id"] for order in batch]
+        existing = client.table("orders").select("stripe_session_id").in_("stripe_session_id", ids).execute()
+        known = {row["stripe_session_id"] for row in existing.data or []}
+        missing = [order for order in batch if order["stripe_session_id"] not in known]
+        if missing:
+            client.table("orders").insert(missing).execute()
+            inserted += len(missing)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejeu des sauvegardes de commandes")
+    parser.add_argument("files", nargs="*", default=[reporting.ORDERS_BACKUP_FILE])
+    parser.add_argument("--to-supabase", action="store_true", help="insère les commandes manquantes dans Supabase")
+    parser.add_argument("--sync-supabase", action="store_true",
+                        help="ajoute aussi au cumul les commandes Supabase récentes (lecture incrémentale)")
+    parser.add_argument("--db", default=reporting.REPORTING_DB)
+    parser.add_argument("--dry-run", action="store_true", help="affiche les commandes retenues sans rien écrire")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(levelname)s %(name)s: %(message)s")
+    orders = load(args.files)
+    if args.dry_run:
+        for order, created_at in orders:
+            print(f"{order['stripe_session_id']}  {created_at}  {len(order.get('items') or [])} article(s)"
+                  f"  {order.get('total_amount')} €")
+        empty = sum(1 for order, _created_at in orders if not order.get("items"))
+        print(f"{len(orders)} commandes retenues, {empty} sans articles")
+        return 1 if empty else 0
+    added, skipped = reporting.ingest(orders, source="backup", db_path=args.db)
+    print(f"{len(orders)} commandes lues : {added} ajoutées au cumul, {skipped} déjà comptées")
+
+    if args.to_supabase or args.sync_supabase:
+        from supabase_client import get_supabase
+
+        client = get_supabase()
+        if args.to_supabase:
+            print(f"{push_to_supabase(client, orders)} commandes insérées dans Supabase")
+        if args.sync_supabase:
+            print(f"{reporting.sync_from_supabase(client, db_path=args.db)} commandes Supabase ajoutées au cumul")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""
+Lance un cycle de synchronisation incrémentale du catalogue (voir catalogue.py).
+
+Usage : python scripts/sync_catalogue.py [--category PATH ...] [--max-pages N] [--refresh-batch N]
+À planifier (cron) : seules les fiches nouvelles, modifiées ou anciennes sont relues.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalogue  # noqa: E402
+import crawl  # noqa: E402
+import upstream_limiter  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synchronisation incrémentale du catalogue")
+    parser.add_argument("--category", action="append", help="listing à relire (toutes les catégories par défaut)")
+    parser.add_argument("--max-pages", type=int, default=catalogue.CATALOGUE_MAX_PAGES)
+    parser.add_argument("--refresh-batch", type=int, default=catalogue.CATALOGUE_REFRESH_BATCH,
+                        help="fiches inchangées relues au plus (longue traîne)")
+    parser.add_argument("--parse-workers", type=int, default=crawl.CRAWL_PARSE_WORKERS,
+                        help="processus de parsing (0 = dans ce processus)")
+    parser.add_argument("--db", default=catalogue.CATALOGUE_DB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(levelname)s %(name)s: %(message)s")
+    # Part réservée aux crawls planifiés, en plus des workers web
+    upstream_limiter.configure_cron()
+    with crawl.CrawlPipeline(parse_workers=args.parse_workers) as pipeline:
+        stats = catalogue.sync(categories=args.category, max_pages=args.max_pages,
+                               refresh_batch=args.refresh_batch, db_path=args.db, pipeline=pipeline)
+    print(json.dumps(stats, indent=2))
+    # Code d'erreur pour cron : listing en échec, aucun listing lu ou toutes les fiches en échec
+    if stats["listing_errors"] or not stats["listing_pages"]:
+        return 1
+    return 0 if stats["detail_errors"] < max(1, stats["detail_fetches"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Cache des résultats de l'amont (destockenligne.com) avec service de la
+dernière valeur connue : si le rafraîchissement échoue ou dépasse le budget
+de latence, la valeur périmée est servie tout de suite et une nouvelle
+tentative part en arrière-plan.
+
+Variables d'environnement :
+  UPSTREAM_CACHE_TTL        fraîcheur des pages catalogue en secondes (300)
+  UPSTREAM_LATENCY_BUDGET   attente max, cumulée sur une requête, des rafraîchissements
+                            pour lesquels une valeur périmée existe (2.0)
+  UPSTREAM_STALE_MAX_AGE    âge max d'une valeur servie en secours (86400)
+  UPSTREAM_RETRY_MIN        délai avant la première nouvelle tentative (5)
+  UPSTREAM_RETRY_MAX        délai max entre deux tentatives (300)
+  UPSTREAM_WORKERS          threads de rafraîchissement par processus (8)
+  UPSTREAM_CACHE_MAX_ENTRIES  entrées max par cache (2000)
+"""
+import os
+import time
+import logging
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+
+import metrics
+import upstream_limiter
+
+log = logging.getLogger(__name__)
+
+UPSTREAM_CACHE_TTL = int(os.getenv("UPSTREAM_CACHE_TTL", "300"))
+UPSTREAM_LATENCY_BUDGET = float(os.getenv("UPSTREAM_LATENCY_BUDGET", "2.0"))
+UPSTREAM_STALE_MAX_AGE = int(os.getenv("UPSTREAM_STALE_MAX_AGE", "86400"))
+UPSTREAM_RETRY_MIN = float(os.getenv("UPSTREAM_RETRY_MIN", "5"))
+UPSTREAM_RETRY_MAX = float(os.getenv("UPSTREAM_RETRY_MAX", "300"))
+UPSTREAM_WORKERS = int(os.getenv("UPSTREAM_WORKERS", "8"))
+UPSTREAM_CACHE_MAX_ENTRIES = int(os.getenv("UPSTREAM_CACHE_MAX_ENTRIES", "2000"))
+
+_MISSING = object()
+
+# Fraîcheur des données de la requête en cours : "fresh", "stale" (valeur de
+# secours servie) ou "unavailable" (ni valeur fraîche ni valeur de secours)
+_freshness = contextvars.ContextVar("data_freshness", default="fresh")
+_RANK = {"fresh": 0, "stale": 1, "unavailable": 2}
+# Échéance (time.monotonic) du budget de latence de la requête en cours
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+_executor = None
+_executor_pid = None
+_executor_lock = Lock()
+_caches = []
+
+
+def _get_executor():
+    """Pool de rafraîchissement, recréé après un fork (les threads ne survivent pas)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix="upstream")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def begin_request():
+    """Remet à zéro l'indicateur de fraîcheur (les threads servent plusieurs requêtes)"""
+    _freshness.set("fresh")
+    _deadline.set(time.monotonic() + UPSTREAM_LATENCY_BUDGET)
+
+
+def registered_caches():
+    """Caches de l'amont du processus, par nom"""
+    return {cache.name: cache for cache in _caches}
+
+
+def data_freshness():
+    """Pire état des données utilisées par la requête en cours"""
+    return _freshness.get()
+
+
+def note_freshness(state):
+    """Reporte sur la requête la fraîcheur observée dans un thread auxiliaire"""
+    if _RANK[state] > _RANK[_freshness.get()]:
+        _freshness.set(state)
+
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "failures", "retry_at", "retrying")
+
+    def __init__(self):
+        self.value = _MISSING
+        self.fetched_at = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.retrying = False
+
+
+class StaleCache:
+    """Cache TTL qui garde la dernière valeur connue de chaque clé.
+
+    `loader()` doit lever une exception en cas d'échec (jamais renvoyer une
+    valeur vide à la place) pour que la valeur précédente soit conservée.
+    """
+
+    def __init__(self, name, ttl=UPSTREAM_CACHE_TTL, budget=UPSTREAM_LATENCY_BUDGET,
+                 max_entries=UPSTREAM_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.budget = budget
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = Lock()
+        # Incrémenté à chaque nouvelle valeur : les rendus dérivés du cache s'y indexent
+        self.generation = 0
+        _caches.append(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key, loader, default=None):
+        """Valeur fraîche, sinon rafraîchie dans le budget, sinon périmée, sinon default()"""
+        entry = self._entry(key)
+        now = time.time()
+        has_value = entry.value is not _MISSING
+        if has_value and now - entry.fetched_at < self.ttl:
+            metrics.cache_result(self.name, True)
+            return entry.value
+        metrics.cache_result(self.name, False)
+
+        # Amont en échec récent : on ne repaye pas un timeout à chaque requête
+        if now < entry.retry_at:
+            return self._fallback(entry, default)
+
+        future = self._refresh(key, entry, loader)
+        timeout = None
+        if has_value:
+            # Budget partagé par tous les rafraîchissements de la requête
+            deadline = _deadline.get()
+            timeout = self.budget if deadline is None else max(0.0, min(self.budget, deadline - time.monotonic()))
+        try:
+            # Sans valeur de secours on attend le chargement (borné par le timeout HTTP)
+            return future.result(timeout=timeout)
+        except Exception:
+            # Échec ou budget dépassé : le chargement continue et remplira le cache
+            return self._fallback(entry, default)
+
+    def put(self, key, value):
+        """Enregistre une valeur chargée ailleurs (crawl) comme si le loader l'avait renvoyée"""
+        self._store(self._entry(key), value)
+
+    def _store(self, entry, value):
+        if entry.value is _MISSING or entry.value != value:
+            self.generation += 1
+        entry.value = value
+        entry.fetched_at = time.time()
+        entry.failures = 0
+        entry.retry_at = 0.0
+
+    def wants(self, key):
+        """True si la clé n'a ni valeur fraîche, ni chargement en cours, ni échec récent"""
+        now = time.time()
+        with self._lock:
+            if key in self._inflight:
+                return False
+            entry = self._entries.get(key)
+        if entry is None:
+            return True
+        if entry.value is not _MISSING and now - entry.fetched_at < self.ttl:
+            return False
+        return now >= entry.retry_at
+
+    def _fallback(self, entry, default):
+        if entry.value is not _MISSING and time.time() - entry.fetched_at < UPSTREAM_STALE_MAX_AGE:
+            note_freshness("stale")
+            metrics.inc("upstream_stale_served_total", cache=self.name)
+            return entry.value
+        note_freshness("unavailable")
+        return default() if callable(default) else default
+
+    def _refresh(self, key, entry, loader):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                # Contexte de l'appelant transmis au chargement (priorité amont, ...)
+                future = self._inflight[key] = _get_executor().submit(
+                    contextvars.copy_context().run, self._load, key, entry, loader)
+            return future
+
+    def _load(self, key, entry, loader):
+        try:
+            value = loader()
+        except Exception as e:
+            entry.failures += 1
+            delay = min(UPSTREAM_RETRY_MAX, UPSTREAM_RETRY_MIN * 2 ** (entry.failures - 1))
+            entry.retry_at = time.time() + delay
+            log.warning("Rafraîchissement %s %s échoué (%s), nouvel essai dans %.0fs", self.name, key, e, delay)
+            metrics.inc("upstream_refresh_failures_total", cache=self.name)
+            if entry.value is not _MISSING and not entry.retrying:
+                entry.retrying = True
+                timer = Timer(delay, self._retry, (key, entry, loader))
+                timer.daemon = True
+                timer.start()
+            raise
+        else:
+            self._store(entry, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _retry(self, key, entry, loader):
+        """Nouvelle tentative en arrière-plan tant que l'entrée est en cache et périmée"""
+        entry.retrying = False
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return
+        if time.time() - entry.fetched_at >= self.ttl:
+            with upstream_limiter.background():
+                try:
+                    self._refresh(key, entry, loader)
+                except RuntimeError:
+                    # Pool arrêté : le processus se termine
+                    pass
+
+    def export(self):
+        """(clé, valeur, date de chargement) des entrées qui ont une valeur"""
+        with self._lock:
+            return [(key, entry.value, entry.fetched_at) for key, entry in self._entries.items()
+                    if entry.value is not _MISSING]
+
+    def restore(self, items):
+        """Recharge des entrées exportées avec leur date d'origine (périmées : servies puis rafraîchies)"""
+        now = time.time()
+        restored = 0
+        for key, value, fetched_at in items:
+            if now - fetched_at >= UPSTREAM_STALE_MAX_AGE:
+                continue
+            entry = self._entry(key)
+            if entry.value is _MISSING or entry.fetched_at < fetched_at:
+                entry.value = value
+                entry.fetched_at = fetched_at
+                restored += 1
+        if restored:
+            self.generation += 1
+        return restored
+
+    def stats(self):
+        """(entrées fraîches, entrées périmées)"""
+        now = time.time()
+        with self._lock:
+            ages = [now - e.fetched_at for e in self._entries.values() if e.value is not _MISSING]
+        fresh = sum(1 for age in ages if age < self.ttl)
+        return fresh, len(ages) - fresh
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+metrics.describe("upstream_stale_served_total", "Valeurs périmées servies faute de rafraîchissement à temps")
+metrics.describe("upstream_refresh_failures_total", "Rafraîchissements de l'amont en échec")
+metrics.describe("upstream_cache_entries", "Entrées des caches de l'amont")
+
+
+@metrics.register_collector
+def _collect():
+    samples = []
+    for cache in _caches:
+        fresh, stale = cache.stats()
+        samples.append(("upstream_cache_entries", "gauge", {"cache": cache.name, "state": "fresh"}, fresh))
+        samples.append(("upstream_cache_entries", "gauge", {"cache": cache.name, "state": "stale"}, stale))
+    return samples
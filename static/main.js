@@ -142,5 +142,93 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   });
 
+  // ===== PAGINATION DES CATÉGORIES VIA L'API =====
+  // Seule la grille est rechargée (/api/category) ; en cas d'échec, navigation classique.
+  const productGrid = document.getElementById('product-grid');
+  const pagingNav = document.getElementById('paging-nav');
+
+  function productCard(item) {
+    const col = document.createElement('div');
+    col.className = 'col-6 col-md-3 mb-3';
+    const card = document.createElement('div');
+    card.className = 'card h-100';
+    if (item.image) {
+      const img = document.createElement('img');
+      img.src = item.image;
+      img.className = 'card-img-top';
+      img.alt = item.name || '';
+      img.loading = 'lazy';
+      card.appendChild(img);
+    }
+    const body = document.createElement('div');
+    body.className = 'card-body';
+    const title = document.createElement('h6');
+    title.className = 'card-title';
+    title.textContent = item.name || '';
+    const price = document.createElement('p');
+    price.className = 'card-text small';
+    if (item.old_price) {
+      const old = document.createElement('s');
+      old.className = 'text-muted';
+      old.textContent = item.old_price + ' ';
+      price.appendChild(old);
+    }
+    const current = document.createElement('span');
+    current.className = 'fw-bold text-primary';
+    current.textContent = item.price || '';
+    price.appendChild(current);
+    const link = document.createElement('a');
+    link.className = 'btn btn-sm btn-primary';
+    link.href = '/product?path=' + encodeURIComponent(item.path);
+    link.textContent = 'Voir';
+    body.append(title, price, link);
+    card.appendChild(body);
+    col.appendChild(card);
+    return col;
+  }
+
+  function pagingLink(label, cursor, page) {
+    if (!cursor) return document.createElement('span');
+    const link = document.createElement('a');
+    link.className = 'btn btn-outline-secondary btn-sm';
+    link.dataset.cursor = cursor;
+    link.href = '/category?path=' + encodeURIComponent(productGrid.dataset.path) + '&page=' + page;
+    link.textContent = label;
+    return link;
+  }
+
+  function loadCategoryPage(link, push) {
+    const path = productGrid.dataset.path;
+    const url = '/api/category?limit=120&path=' + encodeURIComponent(path) + '&cursor=' + encodeURIComponent(link.dataset.cursor);
+    return fetch(url, {headers: {'Accept': 'application/json'}})
+      .then(r => { if (!r.ok) throw new Error(r.status); return r.json(); })
+      .then(data => {
+        productGrid.replaceChildren(...data.items.map(productCard));
+        const label = document.createElement('span');
+        label.className = 'paging';
+        label.id = 'paging-label';
+        label.textContent = 'Page ' + data.page.current + ' / ' + data.page.total;
+        pagingNav.replaceChildren(
+          pagingLink('\u00ab Précédent', data.prev_cursor, data.page.current - 1),
+          label,
+          pagingLink('Suivant \u00bb', data.next_cursor, data.page.current + 1)
+        );
+        if (push) history.pushState({cursor: link.dataset.cursor}, '', link.href);
+        productGrid.scrollIntoView({behavior: 'smooth', block: 'start'});
+      });
+  }
+
+  if (productGrid && pagingNav && window.fetch) {
+    pagingNav.addEventListener('click', function(e) {
+      const link = e.target.closest('a[data-cursor]');
+      if (!link) return;
+      e.preventDefault();
+      loadCategoryPage(link, true).catch(() => { window.location.href = link.href; });
+    });
+    window.addEventListener('popstate', function() {
+      window.location.reload();
+    });
+  }
+
   console.log('Sidebar sections system initialized');
 });
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Appels à l'API Stripe depuis les requêtes (création et lecture des sessions
+de paiement) : délais bornés, connexions HTTP réutilisées, disjoncteur et
+cache court des sessions relues.
+
+Si Stripe ralentit ou tombe, quelques appels échouent au délai configuré
+puis le disjoncteur s'ouvre : les appels suivants échouent tout de suite
+(StripeUnavailable) au lieu d'occuper les workers, jusqu'à un appel d'essai
+réussi après STRIPE_BREAKER_RESET secondes. Le SDK est importé au premier
+appel (lourd).
+
+Variables d'environnement :
+  STRIPE_SECRET_KEY          clé secrète
+  STRIPE_API_BASE            API Stripe de remplacement (serveur factice des tests)
+  STRIPE_CONNECT_TIMEOUT     délai de connexion en secondes (3)
+  STRIPE_READ_TIMEOUT        délai de réponse en secondes (10)
+  STRIPE_MAX_RETRIES         nouvelles tentatives du SDK, avec clé d'idempotence (1)
+  STRIPE_BREAKER_FAILURES    échecs consécutifs qui ouvrent le disjoncteur (5)
+  STRIPE_BREAKER_RESET       secondes avant un appel d'essai (30)
+  STRIPE_SESSION_CACHE_TTL   durée de vie des sessions relues en cache (60)
+"""
+import os
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "10"))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "1"))
+STRIPE_BREAKER_FAILURES = int(os.getenv("STRIPE_BREAKER_FAILURES", "5"))
+STRIPE_BREAKER_RESET = float(os.getenv("STRIPE_BREAKER_RESET", "30"))
+STRIPE_SESSION_CACHE_TTL = float(os.getenv("STRIPE_SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_MAX_ENTRIES = 1024
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class StripeUnavailable(RuntimeError):
+    """Stripe en panne ou disjoncteur ouvert : l'appel n'a pas été tenté"""
+
+
+class CircuitBreaker:
+    """Disjoncteur : ouvert après `failures` échecs consécutifs, un appel d'essai après `reset_timeout`"""
+
+    def __init__(self, name, failures=STRIPE_BREAKER_FAILURES, reset_timeout=STRIPE_BREAKER_RESET):
+        self.name = name
+        self.max_failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = Lock()
+
+    def allow(self):
+        """True si l'appel peut partir (en demi-ouverture, un seul appel d'essai à la fois)"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                log.info("Disjoncteur %s refermé", self.name)
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.max_failures:
+                if self.state != OPEN:
+                    log.warning("Disjoncteur %s ouvert après %d échec(s)", self.name, self.failures)
+                    metrics.inc("circuit_breaker_open_total", breaker=self.name)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker("stripe")
+_stripe = None
+_stripe_lock = Lock()
+_sessions = OrderedDict()
+_sessions_lock = Lock()
+
+
+def get_stripe():
+    """SDK Stripe configuré : clé, délais et client HTTP persistant (sessions keep-alive par thread)"""
+    global _stripe
+    with _stripe_lock:
+        if _stripe is None:
+            import stripe
+
+            stripe.api_key = STRIPE_SECRET_KEY
+            if STRIPE_API_BASE:
+                stripe.api_base = STRIPE_API_BASE
+            stripe.max_network_retries = STRIPE_MAX_RETRIES
+            stripe.default_http_client = stripe.RequestsClient(timeout=(STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT))
+            _stripe = stripe
+        return _stripe
+
+
+def _is_outage(error):
+    """Erreur imputable à Stripe (réseau, délai, 429, 5xx) et non à la requête"""
+    stripe = get_stripe()
+    if not isinstance(error, stripe.error.StripeError):
+        return False
+    status = getattr(error, "http_status", None)
+    return status is None or status == 429 or status >= 500
+
+
+def _call(operation, fn, *args, **kwargs):
+    if not breaker.allow():
+        metrics.inc("stripe_rejected_total", operation=operation)
+        raise StripeUnavailable(f"disjoncteur Stripe ouvert ({operation})")
+    try:
+        with metrics.track("stripe", operation):
+            result = fn(*args, **kwargs)
+    except Exception as e:
+        if _is_outage(e):
+            breaker.record_failure()
+            raise StripeUnavailable(f"Stripe indisponible ({operation}): {e}") from e
+        # Erreur de la requête (paramètres, session inconnue) : Stripe répond normalement
+        breaker.record_success()
+        raise
+    breaker.record_success()
+    return result
+
+
+# ----------------- SESSIONS DE PAIEMENT -----------------
+def create_checkout_session(**params):
+    """Crée une session Checkout (StripeUnavailable si Stripe ne répond pas)"""
+    stripe = get_stripe()
+    return _call("checkout.create", stripe.checkout.Session.create, **params)
+
+
+def retrieve_checkout_session(session_id):
+    """Session Checkout, depuis le cache si elle a été relue il y a moins de STRIPE_SESSION_CACHE_TTL"""
+    now = time.monotonic()
+    with _sessions_lock:
+        cached = _sessions.get(session_id)
+        if cached is not None and cached[0] > now:
+            metrics.cache_result("stripe_session", True)
+            return cached[1]
+    metrics.cache_result("stripe_session", False)
+    stripe = get_stripe()
+    checkout = _call("checkout.retrieve", stripe.checkout.Session.retrieve, session_id)
+    with _sessions_lock:
+        _sessions[session_id] = (now + STRIPE_SESSION_CACHE_TTL, checkout)
+        _sessions.move_to_end(session_id)
+        while len(_sessions) > SESSION_CACHE_MAX_ENTRIES:
+            _sessions.popitem(last=False)
+    return checkout
+
+
+def construct_event(payload, sig_header, secret):
+    """Événement de webhook vérifié (aucun appel réseau)"""
+    return get_stripe().Webhook.construct_event(payload, sig_header, secret)
+
+
+metrics.describe("circuit_breaker_open_total", "Ouvertures de disjoncteur")
+metrics.describe("stripe_rejected_total", "Appels Stripe refusés sans tentative (disjoncteur ouvert)")
+
+
+@metrics.register_collector
+def _collect():
+    return [("circuit_breaker_state", "gauge", {"breaker": breaker.name, "state": state},
+             1 if breaker.state == state else 0) for state in (CLOSED, OPEN, HALF_OPEN)]
@@ -1,44 +1,176 @@
 import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import logging
+import importlib.util
+from collections import OrderedDict
+from threading import Lock
 
-load_dotenv()
+import metrics
 
+log = logging.getLogger(__name__)
+
+# Les SDK (supabase, postgrest, httpx) sont importés au premier usage :
+# ils pèsent plusieurs centaines de ms au démarrage.
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-# Utiliser la clé anon comme client principal
-supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# -------------------- POOL HTTP --------------------
+HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_KEEPALIVE", "10"))
+HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "10"))
+USER_CLIENT_CACHE_SIZE = int(os.getenv("SUPABASE_USER_CLIENTS", "256"))
+
+
+class ClientPool:
+    """Transport HTTP partagé (keep-alive, HTTP/2 si h2 est installé).
+
+    Tous les clients Supabase réutilisent le même httpx.Client ; un client
+    utilisateur ne diffère que par son header Authorization, qui est envoyé
+    requête par requête et ne modifie jamais le transport partagé.
+    """
+
+    def __init__(self, url, key):
+        import httpx
+
+        self.url = url
+        self.key = key
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self.stats = {"requests": 0, "user_clients_created": 0, "user_client_hits": 0}
+        self.http = httpx.Client(
+            http2=self.http2,
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_KEEPALIVE),
+            event_hooks={"request": [self._count_request]},
+        )
+        self._user_clients = OrderedDict()
+        self._lock = Lock()
+        # Le hook tourne dans les threads des requêtes : += n'est pas atomique
+        self._stats_lock = Lock()
+
+    def _count_request(self, request):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+
+    def base_client(self):
+        """Client principal (clé anon) branché sur le transport partagé"""
+        from supabase import create_client, ClientOptions
+
+        return create_client(self.url, self.key, options=ClientOptions(httpx_client=self.http))
+
+    def user_client(self, access_token):
+        """Client Supabase authentifié, réutilisé tant que le token est le même"""
+        with self._lock:
+            client = self._user_clients.get(access_token)
+            if client is not None:
+                self._user_clients.move_to_end(access_token)
+                self.stats["user_client_hits"] += 1
+                return client
+            from supabase import create_client, ClientOptions
+
+            # Ni session persistée ni rafraîchissement : le token vient de la session Flask
+            client = create_client(self.url, self.key, options=ClientOptions(
+                httpx_client=self.http, headers={"Authorization": f"Bearer {access_token}"},
+                auto_refresh_token=False, persist_session=False))
+            self._user_clients[access_token] = client
+            if len(self._user_clients) > USER_CLIENT_CACHE_SIZE:
+                self._user_clients.popitem(last=False)
+            self.stats["user_clients_created"] += 1
+            return client
+
+    def metrics(self):
+        """Statistiques du pool (compteurs + connexions ouvertes)"""
+        with self._stats_lock:
+            out = dict(self.stats, http2=self.http2, user_clients_cached=len(self._user_clients))
+        try:
+            # httpcore n'expose pas d'API publique pour l'état du pool
+            connections = self.http._transport._pool.connections
+            out["connections_open"] = len(connections)
+            out["connections_idle"] = sum(1 for c in connections if c.is_idle())
+        except AttributeError:
+            pass
+        return out
+
+
+_pool = None
+_supabase = None
+_init_lock = Lock()
+
+
+def get_pool():
+    """Pool HTTP partagé, créé au premier appel"""
+    global _pool
+    if _pool is None:
+        with _init_lock:
+            if _pool is None:
+                _pool = ClientPool(SUPABASE_URL, SUPABASE_ANON_KEY)
+    return _pool
+
+
+def get_supabase():
+    """Client principal (clé anon), créé au premier appel"""
+    global _supabase
+    if _supabase is None:
+        pool = get_pool()
+        with _init_lock:
+            if _supabase is None:
+                _supabase = pool.base_client()
+    return _supabase
+
+
+@metrics.register_collector
+def _collect_pool_metrics():
+    """Métriques du pool pour /metrics (seulement s'il a déjà été créé)"""
+    if _pool is None:
+        return []
+    out = []
+    for name, value in _pool.metrics().items():
+        if isinstance(value, bool):
+            value = int(value)
+        kind = "counter" if name in ("requests", "user_clients_created", "user_client_hits") else "gauge"
+        suffix = "_total" if kind == "counter" else ""
+        out.append((f"supabase_pool_{name}{suffix}", kind, {}, value))
+    return out
+
+
+def __getattr__(name):
+    """Compatibilité : `supabase_client.supabase` / `.pool` restent accessibles"""
+    if name == "supabase":
+        return get_supabase()
+    if name == "pool":
+        return get_pool()
+    raise AttributeError(name)
 
 # -------------------- AUTH --------------------
 def register_user(email, password):
     """Crée un compte utilisateur"""
-    return supabase.auth.sign_up({"email": email, "password": password})
+    return get_supabase().auth.sign_up({"email": email, "password": password})
 
 def login_user(email, password):
     """Connecte un utilisateur"""
-    return supabase.auth.sign_in_with_password({"email": email, "password": password})
+    return get_supabase().auth.sign_in_with_password({"email": email, "password": password})
 
 def get_user_client(access_token):
-    """Crée un client Supabase authentifié avec le token utilisateur"""
+    """Client Supabase authentifié avec le token utilisateur (transport partagé)"""
     try:
-        # Créer un nouveau client avec le token utilisateur
-        client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-        # Définir le header d'autorisation avec le token
-        client.postgrest.auth(access_token)
-        return client
+        return get_pool().user_client(access_token)
     except Exception as e:
-        print(f"Error creating user client: {e}")
-        return supabase
+        log.error("Erreur client utilisateur Supabase: %s", e)
+        return get_supabase()
+
+def get_pool_metrics():
+    """Expose les métriques du pool de connexions Supabase"""
+    return get_pool().metrics()
 
 def verify_token(access_token):
     """Vérifie si le token est valide et retourne l'user_id"""
     try:
-        user = supabase.auth.get_user(access_token)
+        with metrics.track("supabase_auth", "get_user"):
+            user = get_supabase().auth.get_user(access_token)
         return user.user.id if user and user.user else None
     except Exception as e:
-        print(f"Token verification error: {e}")
+        log.info("Token refusé: %s", e)
         return None
 
 # -------------------- CARTS / ORDERS --------------------
@@ -52,13 +184,13 @@ def add_to_cart(user_id, product_name, path, product_image, price, qty=1, size=N
             "qty": qty,
             "size": size
         }
-        return supabase.table("carts").insert(cart_item).execute()
+        return get_supabase().table("carts").insert(cart_item).execute()
 
 def create_order(payload):
-    return supabase.table("orders").insert(payload).execute()
+    return get_supabase().table("orders").insert(payload).execute()
 
 def add_order_items(items):
-    return supabase.table("order_items").insert(items).execute()
+    return get_supabase().table("order_items").insert(items).execute()
 
 # -------------------- IMAGES --------------------
 def upload_image(file, filename):
@@ -67,9 +199,9 @@ def upload_image(file, filename):
     Note: Pour uploader des images, vous aurez besoin de configurer les politiques de stockage
     """
     try:
-        supabase.storage.from_("product-images").upload(filename, file.stream, {"content-type": file.mimetype})
+        get_supabase().storage.from_("product-images").upload(filename, file.stream, {"content-type": file.mimetype})
         public_url = f"{SUPABASE_URL}/storage/v1/object/public/product-images/{filename}"
         return public_url
     except Exception as e:
-        print("Erreur upload image:", e)
+        log.error("Erreur upload image: %s", e)
         return None
\ No newline at end of file
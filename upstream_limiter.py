@@ -0,0 +1,276 @@
+"""
+Limiteur de débit vers destockenligne.com (pages et images).
+
+Seau à jetons partagé par les requêtes d'un processus, avec deux priorités :
+les requêtes interactives (un visiteur attend) passent avant les tâches de
+fond (préchauffage, crawl, prefetch), qui disposent en plus d'un budget
+propre plafonné. Le débit s'adapte (AIMD) : divisé par deux sur une réponse
+429 / 5xx ou un timeout (pause respectant Retry-After), puis relevé
+progressivement tant que l'amont répond normalement.
+
+Variables d'environnement :
+  UPSTREAM_RATE              requêtes/s vers l'amont, tous processus confondus (8)
+  UPSTREAM_CRON_SHARE        part de UPSTREAM_RATE réservée à un script de crawl planifié
+                             (sync_catalogue, cache_snapshot export) ; le reste est réparti
+                             entre les workers gunicorn (0.25)
+  UPSTREAM_BURST             rafale max d'un processus (10)
+  UPSTREAM_MIN_RATE          plancher du débit adaptatif, par processus (0.2)
+  UPSTREAM_BACKGROUND_SHARE  part max du débit pour les tâches de fond (0.5)
+  UPSTREAM_INTERACTIVE_WAIT  attente max d'un jeton pour une requête interactive (3)
+  UPSTREAM_BACKGROUND_WAIT   attente max d'un jeton pour une tâche de fond (60)
+  GUNICORN_MAX_WORKERS       plafond du nombre de workers par défaut, sans WEB_CONCURRENCY (9)
+"""
+import os
+import math
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from threading import Condition
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+UPSTREAM_TOTAL_RATE = float(os.getenv("UPSTREAM_RATE", "8"))
+UPSTREAM_CRON_SHARE = min(1.0, max(0.0, float(os.getenv("UPSTREAM_CRON_SHARE", "0.25"))))
+UPSTREAM_BURST = float(os.getenv("UPSTREAM_BURST", "10"))
+UPSTREAM_MIN_RATE = float(os.getenv("UPSTREAM_MIN_RATE", "0.2"))
+UPSTREAM_BACKGROUND_SHARE = float(os.getenv("UPSTREAM_BACKGROUND_SHARE", "0.5"))
+UPSTREAM_INTERACTIVE_WAIT = float(os.getenv("UPSTREAM_INTERACTIVE_WAIT", "3"))
+UPSTREAM_BACKGROUND_WAIT = float(os.getenv("UPSTREAM_BACKGROUND_WAIT", "60"))
+GUNICORN_MAX_WORKERS = int(os.getenv("GUNICORN_MAX_WORKERS", "9"))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Hausse additive : une réponse normale rend 1/RECOVERY_RESPONSES du débit nominal
+RECOVERY_RESPONSES = 50
+MAX_PAUSE = 120.0
+THROTTLE_STATUSES = {429, 502, 503, 504}
+
+_priority = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+def available_cpus():
+    """CPU réellement attribués au processus : affinité et quota cgroup (conteneur), pas ceux de l'hôte"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2 : "max 100000" ou "<quota> <période>"
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            limit, period = fh.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1 : quota -1 = illimité
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as fh:
+                limit = int(fh.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as fh:
+                period = int(fh.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def default_workers():
+    """Nombre de workers gunicorn : WEB_CONCURRENCY, sinon 2 x CPU + 1 plafonné (gunicorn.conf.py)"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+    return max(1, min(GUNICORN_MAX_WORKERS, available_cpus() * 2 + 1))
+
+
+def web_rate(workers):
+    """Débit d'un worker web : la part non réservée aux crawls, divisée entre les workers"""
+    return UPSTREAM_TOTAL_RATE * (1 - UPSTREAM_CRON_SHARE) / max(1, workers)
+
+
+UPSTREAM_RATE = web_rate(default_workers())
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def background():
+    """Les requêtes amont du bloc passent après celles des visiteurs"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter:
+    """Seau à jetons à deux priorités et débit adaptatif"""
+
+    def __init__(self, rate=UPSTREAM_RATE, burst=UPSTREAM_BURST, min_rate=UPSTREAM_MIN_RATE,
+                 background_share=UPSTREAM_BACKGROUND_SHARE):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.background_share = background_share
+        self._tokens = self.burst
+        self._background_tokens = max(1.0, self.burst * background_share)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._cond = Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        background_burst = max(1.0, self.burst * self.background_share)
+        self._background_tokens = min(background_burst,
+                                      self._background_tokens + elapsed * self.rate * self.background_share)
+
+    def _can_take(self, priority, now):
+        if now < self._paused_until or self._tokens < 1:
+            return False
+        if priority == INTERACTIVE:
+            return True
+        # Fond : seulement si aucun visiteur n'attend, et dans son propre budget
+        return not self._waiting[INTERACTIVE] and self._background_tokens >= 1
+
+    def _background_delay(self):
+        """Attente d'une tâche de fond : recharge de son budget, passage des visiteurs en attente"""
+        if self._background_tokens < 1:
+            refill = self.rate * self.background_share
+            return (1 - self._background_tokens) / refill if refill > 0 else float("inf")
+        # Budget disponible mais un visiteur attend : il prendra le prochain jeton
+        return 1 / self.rate if self._waiting[INTERACTIVE] else 0.0
+
+    def acquire(self, priority=None, timeout=None):
+        """Attend un jeton ; False si le délai est dépassé (la requête ne doit pas partir)"""
+        priority = priority or _priority.get()
+        if timeout is None:
+            timeout = UPSTREAM_INTERACTIVE_WAIT if priority == INTERACTIVE else UPSTREAM_BACKGROUND_WAIT
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._can_take(priority, now):
+                        self._tokens -= 1
+                        if priority == BACKGROUND:
+                            self._background_tokens -= 1
+                        break
+                    if now >= deadline:
+                        metrics.inc("upstream_throttled_total", priority=priority)
+                        return False
+                    # Prochain jeton (ou fin de pause) ; réveil anticipé possible par notify
+                    delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                    if priority == BACKGROUND:
+                        delay = max(delay, self._background_delay())
+                    self._cond.wait(min(max(delay, 0.005), deadline - now))
+            finally:
+                self._waiting[priority] -= 1
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            metrics.observe("upstream_limiter_wait_seconds", waited, priority=priority)
+        return True
+
+    def record_response(self, status, retry_after=None):
+        """Ajuste le débit selon la réponse de l'amont"""
+        if status in THROTTLE_STATUSES or status >= 500:
+            self._slow_down(f"HTTP {status}", _retry_after_seconds(retry_after))
+            return
+        with self._cond:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / RECOVERY_RESPONSES)
+
+    def record_failure(self):
+        """Timeout : l'amont sature, même réaction qu'un 503 (sans pause)"""
+        self._slow_down("timeout", None)
+
+    def _slow_down(self, reason, pause):
+        with self._cond:
+            previous = self.rate
+            self.rate = max(self.min_rate, self.rate / 2)
+            now = time.monotonic()
+            if pause:
+                self._paused_until = max(self._paused_until, now + min(pause, MAX_PAUSE))
+            # La rafale déjà accumulée ne doit pas partir vers un amont qui sature
+            self._tokens = min(self._tokens, 1.0)
+            self._cond.notify_all()
+        metrics.inc("upstream_backoff_total", reason=reason)
+        log.warning("Amont en difficulté (%s) : débit %.2f -> %.2f req/s%s", reason, previous, self.rate,
+                    f", pause {pause:.0f}s" if pause else "")
+
+    def set_rate(self, rate):
+        """Change le débit nominal (part du processus connue après le démarrage)"""
+        with self._cond:
+            self.max_rate = rate
+            self.min_rate = min(UPSTREAM_MIN_RATE, rate)
+            self.rate = rate
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            return {"rate": self.rate, "max_rate": self.max_rate, "tokens": self._tokens,
+                    "waiting_interactive": self._waiting[INTERACTIVE],
+                    "waiting_background": self._waiting[BACKGROUND]}
+
+
+def _retry_after_seconds(value):
+    """Retry-After en secondes (les dates HTTP sont ignorées)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+limiter = RateLimiter()
+
+
+def configure_web_worker(workers):
+    """Worker gunicorn : sa part du débit web selon le nombre réel de workers"""
+    limiter.set_rate(web_rate(workers))
+
+
+def configure_cron():
+    """Script de crawl planifié : la part UPSTREAM_CRON_SHARE, en plus des workers web"""
+    limiter.set_rate(max(UPSTREAM_MIN_RATE, UPSTREAM_TOTAL_RATE * UPSTREAM_CRON_SHARE))
+
+
+def acquire(priority=None, timeout=None):
+    return limiter.acquire(priority, timeout)
+
+
+def record_response(status, retry_after=None):
+    limiter.record_response(status, retry_after)
+
+
+def record_failure():
+    limiter.record_failure()
+
+
+metrics.describe("upstream_throttled_total", "Requêtes amont abandonnées faute de jeton à temps")
+metrics.describe("upstream_backoff_total", "Réductions du débit amont (429 / 5xx / timeouts)")
+metrics.describe("upstream_limiter_wait_seconds", "Attente d'un jeton avant une requête amont")
+metrics.describe("upstream_rate_limit", "Débit amont autorisé (req/s, par processus)")
+
+
+@metrics.register_collector
+def _collect():
+    stats = limiter.stats()
+    return [
+        ("upstream_rate_limit", "gauge", {}, round(stats["rate"], 3)),
+        ("upstream_limiter_waiting", "gauge", {"priority": INTERACTIVE}, stats["waiting_interactive"]),
+        ("upstream_limiter_waiting", "gauge", {"priority": BACKGROUND}, stats["waiting_background"]),
+    ]